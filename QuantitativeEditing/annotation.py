@@ -0,0 +1,187 @@
+"""Fast scene number annotation for videos.
+
+The scene counter used to be built as a CompositeVideoClip of the source video
+and a long concatenation of TextClips, which has moviepy find the active
+subclip, build masks and blend the whole frame in floating point for every
+frame. This module instead renders each digit once, keeps it as a premultiplied
+uint8/uint16 patch, looks up the active scene with a binary search and blends
+the label into only the region it covers, in place.
+"""
+
+import numpy as np
+
+from moviepy.editor import *
+
+
+class SceneAnnotator(object):
+    """Draws the scene number of a timestamp onto video frames.
+    
+    Labels are built out of cached digit glyphs. FreeMono is monospaced, so
+    every digit patch has the same size and a label like "042" is simply three
+    glyphs side by side. Blending uses integer weights out of 256:
+      
+      out = (frame * (256 - alpha) + color * alpha) >> 8
+    
+    where color * alpha is precomputed once per glyph.
+    """
+    
+    def __init__(self, scene_list, video_fps, fontsize=288, opacity=0.6,
+                 font='FreeMono-Bold', color='white', stroke_color='black',
+                 stroke_width=5, label_format='%03d', pts_index=None):
+        
+        # Start times of each scene in seconds, used for the binary search.
+        # Shifted back half a frame so rounding in the frame timestamps can't
+        # put the first frame of a scene in the previous one. The frame
+        # timestamps of a pts_index.PTSIndex are exact for variable frame
+        # rates too.
+        if pts_index is not None:
+            self.scene_starts = pts_index.boundary_time(scene_list)
+        else:
+            self.scene_starts = ((np.asarray(scene_list, dtype=float) - 0.5) /
+                                 float(video_fps))
+        self.label_format = label_format
+        
+        # Render the digits once and turn them into blending patches
+        self.premultiplied = {}
+        self.inverse_alpha = {}
+        for digit in '0123456789':
+            glyph = TextClip(digit, fontsize=fontsize, color=color, font=font,
+                             stroke_color=stroke_color,
+                             stroke_width=stroke_width)
+            rgb = glyph.get_frame(0).astype(np.uint16)
+            alpha = np.round(glyph.mask.get_frame(0) * opacity * 256)
+            alpha = alpha.astype(np.uint16)[:, :, np.newaxis]
+            
+            self.premultiplied[digit] = rgb * alpha
+            self.inverse_alpha[digit] = 256 - alpha
+        
+        self.glyph_h, self.glyph_w = self.premultiplied['0'].shape[:2]
+        
+        # Scratch buffer reused for every blend, sized for one glyph
+        self._buffer = np.empty((self.glyph_h, self.glyph_w, 3), dtype=np.uint16)
+        
+        # Remember the last label so it isn't reformatted every frame
+        self._last_idx = None
+        self._last_label = ''
+        
+        # moviepy's reader hands back the same array when a frame is requested
+        # twice, so keep track of it to avoid drawing the label over itself
+        self._last_frame = None
+    
+    def scene_index(self, t):
+        """Returns the number of the scene playing at time t (in seconds)."""
+        
+        return int(np.searchsorted(self.scene_starts, t, side='right'))
+    
+    def label(self, t):
+        """Returns the label text for time t."""
+        
+        scene_idx = self.scene_index(t)
+        
+        if scene_idx != self._last_idx:
+            self._last_idx = scene_idx
+            self._last_label = self.label_format % scene_idx
+        
+        return self._last_label
+    
+    def _blit(self, frame, digit, x, y):
+        """Blends a single digit glyph into frame with its top left at (x, y)."""
+        
+        frame_h, frame_w = frame.shape[:2]
+        
+        # Clip the glyph to the frame for videos smaller than the text
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + self.glyph_w, frame_w), min(y + self.glyph_h, frame_h)
+        if x0 >= x1 or y0 >= y1:
+            return
+        
+        gx0, gy0 = x0 - x, y0 - y
+        gx1, gy1 = gx0 + (x1 - x0), gy0 + (y1 - y0)
+        
+        region = frame[y0:y1, x0:x1]
+        buf = self._buffer[gy0:gy1, gx0:gx1]
+        
+        np.multiply(region, self.inverse_alpha[digit][gy0:gy1, gx0:gx1],
+                    out=buf)
+        buf += self.premultiplied[digit][gy0:gy1, gx0:gx1]
+        np.right_shift(buf, 8, out=buf)
+        region[...] = buf
+    
+    def annotate_frame(self, frame, t):
+        """Draws the label for time t centered on frame, modifying it in place."""
+        
+        # Already drawn on this exact array
+        if frame is self._last_frame:
+            return frame
+        
+        # Frames straight from a reader may be read-only
+        if not frame.flags.writeable:
+            frame = frame.copy()
+        self._last_frame = frame
+        
+        text = self.label(t)
+        frame_h, frame_w = frame.shape[:2]
+        
+        x = (frame_w - len(text) * self.glyph_w) // 2
+        y = (frame_h - self.glyph_h) // 2
+        
+        for digit in text:
+            self._blit(frame, digit, x, y)
+            x += self.glyph_w
+        
+        return frame
+
+
+def annotate_video(video_clip, scene_list, video_fps, **kwargs):
+    """
+    Overlays the current scene number on a video.
+    
+    Parameters
+    -----------
+    
+    video_clip
+      moviepy clip of the video to annotate
+    
+    scene_list
+      list of frame numbers at which each scene starts, as returned by
+      detect_scenes.analyze_video
+    
+    video_fps
+      frames per second the scene_list frame numbers refer to
+    
+    kwargs
+      passed on to SceneAnnotator to control the look of the labels
+    
+    Returns
+    --------
+    
+    annotated_clip
+      moviepy clip with the scene numbers drawn on each frame. The audio of
+      video_clip is kept.
+    """
+    
+    annotator = SceneAnnotator(scene_list, video_fps, **kwargs)
+    
+    return video_clip.fl(lambda gf, t: annotator.annotate_frame(gf(t), t),
+                         apply_to=[])
+
+
+if __name__ == '__main__':
+
+    import detect_scenes as ds
+    
+    # Specify video file and constants here
+    video_file = 'BTS_2017_DNA.mkv'
+    threshold = 21
+    min_scene_len = 15
+    
+    # Detect the scenes
+    video_fps, frames_read, _, scene_list = ds.analyze_video(
+        video_file, threshold=threshold, min_scene_len=min_scene_len)
+    
+    # Annotate the video and save it
+    annotated_video = annotate_video(VideoFileClip(video_file), scene_list,
+                                     video_fps)
+    annotated_video.write_videofile('BTS_2017_DNA_Annotated_' + str(threshold) +
+                                    '_' + str(min_scene_len) + '.mp4',
+                                    fps=video_fps, preset='medium')
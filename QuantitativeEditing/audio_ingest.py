@@ -0,0 +1,110 @@
+"""Decodes the audio track of a video straight into numpy.
+
+The audio is piped out of ffmpeg as raw float32 samples at the analysis sample
+rate, so there is no lossy mp3 round trip and no shared temporary file. The
+decoded samples are cached as a .npy file keyed by the hash of the source file
+and loaded back memory-mapped, so every stage that needs the audio (like the
+waveform animation) reads the samples without touching the codec again.
+"""
+
+import os
+import subprocess as sp
+import numpy as np
+import cache_utils as cu
+import ffmpeg_utils as fu
+
+
+def decode_audio(video_file, sr=22050, channels=2):
+    """
+    Decodes the audio of a file through an ffmpeg pipe.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of a video or audio file
+    
+    sr
+      sample rate to resample the audio to
+    
+    channels
+      number of channels to mix the audio to
+    
+    Returns
+    --------
+    
+    y
+      float32 numpy array of shape (channels, samples), or (samples,) if
+      channels is 1, the same layout librosa.load uses
+    """
+    
+    cmd = [fu.ffmpeg_binary(), '-loglevel', 'error', '-i', video_file,
+           '-vn', '-f', 'f32le', '-acodec', 'pcm_f32le',
+           '-ac', str(channels), '-ar', str(sr), '-']
+    
+    proc = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.PIPE)
+    out, err = proc.communicate()
+    
+    if proc.returncode != 0:
+        raise IOError('ffmpeg error while decoding audio of %s:\n\n%s' %
+                      (video_file, err.decode('utf8', 'replace')))
+    
+    # Samples come interleaved, split them into one row per channel
+    y = np.frombuffer(out, dtype=np.float32)
+    
+    if channels == 1:
+        return y.copy()
+    
+    return np.ascontiguousarray(y.reshape(-1, channels).T)
+
+
+def load_audio(video_file, sr=22050, mono=False, cache_dir='audio_cache'):
+    """
+    Loads the audio of a file, decoding it only the first time.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of a video or audio file
+    
+    sr
+      sample rate to load the audio at
+    
+    mono
+      if True the audio is mixed down to one channel, otherwise it is loaded as
+      stereo
+    
+    cache_dir
+      folder to cache the decoded audio in. If None, nothing is cached.
+    
+    Returns
+    --------
+    
+    y
+      read-only memory-mapped float32 array of shape (2, samples), or
+      (samples,) if mono
+    
+    sr
+      sample rate of y
+    """
+    
+    channels = 1 if mono else 2
+    
+    if cache_dir is None:
+        return decode_audio(video_file, sr=sr, channels=channels), sr
+    
+    key = '%s_%d_%d' % (cu.file_hash(video_file), sr, channels)
+    cache_file = cu.cache_path(cache_dir, key, '.npy')
+    
+    if not os.path.isfile(cache_file):
+        
+        # Save under a temporary name first so a crash can't leave a partial
+        # file that looks like a finished cache entry
+        y = decode_audio(video_file, sr=sr, channels=channels)
+        temp_file = cache_file + '.%d.tmp' % os.getpid()
+        with open(temp_file, 'wb') as f:
+            np.save(f, y)
+        os.replace(temp_file, cache_file)
+    
+    return np.load(cache_file, mmap_mode='r'), sr
@@ -1,20 +1,21 @@
-import librosa
 import matplotlib.pyplot as plt
 import numpy as np
+import audio_ingest as ai
+import ffmpeg_utils as fu
 
 from moviepy.editor import *
 from librosa.display import waveplot
 from moviepy.video.io.bindings import mplfig_to_npimage
 
 
-last_t = 0
-tempgraph = []
-
-
-def animate_audio(video, audio, output):
+def animate_audio(video, audio, output, fps=None, scale=1.0, preset='medium',
+                  threads=None):
     """
-    Renders a waveform of a video's audio and progresses it every 0.5s as the
-    video plays.
+    Renders a waveform of a video's audio and progresses it as the video plays.
+    
+    The audio is only decoded once. Two images of the full waveform are drawn
+    up front, one in the unplayed color and one in the played color, and each
+    frame of the animation is stitched together from their columns.
     
     Parameters
     -----------
@@ -23,11 +24,20 @@ def animate_audio(video, audio, output):
       filepath to a video that has audio
     
     audio
-      filepath to save the extracted audio from video as an .mp3
+      folder to cache the decoded audio in, see audio_ingest.load_audio
     
     output
       filepath to save the animated audio to as a .mp4
     
+    fps
+      frame rate of the animation, the video's frame rate if None
+    
+    scale
+      factor to resize the animation by
+    
+    preset, threads
+      x264 preset and number of threads used to encode the animation
+    
     Returns
     --------
     
@@ -35,118 +45,56 @@ def animate_audio(video, audio, output):
       Simply returns the filepath to the saved output video
     """
     
-    global last_t
-    global tempgraph
+    # Only the length and frame rate of the video are needed
+    video_info = fu.probe_video(video)
     
-    # Load video and extract audio to file
-    video_file = VideoFileClip(video)
-    extracted_audio = video_file.audio
-    extracted_audio.write_audiofile(audio)
+    # Decode the audio, or load it from the cache if it was decoded before
+    y, sr = ai.load_audio(video, mono=False, cache_dir=audio)
     
-    # Load the saved audio into librosa
-    y, sr = librosa.load(audio, mono=False)
-    
-    # Make a waveplot figure
+    # Draw the unplayed waveform
     fig, ax = plt.subplots(1, figsize=(12, 2), facecolor='white')
     waveplot(y, sr=sr, color='b', alpha=0.25)
+    unplayed = mplfig_to_npimage(fig)
+    
+    # Draw the played color over it, the axes don't change so the two images
+    # line up column for column
+    waveplot(y, sr=sr, color='b', alpha=0.8)
+    played = mplfig_to_npimage(fig)
+    
+    # Pixel columns where the waveform starts and ends
+    audio_duration = y.shape[-1] / float(sr)
+    x_start = ax.transData.transform((0, 0))[0]
+    x_end = ax.transData.transform((audio_duration, 0))[0]
+    plt.close(fig)
     
-    # Initialize some variables
-    last_t = 0
-    tempgraph = mplfig_to_npimage(fig)
+    # Reused for every frame of the animation
+    frame = np.empty_like(unplayed)
+    width = frame.shape[1]
     
     # Function to animate our graph
     def animate(t):
         
-        # Access our initialized variables from outside the function
-        global last_t
-        global tempgraph
+        # Column up to which the audio has been played
+        col = int(round(x_start + (x_end - x_start) * t / audio_duration))
+        col = min(max(col, 0), width)
         
-        # Round time to nearest 0.5 second. This limits the number of times we
-        # update the graph. Each graph update costs 10-20 seconds to draw, so by
-        # limiting this, we can render the graph an order of magnitude faster
-        temp_t = np.round(t * 2) / 2.0
+        # Played part on the left, unplayed part on the right
+        frame[:, :col] = played[:, :col]
+        frame[:, col:] = unplayed[:, col:]
         
-        # Only update the graph if we are at the next 0.5 seconds
-        if t > 0 and temp_t != last_t:
-            
-            # Update our timekeeping variable
-            last_t = temp_t
-            
-            # Delete the previous graph, otherwise we will keep plotting over
-            # the same graphs again and again
-            for coll in (ax.collections):
-                ax.collections.remove(coll)
-            
-            # Load only the played portion of the mp3 and plot them
-            y2, sr2 = librosa.load('extracted_audio.mp3', mono=False,
-                                   duration=t)
-            waveplot(y2, sr=sr2, color='b', alpha=0.8)
-            waveplot(y, sr=sr, color='b', alpha=0.25)
-            
-            # Update the output graph
-            tempgraph = mplfig_to_npimage(fig)
-        
-        return tempgraph
+        return frame
     
     # Make a video of the animated graph and save it
-    animation1 = VideoClip(animate, duration=video_file.duration)
-    animation1.write_videofile(output, fps=video_file.fps)
+    animation1 = VideoClip(animate, duration=video_info['duration'])
+    if scale != 1:
+        animation1 = animation1.resize(scale)
+    animation1.write_videofile(output, fps=fps or video_info['fps'],
+                               preset=preset, threads=threads)
     
     return output
 
 
 if __name__ == '__main__':
     
-    # Import source video and extract the audio to an mp3
-    video = VideoFileClip('BTS_2017_DNA.mkv')
-    audio = video.audio
-    audio.write_audiofile('extracted_audio.mp3')
-    
-    # Load the mp3 into librosa
-    y, sr = librosa.load('extracted_audio.mp3', mono=False)
-    
-    # Make a waveplot figure
-    fig, ax = plt.subplots(1, figsize=(12, 2), facecolor='white')
-    waveplot(y, sr=sr, color='b', alpha=0.25)
-    
-    # Initialize some variables
-    last_t = 0
-    tempgraph = mplfig_to_npimage(fig)
-    
-    # Function to animate our graph
-    def animate1(t):
-        
-        # Access our initialized variables from outside the function
-        global last_t
-        global tempgraph
-        
-        # Round time to nearest 0.5 second. This limits the number of times we
-        # update the graph. Each graph update costs 10-20 seconds to draw, so by
-        # limiting this, we can render the graph an order of magnitude faster
-        temp_t = np.round(t * 2) / 2.0
-        
-        # Only update the graph if we are at the next 0.5 seconds
-        if t > 0 and temp_t != last_t:
-            
-            # Update our timekeeping variable
-            last_t = temp_t
-            
-            # Delete the previous graph, otherwise we will keep plotting over
-            # the same graphs again and again
-            for coll in (ax.collections):
-                ax.collections.remove(coll)
-            
-            # Load only the played portion of the mp3 and plot them
-            y2, sr2 = librosa.load('extracted_audio.mp3', mono=False,
-                                   duration=t)
-            waveplot(y2, sr=sr2, color='b', alpha=0.8)
-            waveplot(y, sr=sr, color='b', alpha=0.25)
-            
-            # Update the output graph
-            tempgraph = mplfig_to_npimage(fig)
-        
-        return tempgraph
-    
-    # Make a video of the animated graph and save it
-    animation1 = VideoClip(animate1, duration=video.duration)
-    animation1.write_videofile('audio_animation1.mp4', fps=video.fps)
+    # Render the waveform animation of a video
+    animate_audio('BTS_2017_DNA.mkv', 'audio_cache', 'audio_animation1.mp4')
@@ -0,0 +1,332 @@
+"""Resumable batch processing of many videos.
+
+Each video goes through a list of stages (for analyze_folder.py, detection and
+then rendering). A manifest in a small SQLite database records, for every
+video and set of parameters:
+
+  hash      sha1 of the video's contents, so renamed or moved videos are
+            still recognized and changed ones are redone
+  params    the parameters as JSON
+  status    'pending', 'done' or 'failed'
+  stages    the stages that have finished
+  outputs   what the finished stages produced, as JSON
+  attempts  number of times processing was started
+  error     traceback of the last failure
+
+Running a batch again skips the finished videos, continues partially
+processed ones from the first unfinished stage and retries failed ones up to a
+number of attempts. Videos run in parallel in a process pool sized to the CPUs
+and memory of the machine. Only the main process writes to the manifest.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import traceback
+import concurrent.futures as cf
+import cache_utils as cu
+import resources as res
+import workspace as wsp
+
+
+MANIFEST_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    hash TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+    hash TEXT,
+    params TEXT,
+    video_file TEXT,
+    status TEXT,
+    stages TEXT,
+    outputs TEXT,
+    attempts INTEGER,
+    error TEXT,
+    updated REAL,
+    PRIMARY KEY (hash, params)
+);
+CREATE INDEX IF NOT EXISTS items_status ON items (status);
+'''
+
+# Rough peak memory of processing one video, used to size the pool
+DEFAULT_JOB_MEMORY = 3 * 1024 ** 3
+
+
+class Manifest(object):
+    """The SQLite manifest of a batch, see the module docstring."""
+    
+    def __init__(self, filename):
+        
+        self.conn = sqlite3.connect(filename)
+        self.conn.executescript(MANIFEST_SCHEMA)
+    
+    def close(self):
+        
+        self.conn.close()
+    
+    def content_hash(self, video_file):
+        """
+        Hash of a video's contents.
+        
+        Hashing thousands of videos takes a while, so the hash is remembered
+        and only recomputed when the file's size or modification time changes.
+        """
+        
+        path = os.path.abspath(video_file)
+        stat = os.stat(path)
+        
+        row = self.conn.execute('SELECT size, mtime, hash FROM files '
+                                'WHERE path = ?', (path,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return row[2]
+        
+        digest = cu.file_hash(path)
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                              (path, stat.st_size, stat.st_mtime, digest))
+        
+        return digest
+    
+    def get(self, digest, params):
+        """Returns the manifest entry of a video as a dict, or None."""
+        
+        row = self.conn.execute('SELECT video_file, status, stages, outputs, '
+                                'attempts, error FROM items '
+                                'WHERE hash = ? AND params = ?',
+                                (digest, params)).fetchone()
+        if row is None:
+            return None
+        
+        return {'video_file': row[0],
+                'status': row[1],
+                'stages': json.loads(row[2]),
+                'outputs': json.loads(row[3]),
+                'attempts': row[4],
+                'error': row[5]}
+    
+    def put(self, digest, params, video_file, status, stages, outputs,
+            attempts, error=None):
+        """Writes the manifest entry of a video."""
+        
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO items VALUES '
+                              '(?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                              (digest, params, video_file, status,
+                               json.dumps(stages), json.dumps(outputs),
+                               attempts, error, time.time()))
+    
+    def summary(self):
+        """Number of entries by status."""
+        
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM items '
+                                      'GROUP BY status').fetchall())
+
+
+def params_key(params):
+    """Canonical JSON of a parameter dict, used as part of the manifest key."""
+    
+    return json.dumps(params, sort_keys=True)
+
+
+def _run_job(job):
+    """
+    Runs the unfinished stages of one video, in a worker process.
+    
+    The stages share a Workspace for their intermediate files, so videos
+    processed at the same time can't collide. Exceptions are caught and
+    returned, along with whatever stages finished before them.
+    """
+    
+    result = {'digest': job['digest'], 'stages': [], 'outputs': {},
+              'error': None}
+    
+    workspace = wsp.Workspace('batch_' + job['digest'][:12], keep=job['keep'])
+    
+    try:
+        for name, stage in job['stages']:
+            if name in job['done']:
+                continue
+            
+            outputs = dict(job['outputs'])
+            outputs.update(result['outputs'])
+            
+            result['outputs'].update(stage({'video_file': job['video_file'],
+                                            'params': job['params'],
+                                            'output_prefix': job['output_prefix'],
+                                            'outputs': outputs,
+                                            'workspace': workspace}))
+            result['stages'].append(name)
+    
+    except Exception:
+        result['error'] = traceback.format_exc()
+    
+    finally:
+        workspace.cleanup()
+    
+    return result
+
+
+def run_batch(file_list, stages, params, output_dir, manifest_file=None,
+              workers=None, job_memory=DEFAULT_JOB_MEMORY, memory_budget=None,
+              max_attempts=3, keep_intermediates=None):
+    """
+    Processes a list of videos, skipping work recorded in the manifest.
+    
+    Parameters
+    -----------
+    
+    file_list
+      list of filepaths of the videos
+    
+    stages
+      list of (name, function) tuples run in order for every video. Each
+      function takes a dict with the 'video_file', 'params', 'output_prefix',
+      the 'outputs' of the earlier stages and a 'workspace' for intermediate
+      files (see workspace.Workspace), and returns a dict of its own outputs. They must be defined at the top level of a module so they can
+      be sent to the worker processes.
+    
+    params
+      dict of parameters passed on to the stages. Must be JSON serializable,
+      changing them processes every video again.
+    
+    output_dir
+      folder for the outputs. Each video gets an output_prefix of this
+      folder plus its filename without the extension.
+    
+    manifest_file
+      filepath of the manifest, batch_manifest.sqlite in output_dir if None
+    
+    workers
+      number of videos to process at once. If None, as many as fit in the
+      memory budget, up to the number of CPUs.
+    
+    job_memory
+      estimated peak memory in bytes of processing one video
+    
+    memory_budget
+      memory in bytes the workers may use together, the currently available
+      memory if None
+    
+    max_attempts
+      videos that failed this many times are not retried
+    
+    keep_intermediates
+      keep the workspace of every video after it is processed, defaults to
+      the QE_KEEP_WORKSPACE environment variable
+    
+    Returns
+    --------
+    
+    summary
+      dict of the number of manifest entries by status
+    """
+    
+    output_dir = os.path.abspath(output_dir)
+    if manifest_file is None:
+        manifest_file = os.path.join(output_dir, 'batch_manifest.sqlite')
+    
+    manifest = Manifest(manifest_file)
+    key = params_key(params)
+    stage_names = [name for name, _ in stages]
+    
+    try:
+        # Work out what is left to do
+        jobs = []
+        entries = {}
+        for video_file in file_list:
+            video_file = os.path.abspath(video_file)
+            digest = manifest.content_hash(video_file)
+            entry = manifest.get(digest, key)
+            
+            if entry is None:
+                entry = {'video_file': video_file, 'status': 'pending',
+                         'stages': [], 'outputs': {}, 'attempts': 0}
+            
+            elif entry['status'] == 'done':
+                continue
+            
+            elif entry['status'] == 'failed' and \
+                    entry['attempts'] >= max_attempts:
+                print('Skipping %s, failed %d times' % (video_file,
+                                                        entry['attempts']))
+                continue
+            
+            name = os.path.splitext(os.path.basename(video_file))[0]
+            entries[digest] = entry
+            jobs.append({'digest': digest,
+                         'video_file': video_file,
+                         'params': params,
+                         'stages': stages,
+                         'done': entry['stages'],
+                         'outputs': entry['outputs'],
+                         'output_prefix': os.path.join(output_dir, name),
+                         'keep': keep_intermediates})
+        
+        print('%d of %d videos left to process' % (len(jobs), len(file_list)))
+        if not jobs:
+            return manifest.summary()
+        
+        if workers is None:
+            workers = res.worker_count(job_memory, memory_budget=memory_budget)
+        workers = min(workers, len(jobs))
+        
+        # Count the attempt before starting, so a crash of the whole batch
+        # still counts against the videos that were running
+        for job in jobs:
+            entry = entries[job['digest']]
+            entry['attempts'] += 1
+            manifest.put(job['digest'], key, job['video_file'], 'pending',
+                         entry['stages'], entry['outputs'], entry['attempts'])
+        
+        executor = cf.ProcessPoolExecutor(workers, max_tasks_per_child=1)
+        
+        try:
+            futures = {executor.submit(_run_job, job): job for job in jobs}
+            for done, future in enumerate(cf.as_completed(futures)):
+                try:
+                    result = future.result()
+                
+                except cf.process.BrokenProcessPool:
+                    # A worker was killed (usually for running out of memory),
+                    # which fails every video that hadn't finished yet
+                    result = {'digest': futures[future]['digest'],
+                              'stages': [], 'outputs': {},
+                              'error': 'Worker process died before finishing '
+                                       'this video, possibly out of memory\n'}
+                
+                entry = entries[result['digest']]
+                stages_done = entry['stages'] + result['stages']
+                outputs = dict(entry['outputs'])
+                outputs.update(result['outputs'])
+                
+                if result['error']:
+                    status = 'failed'
+                elif all(name in stages_done for name in stage_names):
+                    status = 'done'
+                else:
+                    status = 'pending'
+                
+                manifest.put(result['digest'], key, entry['video_file'],
+                             status, stages_done, outputs, entry['attempts'],
+                             result['error'])
+                
+                print('[%d/%d] %s: %s' % (done + 1, len(jobs),
+                                          os.path.basename(entry['video_file']),
+                                          status))
+                if result['error']:
+                    print(result['error'])
+        
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        
+        executor.shutdown(wait=True)
+        
+        return manifest.summary()
+    
+    finally:
+        manifest.close()
@@ -0,0 +1,78 @@
+"""Helpers for the on-disk caches of decoded media."""
+
+import os
+import hashlib
+
+
+def file_hash(filename, chunk_size=1 << 20):
+    """
+    Returns the sha1 hex digest of a file's contents, read in chunks so large
+    videos don't have to fit in memory.
+    """
+    
+    sha1 = hashlib.sha1()
+    
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    
+    return sha1.hexdigest()
+
+
+def cache_path(cache_dir, key, suffix):
+    """
+    Returns the path of a cache entry, creating cache_dir if needed.
+    
+    Parameters
+    -----------
+    
+    cache_dir
+      folder holding the cache
+    
+    key
+      unique name of the entry, usually built from a file hash and the
+      settings the entry was made with
+    
+    suffix
+      file extension of the entry, including the dot
+    """
+    
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    
+    return os.path.join(cache_dir, key + suffix)
+
+
+def evict(cache_dir, max_bytes, suffix, keep=None):
+    """
+    Deletes the least recently used entries of a cache folder until the total
+    size is at most max_bytes. Only files ending in suffix count as entries,
+    and the entry named keep is never deleted.
+    """
+    
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(suffix):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    
+    total = sum(entry[1] for entry in entries)
+    
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        
+        # Another process may have deleted it already, and any process still
+        # reading it keeps its memory map until it is done
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
@@ -1,6 +1,22 @@
 import os
+import time
 import video_downloader as vd
 import detect_scenes as ds
+import proxy
+import crop_detect as cdt
+import pts_index as pi
+import results_store as rs
+import annotation as an
+import ffmpeg_utils as fu
+import ffmpeg_render as fr
+import streaming_compose as sc
+import segment_render as sr
+import scene_graphs as sg
+import cache_utils as cu
+import resources as res
+import scene_extract as se
+import render_profiles as rp
+import workspace as wsp
 import audio_rendering as ar
 import numpy as np
 import matplotlib.pyplot as plt
@@ -17,12 +33,68 @@ if __name__ == '__main__':
     video_year = '2014'
     video_ext = '.mkv'
     include_audio = True
-    render_audioplot = False  # Time intensive, 2+ hours on my laptop
+    render_audioplot = False  # Animated audio waveform under the video
+    
+    # 'moviepy' composes the final video frame by frame in python, 'ffmpeg'
+    # renders the same layout as a single ffmpeg filter graph, 'stream'
+    # composes it in python with a bounded amount of memory, for 4K and long
+    # videos, and 'segments' renders it with ffmpeg in cached segments, so a
+    # re-run only re-encodes the parts that changed. The graphs of 'segments'
+    # fit their axes to the scenes so far instead of the whole video, so
+    # they look different from the other backends, see scene_graphs.py.
+    render_backend = 'moviepy'
+    
+    # Folder to cache the encoded segments of the 'segments' backend in
+    segment_cache = 'segment_cache'
+    
+    # Memory in bytes the 'stream' backend may use, None for all of the
+    # available memory
+    memory_budget = None
+    
+    # 'render' composites the longest scene replay with its captions, 'copy'
+    # splices it on by stream copying the source, re-encoding only the partial
+    # GOPs at its ends (moviepy backend only). 'copy' falls back to 'render'
+    # unless the source has the analyzed video's codec, size and frame rate.
+    longest_scene_mode = 'render'
+    
+    # Render profile, one of 'preview', 'review' or 'final'
+    profile = rp.get_profile('final')
+    
+    # Keep the intermediate files (graph animations, scene table, ...) after
+    # the run for debugging, None follows the QE_KEEP_WORKSPACE variable
+    keep_intermediates = None
     
     # Some scenedetect constants to set
     threshold = 30
     min_scene_len = 10
     
+    # 'content' for scenedetect's ContentDetector, 'fast' for the quicker
+    # FastContentDetector, which can also skip pixels with a stride > 1
+    detector = 'content'
+    stride = 1
+    
+    # None to detect on every frame, 'packets' or 'scene' to only look at the
+    # likely cuts found by a cheap first pass (see prefilter.py)
+    prefilter = None
+    
+    # Detect scenes on a cached 360p copy of the video, which is much quicker
+    # to decode than the full resolution. Making the copy decodes and encodes
+    # the whole video once, so it only pays off when the same video is
+    # detected again, e.g. while trying out thresholds.
+    use_proxy = False
+    
+    # Leave out letterbox and pillarbox borders from detection, 'auto' to find
+    # them, None to analyze the whole frame. Cropping changes the content
+    # scores, so thresholds tuned on whole frames may need adjusting.
+    crop = None
+    
+    # Folder to cache the frame timestamps of videos in, for exact times with
+    # variable frame rates
+    pts_cache = 'pts_cache'
+    
+    # Database to store the scenes of every analyzed video in, None to skip it
+    results_db = 'results.sqlite'
+    
     # Download the video, setting the name first
     print('Downloading video...')
     video_file_no_ext = '_'.join([artist_name, video_year, video_title])
@@ -46,74 +118,55 @@ if __name__ == '__main__':
             print('Video file does not exist!')
     
     # Analyze the video for scene transitions
-    video_fps, frames_read, _, scene_list = ds.analyze_video(
-        video_file, threshold=threshold, min_scene_len=min_scene_len,
-        downscale_factor=1)
+    detect_start = time.time()
+    detect_file = proxy.make_proxy(video_file) if use_proxy else video_file
+    
+    # Find the borders up front, so the crop used can be stored with the run.
+    # It is in pixels of the file detection runs on.
+    if crop == 'auto':
+        crop = cdt.detect_crop(detect_file)
+    
+    detect_args = {'threshold': threshold, 'min_scene_len': min_scene_len,
+                   'detector': detector, 'stride': stride,
+                   'prefilter': prefilter, 'crop': crop}
+    if use_proxy:
+        video_fps, frames_read, _, scene_list = proxy.analyze_video(
+            video_file, proxy_file=detect_file, **detect_args)
+    else:
+        video_fps, frames_read, _, scene_list = ds.analyze_video(
+            video_file, downscale_factor=1, **detect_args)
+    detect_seconds = time.time() - detect_start
+    
+    # Actual timestamps of the frames, the frame rate may vary. None if the
+    # video has none, then frames are timed at a constant frame rate.
+    pts_index = pi.try_load_index(video_file, cache_dir=pts_cache)
     
     # Done analyzing video!
     print('Done analyzing video! Moving on to annotated video creation...')
     
-    # Convert the scene_list to milliseconds
-    scene_list_msec = [(1000.0 * x) / float(video_fps) for x in scene_list]
+    # Private folder for the intermediate files of this run, so several runs
+    # can go at the same time
+    workspace = wsp.Workspace('complete_process',
+                              keep=keep_intermediates).create()
     
     # Pull video file into moviepy
     video_clip = VideoFileClip(video_file)
+    
+    # Scale the video down for quicker renders if the profile asks for it
+    if profile['scale'] != 1:
+        video_clip = video_clip.resize(profile['scale'])
+    
     W, H = video_clip.size
     
     # Get rid of audio if set
     if not include_audio:
         video_clip = video_clip.set_audio(None)
     
-    # Some constants for the text clip overlay
-    scene = 0
-    previous_scene_msec = 0
-    textclip_list = []
-    
-    # Loop over list of scenes, creating TextClips for each scene
-    for scene_idx in range(len(scene_list) + 1):
-        
-        # Each iteration is the same except for the final scene which is handled 
-        # separately in the else statement
-        if scene_idx != len(scene_list):
-            
-            # Calculate duration of the scene in seconds
-            duration = (scene_list_msec[scene_idx] - previous_scene_msec) / 1000
-            
-            # Record ending time of scene for the next loop
-            previous_scene_msec = scene_list_msec[scene_idx]
-            
-            # Make the video clips of the numbers
-            txtclip = (TextClip("%03d" % scene_idx, fontsize=288, color='white',
-                                font='FreeMono-Bold', stroke_color='black',
-                                stroke_width=5).set_pos('center').
-                                set_duration(duration).set_opacity(0.6))
-            
-            # Add the clip to a list of all the TextClips
-            textclip_list.append(txtclip)
-        
-        # Last scene needs special treatment
-        else:
-            
-            # Calculate the total duration of the video
-            total_duration_msec = frames_read / float(video_fps) * 1000
-            
-            # Calculate the duration of the final scene
-            clip_duration = (total_duration_msec - previous_scene_msec) / 1000
-            
-            # Create the TextClip for the final scene
-            txtclip = (TextClip("%03d" % scene_idx, fontsize=288, color='white',
-                                font='FreeMono-Bold', stroke_color='black',
-                                stroke_width=5).set_pos('center').
-                                set_duration(clip_duration).set_opacity(0.6))
-            
-            # Add it to the list of other TextClips
-            textclip_list.append(txtclip)
-    
-    # Play the TextClips one after the other
-    final_textclip = concatenate_videoclips(textclip_list).set_pos('center')
-    
-    # Play the TextClips over the original video
-    annotated_video = CompositeVideoClip([video_clip, final_textclip])
+    # Draw the scene numbers over the original video
+    annotated_video = an.annotate_video(video_clip, scene_list, video_fps,
+                                        fontsize=rp.scaled(288, profile),
+                                        stroke_width=rp.scaled(5, profile),
+                                        pts_index=pts_index)
     
     # Save resulting video to file
     outfile = ('_'.join([artist_name, video_year, video_title, 'annotated'])
@@ -123,28 +176,27 @@ if __name__ == '__main__':
     # Done annotating video
     print('Done making annotated video! Next to make concurrent graphs...')
     
-    # Convert our scene lists to numpy arrays
-    scene_list_array = np.array(scene_list)
-    scene_list_array_msec = np.array(scene_list_msec)
-    
-    # Stack the scene data together
-    scene_array = np.column_stack((scene_list_array, scene_list_array_msec))
-    
-    # Tack on the last row signifying the end of the video
-    end_row = np.array([frames_read, total_duration_msec])
-    end_row = end_row.reshape((1, 2))
-    scene_array = np.vstack((scene_array, end_row))
-    
-    # Calculate the duration of each scene in msec
-    scene_lens_msec = np.diff(np.insert(np.append(scene_list_array_msec,
-                                                  total_duration_msec), 0, 0))
-    
-    # Tack on a column of the length of each scene in msec
-    scene_array = np.column_stack((scene_array, scene_lens_msec))
+    # Table of the scene breaks, timed with the frame timestamps
+    scene_array = ds.scene_table(scene_list, video_fps, frames_read, pts_index)
+    
+    # Keep the results in the corpus database
+    if results_db:
+        store = rs.ResultsStore(results_db)
+        video_id = store.add_video(artist_name, int(video_year), video_title,
+                                   url=youtube_link)
+        store.add_run(video_id, scene_array, video_fps, threshold=threshold,
+                      min_scene_len=min_scene_len, detector=detector,
+                      params={'use_proxy': use_proxy,
+                              'crop': list(crop) if crop else None,
+                              'prefilter': prefilter,
+                              'stride': stride,
+                              'downscale_factor': 1},
+                      detect_seconds=detect_seconds)
+        store.close()
     
     # Write this array to a .csv file columns are:
     # | scene break (frame) | scene break (msec) | scene duration (msec) |
-    with open('video_scenelist.csv', 'wb') as f:
+    with open(workspace.path('video_scenelist.csv'), 'wb') as f:
         np.savetxt(f, scene_array, delimiter=',', fmt=["%1d", "%1.1f", "%1.1f"])
     
     # Break these columns apart to make it a little easier to index later
@@ -152,8 +204,9 @@ if __name__ == '__main__':
     scene_times = scene_array[:, 1]
     scene_durs = scene_array[:, 2]
     
-    # Calculate the time that passes each frame
-    msec_per_frame = scene_times[-1] / scene_frames[-1]
+    # Time of every frame
+    frame_msec = pi.frame_msec(np.arange(int(np.max(scene_frames)) + 1),
+                               video_fps, pts_index)
     
     # Initialize a list to keep track of edits/sec
     rolling_average = []
@@ -173,7 +226,7 @@ if __name__ == '__main__':
             continue
         
         # Find current time in msec
-        current_time = i * msec_per_frame
+        current_time = frame_msec[i]
         
         # Find all scenes that have happened prior to current frame
         in_window_scenes = scene_times[np.where(current_time >= scene_times)]
@@ -238,9 +291,13 @@ if __name__ == '__main__':
         
         return mplfig_to_npimage(fig1)
     
-    # Use our function to animate a video and save it to file
+    # Use our function to animate a video and save it to file. The segments
+    # backend draws the graphs itself, only for the segments it renders.
     animation1 = VideoClip(make_frame1, duration=duration).resize(height=H / 2.0)
-    animation1.write_videofile('animation1.mp4', fps=video_fps)
+    if render_backend != 'segments':
+        animation1.write_videofile(workspace.path('animation1.mp4'),
+                                   fps=rp.graph_fps(video_fps, profile),
+                                   **rp.write_kwargs(profile))
     plt.close()
     
     # Print progress so far
@@ -281,7 +338,10 @@ if __name__ == '__main__':
     
     # Animate the graph and save it to file
     animation2 = VideoClip(make_frame2, duration=duration).resize(height=H / 2.0)
-    animation2.write_videofile('animation2.mp4', fps=video_fps)
+    if render_backend != 'segments':
+        animation2.write_videofile(workspace.path('animation2.mp4'),
+                                   fps=rp.graph_fps(video_fps, profile),
+                                   **rp.write_kwargs(profile))
     
     if not render_audioplot:
         
@@ -295,12 +355,31 @@ if __name__ == '__main__':
         
         # Define our variables
         input_video = video_file
-        audio_output = 'extracted_audio.mp3'
-        graph_output = 'audio_animation.mp4'
+        audio_output = 'audio_cache'
+        graph_output = workspace.path('audio_animation.mp4')
+        
+        def render_audio(output):
+            """Renders the audio waveform animation to output."""
+            
+            return ar.animate_audio(input_video, audio_output, output,
+                                    fps=rp.graph_fps(video_fps, profile),
+                                    scale=profile['scale'],
+                                    **rp.write_kwargs(profile))
+        
+        # The waveform only depends on the audio and the profile, so the
+        # segments backend keeps it with the segments and renders it once
+        if render_backend == 'segments':
+            graph_output = sr.cached_file(
+                segment_cache, {'part': 'audio_graph',
+                                'video': cu.file_hash(video_file),
+                                'fps': rp.graph_fps(video_fps, profile),
+                                'scale': profile['scale'],
+                                'preset': profile['preset']},
+                render_audio)
+        else:
+            render_audio(graph_output)
         
-        # Render the video
-        audio_rendering = ar.animate_audio(input_video, audio_output,
-                                           graph_output)
+        audio_rendering = graph_output
         
         # Display progress
         print('Done rendering audio waveform! Moving on to final composition...')
@@ -309,36 +388,13 @@ if __name__ == '__main__':
         animation3 = VideoFileClip(audio_rendering)
 #        animation3 = VideoFileClip('audio_animation.mp4')
     
-    # Reload saved videos of graphs as they cannot be composited together
-    # until they are each rendered and saved independently
-    animation1 = VideoFileClip('animation1.mp4')
-    animation2 = VideoFileClip('animation2.mp4')
-    
-    # Stack the two graphs on top of each other
-    animation_array = clips_array([[animation1], [animation2]])
-#    animation_array.write_videofile('stacked_animation.mp4', fps=video_fps)
-    
-    # Resize the main video
-    resized_video = annotated_video.resize(width=(W - animation_array.w))
-    
-    # Stick the videos together
-    final_array = clips_array([[resized_video, animation_array]])
-    
-    # Overlay audio rendering if set
-    if render_audioplot:
-        
-        # Figure out positioning first
-        sub_W, sub_H = final_array.resize(width=W - animation_array.w).size
-        anim_W, anim_H = animation3.size
-        
-        # Composite the clip
-        final_array = CompositeVideoClip([final_array,
-                                          animation3.set_pos(
-                                              ((sub_W - anim_W) / 2,
-                                               final_array.h - 10 - anim_H))])
+    # Find the longest scene
+    scene_idx = np.argmax(scene_durs)
     
-    # Write the output to file
-#    final_array.write_videofile('final_composition.mp4', fps=video_fps)
+    # Figure out the timing of the longest scene
+    scene_start = scene_times[scene_idx - 1] / 1000.0
+    scene_end = frame_msec[int(scene_frames[scene_idx]) - 1] / 1000.0
+    scene_duration = scene_end - scene_start
     
     # Calculate final stats to display after video ends
     sec_per_scene = duration / float(max(scene_count))
@@ -353,59 +409,192 @@ if __name__ == '__main__':
     result_text = [result_string1, result_string2,
                    result_string3, result_string4]
     
-    # Add line breaks
-    final_result_text = "\n".join(result_text)
+    # Output filename for the final video
+    output_file = video_file + '_analyzed.mp4'
     
-    # Make the video clip from the text
-    result_screen_text = TextClip(final_result_text, fontsize=72,
-                                  font="FreeMono-Bold", color='white',
-                                  size=(final_array.w, final_array.h)
-                                  ).set_duration(7.5).set_pos('center')
-    
-    # Add the results onto the end of the analyzed video
-    video_result = concatenate_videoclips([final_array, result_screen_text])
-    
-    # Find the longest scene
-    scene_idx = np.argmax(scene_durs)
-    
-    # Figure out the timing of the longest scene
-    scene_start = scene_times[scene_idx - 1] / 1000.0
-    scene_end = (scene_times[scene_idx] - msec_per_frame) / 1000.0
-    scene_duration = scene_end - scene_start
-    
-    # Make the text for the top of the screen
-    scene_text = (TextClip("Longest Scene", fontsize=144, font="FreeMono-Bold",
-                           stroke_color='black', stroke_width=3, color="white").
-                           set_duration(scene_duration).set_opacity(0.6))
-    scene_text = scene_text.set_pos("center").set_pos("top")
-    
-    # Make the text for the bottom of the screen
-    dur_text = (TextClip("%0.3f seconds long" % scene_duration, fontsize=144,
-                         font="FreeMono-Bold", stroke_color='black',
-                         color='white', stroke_width=3).
-                         set_duration(scene_duration).set_opacity(0.6))
-    dur_text = dur_text.set_pos('center').set_pos('bottom')
-    
-    # Load the longest scene from the previously annotated video
-    longest_scene = annotated_video.subclip(scene_start, scene_end)
-    
-    # Combine the text and the longest scene together
-    final_scene = CompositeVideoClip([longest_scene, scene_text, dur_text])
-    
-    # Add the longest scene onto the end of the annotated video
-    added_scene = concatenate_videoclips([video_result, final_scene])
-    added_scene.write_videofile(video_file + '_analyzed.mp4', fps=video_fps,
-                                preset='medium')
+    if render_backend in ('ffmpeg', 'stream', 'segments'):
+        
+        # The segments backend draws the graphs for each segment it renders,
+        # from the scenes up to it alone, see scene_graphs.py
+        graphs = None
+        if render_backend == 'segments':
+            graphs = sg.SceneGraphs(scene_times, duration, H / 2.0,
+                                    rp.graph_fps(video_fps, profile),
+                                    window_sec=window_sec)
+        
+        # Describe the final layout
+        layout = fr.analysis_layout(
+            video_file, scene_list, video_fps, frames_read, (W, H),
+            [workspace.path('animation1.mp4'),
+             workspace.path('animation2.mp4')], result_text,
+            (scene_start, scene_end),
+            audio_graph=graph_output if render_audioplot else None,
+            include_audio=include_audio, text_scale=profile['scale'],
+            pts_index=pts_index,
+            graph_size=graphs.size if graphs is not None else None)
+        
+        if render_backend == 'ffmpeg':
+            
+            # Render all of it in one ffmpeg process
+            fr.render_layout(layout, output_file, **rp.write_kwargs(profile))
+            
+        elif render_backend == 'stream':
+            
+            # Stop the moviepy readers, the stream opens its own
+            res.close_clip(video_clip)
+            if render_audioplot:
+                res.close_clip(animation3)
+            
+            sc.stream_layout(layout, output_file, memory_budget=memory_budget,
+                             **rp.write_kwargs(profile))
+            
+        else:
+            
+            # Everything the graphs are drawn with besides the scene times,
+            # none of it changes with the threshold
+            graph_state = graphs.state()
+            graph_state['audio_graph'] = os.path.basename(graph_output) \
+                if render_audioplot else None
+            
+            counts = sr.render_segments(layout, output_file,
+                                        cache_dir=segment_cache,
+                                        graph_state=graph_state,
+                                        draw_graphs=graphs.render,
+                                        **rp.write_kwargs(profile))
+            print('Re-encoded %d of %d segments' % (counts['rendered'],
+                                                    counts['segments']))
+        
+    else:
+        
+        # Reload saved videos of graphs as they cannot be composited together
+        # until they are each rendered and saved independently
+        animation1 = VideoFileClip(workspace.path('animation1.mp4'))
+        animation2 = VideoFileClip(workspace.path('animation2.mp4'))
+        
+        # Stack the two graphs on top of each other
+        animation_array = clips_array([[animation1], [animation2]])
+    #    animation_array.write_videofile('stacked_animation.mp4', fps=video_fps)
+        
+        # Resize the main video
+        resized_video = annotated_video.resize(width=(W - animation_array.w))
+        
+        # Stick the videos together
+        final_array = clips_array([[resized_video, animation_array]])
+        
+        # Overlay audio rendering if set
+        if render_audioplot:
+            
+            # Figure out positioning first
+            sub_W, sub_H = final_array.resize(width=W - animation_array.w).size
+            anim_W, anim_H = animation3.size
+            
+            # Composite the clip
+            final_array = CompositeVideoClip([final_array,
+                                              animation3.set_pos(
+                                                  ((sub_W - anim_W) / 2,
+                                                   final_array.h - 10 - anim_H))])
+        
+        # Write the output to file
+    #    final_array.write_videofile('final_composition.mp4', fps=video_fps)
+        
+        def results_screen(lines):
+            """Results screen of the final video, with line breaks added."""
+            
+            return TextClip("\n".join(lines),
+                            fontsize=rp.scaled(72, profile),
+                            font="FreeMono-Bold", color='white',
+                            size=(final_array.w, final_array.h)
+                            ).set_duration(7.5).set_pos('center')
+        
+        # The longest scene is copied from the source as is, so the body has
+        # to come out with the source's codec, size, pixel format and frame
+        # rate. moviepy encodes H.264 in yuv420p at video_fps.
+        if longest_scene_mode == 'copy':
+            body_info = {'codec': 'h264', 'pix_fmt': 'yuv420p',
+                         'width': final_array.w, 'height': final_array.h,
+                         'fps': video_fps}
+            source_info = fu.probe_video(video_file)
+            vfr = pts_index is not None and pts_index.is_vfr
+            if vfr or not se.can_splice(body_info, source_info):
+                print("The source doesn't match the format of the analyzed "
+                      "video, rendering the longest scene instead")
+                longest_scene_mode = 'render'
+        
+        spliced = False
+        if longest_scene_mode == 'copy':
+            
+            # The longest scene can't get its captions when it is stream
+            # copied, so announce it on the results screen instead
+            copy_text = result_text + [
+                "Up next, the longest scene:             ",
+                "%0.3f seconds long                    " % scene_duration]
+            video_result = concatenate_videoclips([final_array,
+                                                   results_screen(copy_text)])
+            
+            # Render everything up to the results screen, then splice the
+            # longest scene on the end, copied straight from the source
+            body_file = workspace.path('analysis_body.mp4')
+            video_result.write_videofile(
+                body_file, fps=video_fps, audio_codec='aac',
+                temp_audiofile=workspace.path('analysis_body_audio.m4a'),
+                **rp.write_kwargs(profile))
+            scene_file = se.extract_scene(video_file, scene_start, scene_end,
+                                          workspace.path('longest_scene.ts'),
+                                          include_audio=include_audio)
+            
+            # Check the files themselves as well, in case the encoder
+            # settings came out differently than expected
+            if se.can_splice(fu.probe_video(body_file),
+                             fu.probe_video(scene_file)):
+                se.concat_copy([body_file, scene_file], output_file,
+                               work_dir=workspace.dir)
+                spliced = True
+            else:
+                print("The longest scene doesn't match the format of the "
+                      "analyzed video, rendering it instead")
+        
+        if not spliced:
+            
+            # Add the results onto the end of the analyzed video
+            video_result = concatenate_videoclips([final_array,
+                                                   results_screen(result_text)])
+            
+            # Make the text for the top of the screen
+            scene_text = (TextClip("Longest Scene",
+                                   fontsize=rp.scaled(144, profile),
+                                   font="FreeMono-Bold", stroke_color='black',
+                                   stroke_width=rp.scaled(3, profile),
+                                   color="white").
+                                   set_duration(scene_duration).set_opacity(0.6))
+            scene_text = scene_text.set_pos("center").set_pos("top")
+            
+            # Make the text for the bottom of the screen
+            dur_text = (TextClip("%0.3f seconds long" % scene_duration,
+                                 fontsize=rp.scaled(144, profile),
+                                 font="FreeMono-Bold", stroke_color='black',
+                                 color='white',
+                                 stroke_width=rp.scaled(3, profile)).
+                                 set_duration(scene_duration).set_opacity(0.6))
+            dur_text = dur_text.set_pos('center').set_pos('bottom')
+            
+            # Load the longest scene from the previously annotated video
+            longest_scene = annotated_video.subclip(scene_start, scene_end)
+            
+            # Combine the text and the longest scene together
+            final_scene = CompositeVideoClip([longest_scene, scene_text,
+                                              dur_text])
+            
+            # Add the longest scene onto the end of the annotated video
+            added_scene = concatenate_videoclips([video_result, final_scene])
+            added_scene.write_videofile(
+                output_file, fps=video_fps,
+                temp_audiofile=workspace.path('analyzed_audio.mp3'),
+                **rp.write_kwargs(profile))
     
     # Print progress
     print('Finished analysis and video creation!')
     print('Cleaning up temporary files...')
     
-#     os.remove('animation1.mp4')
-#     os.remove('animation2.mp4')
-#     os.remove('video_scenelist.csv')
-#     if render_audioplot:
-#         os.remove(graph_output)
-#         os.remove(audio_output)
+    workspace.cleanup()
     
     print('Done!')
@@ -0,0 +1,401 @@
+"""Compact output for parameter screens.
+
+Rather than one fully annotated video per combination of settings, the whole
+screen is summarized as one comparison image and one small HTML page. Each
+(threshold, min_scene_len) combination gets a row showing its cuts on a shared
+timeline, with a thumbnail of the frame at every cut. All thumbnails come from
+a single decode pass of a small version of the video and are shared between
+the rows.
+"""
+
+import io
+import base64
+import json
+import scenedetect as sd
+import numpy as np
+import matplotlib.pyplot as plt
+import ffmpeg_utils as fu
+import frame_cache as fc
+
+
+def screen_scenes(video_file, thresholds, min_scene_lens, downscale_factor=1,
+                  cache_dir=None):
+    """
+    Detects scenes for every combination of settings in a parameter screen.
+    
+    A single StatsManager is shared between the runs, so the frame metrics
+    are only computed on the first one. With a frame cache, every combination
+    is detected in one pass over the cached frames instead.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the video to screen
+    
+    thresholds
+      list of thresholds to try
+    
+    min_scene_lens
+      list of minimum scene lengths to try for each threshold
+    
+    downscale_factor
+      passed on to the VideoManager, see detect_scenes.analyze_video
+    
+    cache_dir
+      folder of the frame cache to use (see frame_cache.py), None to decode
+      the video for every combination
+    
+    Returns
+    --------
+    
+    video_fps
+      frames per second of the video
+    
+    frames_read
+      number of frames in the video
+    
+    rows
+      list of dicts with the 'threshold', 'min_scene_len' and 'scene_list' of
+      each combination, in order
+    """
+    
+    if cache_dir:
+        frames = fc.cache_frames(video_file, downscale_factor, cache_dir)
+        
+        # Falls back to decoding when the video is too large for the cache
+        if frames is not None:
+            settings = [(threshold, min_scene_len) for threshold in thresholds
+                        for min_scene_len in min_scene_lens]
+            detectors = [sd.ContentDetector(threshold=threshold,
+                                            min_scene_len=min_scene_len)
+                         for threshold, min_scene_len in settings]
+            frames_read, scene_lists = fc.detect_frames(frames, detectors)
+            
+            rows = [{'threshold': threshold,
+                     'min_scene_len': min_scene_len,
+                     'scene_list': scene_list}
+                    for (threshold, min_scene_len), scene_list in
+                    zip(settings, scene_lists)]
+            
+            return frames.fps, frames_read, rows
+    
+    # First, load into a video manager
+    video_mgr = sd.VideoManager([video_file])
+    stats_mgr = sd.stats_manager.StatsManager()
+    scene_mgr = sd.SceneManager(stats_mgr)
+    
+    rows = []
+    
+    for threshold in thresholds:
+        for min_scene_len in min_scene_lens:
+            
+            # Add a content detector
+            scene_mgr.add_detector(
+                sd.ContentDetector(threshold=threshold,
+                                   min_scene_len=min_scene_len))
+            
+            # Get the starting timecode
+            base_timecode = video_mgr.get_base_timecode()
+            
+            # Start the video manager
+            video_mgr.set_downscale_factor(downscale_factor)
+            video_mgr.start()
+            
+            # Detect the scenes
+            scene_mgr.detect_scenes(frame_source=video_mgr)
+            
+            # Build our list from the frame_timecode objects
+            scene_list = []
+            for start_frame, end_frame in scene_mgr.get_scene_list(
+                    base_timecode):
+                scene_list.append(start_frame.frame_num)
+            
+            # Extract some info
+            video_fps = end_frame.framerate
+            frames_read = end_frame.frame_num
+            
+            rows.append({'threshold': threshold,
+                         'min_scene_len': min_scene_len,
+                         'scene_list': scene_list})
+            
+            # Reset the detector for next iteration
+            video_mgr.release()
+            video_mgr.reset()
+            scene_mgr.clear_detectors()
+            scene_mgr.clear()
+    
+    return video_fps, frames_read, rows
+
+
+def collect_thumbnails(video_file, frame_numbers, height=72):
+    """
+    Grabs thumbnails of the given frames in a single decode pass.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the video
+    
+    frame_numbers
+      iterable of frame numbers to keep
+    
+    height
+      height of the thumbnails in pixels, the width keeps the aspect ratio
+    
+    Returns
+    --------
+    
+    thumbnails
+      dict of frame number to uint8 RGB numpy array
+    """
+    
+    info = fu.probe_video(video_file)
+    width = int(round(info['width'] * height / float(info['height']))) // 2 * 2
+    
+    wanted = set(int(frame) for frame in frame_numbers)
+    last_wanted = max(wanted) if wanted else -1
+    thumbnails = {}
+    
+    for frame_num, frame in enumerate(fu.iter_frames(video_file,
+                                                     size=(width, height))):
+        if frame_num in wanted:
+            thumbnails[frame_num] = frame.copy()
+        
+        # Nothing left to keep, no need to decode the rest
+        if frame_num >= last_wanted:
+            break
+    
+    return thumbnails
+
+
+def render_contact_sheet(rows, thumbnails, video_fps, frames_read, output,
+                         title=None):
+    """
+    Draws every row of a parameter screen on a shared timeline.
+    
+    Parameters
+    -----------
+    
+    rows
+      list of rows as returned by screen_scenes
+    
+    thumbnails
+      dict of frame number to thumbnail from collect_thumbnails
+    
+    video_fps
+      frames per second of the video
+    
+    frames_read
+      number of frames in the video
+    
+    output
+      filepath to save the image to, the format follows the extension
+    
+    title
+      optional title for the image
+    
+    Returns
+    --------
+    
+    output
+      Simply returns the filepath to the saved image
+    """
+    
+    duration = frames_read / float(video_fps)
+    row_height = 0.9
+    
+    fig, ax = plt.subplots(1, figsize=(24, 0.6 * len(rows) + 1.5),
+                           facecolor='white')
+    
+    # Width of a thumbnail in seconds so that it keeps its aspect ratio on the
+    # timeline, given the size of the figure
+    if thumbnails:
+        thumb_h, thumb_w = next(iter(thumbnails.values())).shape[:2]
+        fig_w, fig_h = fig.get_size_inches()
+        sec_per_inch = duration / (fig_w * 0.85)
+        rows_per_inch = (len(rows) + 1) / (fig_h * 0.8)
+        thumb_sec = (row_height / rows_per_inch) * thumb_w / float(thumb_h) * \
+            sec_per_inch
+    
+    labels = []
+    for row_idx, row in enumerate(rows):
+        y = len(rows) - row_idx - 1
+        labels.append('%d / %d (%d)' % (row['threshold'], row['min_scene_len'],
+                                        len(row['scene_list'])))
+        
+        for frame in row['scene_list']:
+            t = frame / float(video_fps)
+            
+            if frame in thumbnails:
+                ax.imshow(thumbnails[frame], aspect='auto', zorder=1,
+                          extent=(t, t + thumb_sec, y, y + row_height))
+            
+            ax.plot([t, t], [y, y + row_height], 'r-', linewidth=1, zorder=2)
+    
+    ax.set_xlim(0, duration)
+    ax.set_ylim(0, len(rows))
+    ax.set_yticks(np.arange(len(rows)) + row_height / 2.0)
+    ax.set_yticklabels(labels[::-1])
+    ax.set_xlabel('Time (sec)')
+    ax.set_ylabel('threshold / min_scene_len (scenes)')
+    if title:
+        ax.set_title(title)
+    
+    plt.tight_layout()
+    fig.savefig(output, dpi=100)
+    plt.close(fig)
+    
+    return output
+
+
+def _png_data_uri(image):
+    """Encodes an image array as a base64 PNG data URI."""
+    
+    buf = io.BytesIO()
+    plt.imsave(buf, image, format='png')
+    
+    return 'data:image/png;base64,' + base64.b64encode(
+        buf.getvalue()).decode('ascii')
+
+
+def write_html_screen(rows, thumbnails, video_fps, frames_read, output,
+                      title='Parameter screen'):
+    """
+    Writes a single self-contained HTML page showing a parameter screen.
+    
+    Each row is a timeline with a mark at every cut. Hovering over a mark
+    shows the thumbnail of the cut frame, which is embedded only once no
+    matter how many rows share it.
+    
+    Parameters
+    -----------
+    
+    rows, thumbnails, video_fps, frames_read
+      same as in render_contact_sheet
+    
+    output
+      filepath to save the .html file to
+    
+    title
+      title of the page
+    
+    Returns
+    --------
+    
+    output
+      Simply returns the filepath to the saved page
+    """
+    
+    duration = frames_read / float(video_fps)
+    images = dict((str(frame), _png_data_uri(image))
+                  for frame, image in thumbnails.items())
+    
+    row_html = []
+    for row in rows:
+        marks = []
+        for frame in row['scene_list']:
+            t = frame / float(video_fps)
+            marks.append('<span class="cut" style="left:%0.3f%%" '
+                         'data-frame="%d" title="frame %d, %0.2f s"></span>' %
+                         (100.0 * t / duration, frame, frame, t))
+        
+        row_html.append('<div class="row"><div class="label">%d / %d '
+                        '(%d scenes)</div><div class="timeline">%s</div>'
+                        '</div>' % (row['threshold'], row['min_scene_len'],
+                                    len(row['scene_list']), ''.join(marks)))
+    
+    page = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>%(title)s</title>
+<style>
+body { font-family: monospace; }
+.row { display: flex; align-items: center; margin: 2px 0; }
+.label { width: 14em; }
+.timeline { position: relative; flex: 1; height: 24px; background: #eee; }
+.cut { position: absolute; top: 0; width: 2px; height: 100%%;
+       background: #c00; cursor: pointer; }
+.cut:hover { background: #00c; }
+#preview { position: fixed; pointer-events: none; display: none;
+           border: 1px solid #000; }
+</style>
+</head>
+<body>
+<h2>%(title)s</h2>
+<p>threshold / min_scene_len, %(duration)0.1f seconds, %(fps)0.3f fps</p>
+%(rows)s
+<img id="preview">
+<script>
+var images = %(images)s;
+var preview = document.getElementById('preview');
+document.querySelectorAll('.cut').forEach(function (cut) {
+  cut.addEventListener('mousemove', function (e) {
+    preview.src = images[cut.dataset.frame] || '';
+    preview.style.left = (e.clientX + 12) + 'px';
+    preview.style.top = (e.clientY + 12) + 'px';
+    preview.style.display = 'block';
+  });
+  cut.addEventListener('mouseleave', function () {
+    preview.style.display = 'none';
+  });
+});
+</script>
+</body>
+</html>
+''' % {'title': title, 'duration': duration, 'fps': video_fps,
+       'rows': '\n'.join(row_html), 'images': json.dumps(images)}
+    
+    with open(output, 'w') as f:
+        f.write(page)
+    
+    return output
+
+
+def contact_sheet_screen(video_file, thresholds, min_scene_lens, output_prefix,
+                         thumb_height=72):
+    """
+    Runs a full parameter screen and saves it as an image and an HTML page.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the video to screen
+    
+    thresholds, min_scene_lens
+      settings to try, see screen_scenes
+    
+    output_prefix
+      filepath prefix of the outputs, saved as prefix + '_screen.png' and
+      prefix + '_screen.html'
+    
+    thumb_height
+      height of the thumbnails in pixels
+    
+    Returns
+    --------
+    
+    outputs
+      tuple of the image and HTML filepaths
+    """
+    
+    video_fps, frames_read, rows = screen_scenes(video_file, thresholds,
+                                                 min_scene_lens)
+    
+    # Every cut frame of every row, decoded once
+    cut_frames = set()
+    for row in rows:
+        cut_frames.update(row['scene_list'])
+    thumbnails = collect_thumbnails(video_file, cut_frames, height=thumb_height)
+    
+    image = render_contact_sheet(rows, thumbnails, video_fps, frames_read,
+                                 output_prefix + '_screen.png',
+                                 title=video_file.split('/')[-1])
+    page = write_html_screen(rows, thumbnails, video_fps, frames_read,
+                             output_prefix + '_screen.html',
+                             title=video_file.split('/')[-1])
+    
+    return image, page
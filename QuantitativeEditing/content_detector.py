@@ -0,0 +1,168 @@
+"""A faster drop-in for PySceneDetect's ContentDetector.
+
+scenedetect.ContentDetector converts every frame to HSV, splits the channels,
+casts each of them to int32 and averages the absolute differences with the
+last frame in general purpose numpy code, allocating new arrays all along,
+and it keeps a full copy of the last frame besides. FastContentDetector
+computes the very same numbers (delta_hue, delta_sat, delta_lum and their
+mean, content_val) with the same threshold semantics, but:
+
+  * converts into preallocated uint8 HSV buffers, swapped between frames, so
+    the last frame's HSV is never recomputed or copied
+  * takes the absolute differences in uint8 with saturation-free integer
+    arithmetic (cv2.absdiff) and sums the three channels in one native call
+  * optionally only looks at every stride-th pixel of every stride-th row
+
+Sampling with a stride estimates the mean differences from n = (h / stride) *
+(w / stride) pixels instead of h * w. Every pixel's difference lies between 0
+and 255 (0 and 179 for the hue). If those n pixels were drawn independently
+at random, Hoeffding's inequality would put each delta, and content_val,
+within
+
+  255 * sqrt(ln(2 / (1 - confidence)) / (2 * n))
+
+of the full resolution value with the given confidence (sampling_error_bound).
+They aren't: the stride samples a fixed grid, and neighbouring pixels are
+strongly correlated, so this is only a heuristic for the typical error, not
+a guarantee. Pictures with detail at the scale of the grid (fine stripes or
+text about stride pixels apart) can be off by much more. For 1080p with a
+stride of 4 the heuristic gives about 1.4, well below the 20 to 40
+thresholds used for detection, but check the stride against full resolution
+detection on your own videos before relying on it.
+"""
+
+import math
+import cv2
+import numpy as np
+
+from scenedetect.scene_detector import SceneDetector
+
+
+def sampling_error_bound(frame_shape, stride, confidence=0.999):
+    """
+    Heuristic size of the error of content_val from sampling with a stride,
+    see the module docstring. Not a confidence bound, as the samples lie on a
+    fixed grid rather than being random. Returns 0 for a stride of 1.
+    """
+    
+    if stride <= 1:
+        return 0.0
+    
+    n = (-(-frame_shape[0] // stride)) * (-(-frame_shape[1] // stride))
+    
+    return 255.0 * math.sqrt(math.log(2.0 / (1.0 - confidence)) / (2.0 * n))
+
+
+class FastContentDetector(SceneDetector):
+    """Detects cuts from changes in the average HSV values between frames.
+    
+    Same detection and metrics as scenedetect.ContentDetector, see the module
+    docstring for how it gets there faster.
+    """
+    
+    def __init__(self, threshold=30.0, min_scene_len=15, stride=1):
+        super(FastContentDetector, self).__init__()
+        self.threshold = threshold
+        self.min_scene_len = min_scene_len
+        self.stride = stride
+        self.last_scene_cut = None
+        self._metric_keys = ['content_val', 'delta_hue', 'delta_sat',
+                             'delta_lum']
+        self.cli_name = 'detect-content'
+        
+        # Buffers are made for the first frame's size
+        self._sample = None
+        self._hsv = None
+        self._diff = None
+        self._num_pixels = None
+        self._current = 0
+        self._have_last = False
+    
+    def _allocate(self, frame_img):
+        """Makes the buffers for frames the size of frame_img."""
+        
+        shape = frame_img[::self.stride, ::self.stride].shape
+        if self.stride > 1:
+            self._sample = np.empty(shape, dtype=np.uint8)
+        self._hsv = [np.empty(shape, dtype=np.uint8),
+                     np.empty(shape, dtype=np.uint8)]
+        self._diff = np.empty(shape, dtype=np.uint8)
+        self._num_pixels = float(shape[0] * shape[1])
+    
+    def _to_hsv(self, frame_img):
+        """Converts a frame into the current HSV buffer."""
+        
+        if self._hsv is None:
+            self._allocate(frame_img)
+        
+        if self.stride > 1:
+            np.copyto(self._sample, frame_img[::self.stride, ::self.stride])
+            frame_img = self._sample
+        
+        cv2.cvtColor(frame_img, cv2.COLOR_BGR2HSV,
+                     dst=self._hsv[self._current])
+    
+    def process_frame(self, frame_num, frame_img):
+        # type: (int, numpy.ndarray) -> List[int]
+        """ Compares the HSV values of a frame with the last frame.
+        
+        Arguments:
+            frame_num (int): Frame number of frame that is being passed.
+            
+            frame_img (Optional[int]): Decoded frame image (numpy.ndarray) to
+                perform scene detection on. Can be None *only* if the metrics
+                of this frame and the next are already in the stats manager.
+        
+        Returns:
+            List[int]: List of frames where scene cuts have been detected.
+        """
+        cut_list = []
+        metric_keys = self._metric_keys
+        
+        if (self.stats_manager is not None and
+                self.stats_manager.metrics_exist(frame_num, metric_keys)):
+            content_val = self.stats_manager.get_metrics(
+                frame_num, metric_keys)[0]
+            
+            # The HSV of this frame is unknown, the next frame has to start
+            # over unless its metrics are cached too
+            self._have_last = False
+            if frame_img is not None:
+                self._to_hsv(frame_img)
+                self._current = 1 - self._current
+                self._have_last = True
+        
+        else:
+            self._to_hsv(frame_img)
+            content_val = None
+            
+            if self._have_last:
+                cv2.absdiff(self._hsv[self._current],
+                            self._hsv[1 - self._current], dst=self._diff)
+                sums = cv2.sumElems(self._diff)
+                delta_h, delta_s, delta_v = [total / self._num_pixels
+                                             for total in sums[:3]]
+                content_val = (delta_h + delta_s + delta_v) / 3.0
+                
+                if self.stats_manager is not None:
+                    self.stats_manager.set_metrics(frame_num, {
+                        metric_keys[0]: content_val,
+                        metric_keys[1]: delta_h,
+                        metric_keys[2]: delta_s,
+                        metric_keys[3]: delta_v})
+            
+            # This frame becomes the last frame
+            self._current = 1 - self._current
+            self._have_last = True
+        
+        if content_val is not None and content_val >= self.threshold:
+            if self.last_scene_cut is None or (
+                    (frame_num - self.last_scene_cut) >= self.min_scene_len):
+                cut_list.append(frame_num)
+                self.last_scene_cut = frame_num
+        
+        return cut_list
+    
+    def post_process(self, frame_num):
+        """ Not used, cuts are always reported as they are found."""
+        return []
@@ -0,0 +1,377 @@
+"""Editing statistics across the whole corpus of analyzed videos.
+
+Loads the latest detection run of every video from the results database
+(results_store.py) into flat numpy arrays with a single query: one entry per
+shot for the shot lengths and positions, and one per video for its genre,
+year and duration. Everything after that is vectorized over the whole corpus
+(bincount, histogram and fancy indexing), so even ten thousand videos take a
+few seconds:
+
+  shot_length_histograms  distribution of shot lengths for each group
+  edit_rate_curves        cuts per second along the song, with the position
+                          of each cut normalized to the length of its video
+  bootstrap_mean_ci       confidence intervals of per-video means by
+                          resampling the videos of each group
+
+Groups are any column of the videos table, usually genre or year.
+"""
+
+import numpy as np
+import matplotlib.pyplot as plt
+import results_store as rs
+
+
+def load_corpus(store, detector='content', threshold=None,
+                min_scene_len=None):
+    """
+    Loads the latest run of every video in a results store.
+    
+    Parameters
+    -----------
+    
+    store
+      results_store.ResultsStore to read from
+    
+    detector, threshold, min_scene_len
+      only runs with these settings are loaded, None matches any value
+    
+    Returns
+    --------
+    
+    corpus
+      dict of numpy arrays. Per video: 'video_id', 'artist', 'title',
+      'genre', 'year', 'duration' (sec) and 'n_scenes'. Per shot: 'video'
+      (index into the per video arrays), 'start' (sec) and 'length' (sec).
+    """
+    
+    videos = store.conn.execute(
+        'WITH latest AS (SELECT video_id, MAX(run_id) AS run_id FROM runs '
+        '    WHERE detector = ? AND (? IS NULL OR threshold = ?) '
+        '    AND (? IS NULL OR min_scene_len = ?) GROUP BY video_id) '
+        'SELECT v.video_id, l.run_id, v.artist, v.title, v.genre, v.year, '
+        '    r.duration, r.n_scenes '
+        'FROM latest l JOIN videos v ON v.video_id = l.video_id '
+        'JOIN runs r ON r.run_id = l.run_id ORDER BY l.run_id',
+        (detector, threshold, threshold, min_scene_len,
+         min_scene_len)).fetchall()
+    
+    corpus = {'video_id': np.array([row[0] for row in videos], dtype=int),
+              'artist': np.array([row[2] for row in videos], dtype=object),
+              'title': np.array([row[3] for row in videos], dtype=object),
+              'genre': np.array([row[4] or 'unknown' for row in videos],
+                                dtype=object),
+              'year': np.array([row[5] or 0 for row in videos], dtype=int),
+              'duration': np.array([row[6] for row in videos], dtype=float),
+              'n_scenes': np.array([row[7] for row in videos], dtype=int)}
+    
+    run_ids = np.array([row[1] for row in videos], dtype=int)
+    if not len(run_ids):
+        corpus.update(video=np.zeros(0, dtype=int), start=np.zeros(0),
+                      length=np.zeros(0))
+        return corpus
+    
+    # All of the shots at once, in the same run order as the videos
+    shots = np.array(store.conn.execute(
+        'SELECT run_id, start_msec, duration_msec FROM cuts '
+        'WHERE run_id IN (SELECT MAX(run_id) FROM runs '
+        '    WHERE detector = ? AND (? IS NULL OR threshold = ?) '
+        '    AND (? IS NULL OR min_scene_len = ?) GROUP BY video_id) '
+        'ORDER BY run_id, scene_idx',
+        (detector, threshold, threshold, min_scene_len,
+         min_scene_len)).fetchall(), dtype=float).reshape(-1, 3)
+    
+    corpus['video'] = np.searchsorted(run_ids, shots[:, 0].astype(int))
+    corpus['start'] = shots[:, 1] / 1000.0
+    corpus['length'] = shots[:, 2] / 1000.0
+    
+    return corpus
+
+
+def group_index(corpus, by='genre'):
+    """
+    Splits the videos of a corpus into groups.
+    
+    Returns the sorted unique group values and the group index of every video.
+    """
+    
+    return np.unique(corpus[by], return_inverse=True)
+
+
+def shot_length_histograms(corpus, by='genre', bins=None, density=True):
+    """
+    Histograms of shot lengths for each group.
+    
+    Parameters
+    -----------
+    
+    corpus
+      dict from load_corpus
+    
+    by
+      per video column to group by
+    
+    bins
+      bin edges in seconds, log spaced from 0.04 to 60 seconds if None
+    
+    density
+      normalize each histogram to a probability density
+    
+    Returns
+    --------
+    
+    groups
+      group values
+    
+    bins
+      bin edges in seconds
+    
+    counts
+      array of shape (groups, bins - 1)
+    """
+    
+    if bins is None:
+        bins = np.logspace(np.log10(0.04), np.log10(60), 41)
+    bins = np.asarray(bins, dtype=float)
+    n_bins = len(bins) - 1
+    
+    groups, video_group = group_index(corpus, by)
+    shot_group = video_group[corpus['video']]
+    
+    # One bincount over (group, bin) pairs instead of a histogram per group
+    shot_bin = np.searchsorted(bins, corpus['length'], side='right') - 1
+    inside = (shot_bin >= 0) & (shot_bin < n_bins)
+    counts = np.bincount(shot_group[inside] * n_bins + shot_bin[inside],
+                         minlength=len(groups) * n_bins)
+    counts = counts.reshape(len(groups), n_bins).astype(float)
+    
+    if density:
+        totals = counts.sum(axis=1, keepdims=True)
+        counts /= np.maximum(totals, 1) * np.diff(bins)
+    
+    return groups, bins, counts
+
+
+def edit_rate_matrix(corpus, n_positions=50):
+    """
+    Cuts per second of every video along its length.
+    
+    Each video is split into n_positions equal parts, and the rate of cuts is
+    counted in each part. The first scene of a video doesn't start with a
+    cut, so it isn't counted.
+    
+    Returns an array of shape (videos, n_positions).
+    """
+    
+    n_videos = len(corpus['duration'])
+    
+    # Drop the first scene of each video, which starts at 0 without a cut.
+    # Shots are sorted by video, so it's wherever the video changes.
+    is_cut = np.ones(len(corpus['video']), dtype=bool)
+    is_cut[1:] = corpus['video'][1:] == corpus['video'][:-1]
+    is_cut[:1] = False
+    is_cut &= corpus['start'] > 0
+    
+    video = corpus['video'][is_cut]
+    duration = corpus['duration'][video]
+    position = np.minimum((corpus['start'][is_cut] / duration *
+                           n_positions).astype(int), n_positions - 1)
+    
+    counts = np.bincount(video * n_positions + position,
+                         minlength=n_videos * n_positions)
+    counts = counts.reshape(n_videos, n_positions)
+    
+    return counts / (corpus['duration'][:, np.newaxis] / n_positions)
+
+
+def bootstrap_mean_ci(values, group, n_groups, n_boot=1000, ci=95,
+                      seed=0):
+    """
+    Means of per video values for each group with bootstrap confidence
+    intervals.
+    
+    Parameters
+    -----------
+    
+    values
+      array of shape (videos,) or (videos, k) of per video values
+    
+    group
+      group index of every video, from group_index
+    
+    n_groups
+      number of groups
+    
+    n_boot
+      number of bootstrap resamples
+    
+    ci
+      width of the confidence interval in percent
+    
+    seed
+      seed of the random resampling, for repeatable results
+    
+    Returns
+    --------
+    
+    mean, low, high
+      arrays of shape (n_groups,) or (n_groups, k)
+    """
+    
+    values = np.asarray(values, dtype=float)
+    rng = np.random.RandomState(seed)
+    
+    shape = (n_groups,) + values.shape[1:]
+    mean = np.full(shape, np.nan)
+    low = np.full(shape, np.nan)
+    high = np.full(shape, np.nan)
+    
+    order = np.argsort(group, kind='mergesort')
+    bounds = np.searchsorted(group[order], np.arange(n_groups + 1))
+    
+    for group_idx in range(n_groups):
+        members = values[order[bounds[group_idx]:bounds[group_idx + 1]]]
+        if not len(members):
+            continue
+        
+        # Every resample at once, as the number of times each video is drawn,
+        # which turns the resampled means into one matrix product
+        draws = rng.multinomial(len(members),
+                                np.full(len(members), 1.0 / len(members)),
+                                size=n_boot)
+        boot_means = draws.dot(members) / float(len(members))
+        
+        mean[group_idx] = members.mean(axis=0)
+        low[group_idx] = np.percentile(boot_means, (100 - ci) / 2.0, axis=0)
+        high[group_idx] = np.percentile(boot_means, 100 - (100 - ci) / 2.0,
+                                        axis=0)
+    
+    return mean, low, high
+
+
+def edit_rate_curves(corpus, by='genre', n_positions=50, n_boot=1000, ci=95):
+    """
+    Average cuts per second along the length of the song for each group.
+    
+    Returns the group values, the relative positions (0 to 1) of the middle of
+    each part of the songs and the mean, low and high curves of shape
+    (groups, n_positions), see bootstrap_mean_ci.
+    """
+    
+    groups, video_group = group_index(corpus, by)
+    rates = edit_rate_matrix(corpus, n_positions)
+    positions = (np.arange(n_positions) + 0.5) / n_positions
+    
+    mean, low, high = bootstrap_mean_ci(rates, video_group, len(groups),
+                                        n_boot=n_boot, ci=ci)
+    
+    return groups, positions, mean, low, high
+
+
+def mean_shot_length(corpus):
+    """Average shot length in seconds of every video."""
+    
+    total = np.bincount(corpus['video'], weights=corpus['length'],
+                        minlength=len(corpus['duration']))
+    count = np.bincount(corpus['video'], minlength=len(corpus['duration']))
+    
+    return total / np.maximum(count, 1)
+
+
+def plot_shot_length_histograms(corpus, output, by='genre'):
+    """Saves a plot of the shot length distribution of each group."""
+    
+    groups, bins, counts = shot_length_histograms(corpus, by=by)
+    centers = np.sqrt(bins[:-1] * bins[1:])
+    
+    fig, ax = plt.subplots(1, figsize=(8, 5), facecolor='white')
+    for group, count in zip(groups, counts):
+        ax.plot(centers, count, '-', label=str(group))
+    ax.set_xscale('log')
+    ax.set_title('Shot Length Distribution by %s' % by.title())
+    ax.set_xlabel('Shot Length (sec)')
+    ax.set_ylabel('Density')
+    ax.legend()
+    plt.tight_layout()
+    fig.savefig(output, dpi=100)
+    plt.close(fig)
+    
+    return output
+
+
+def plot_edit_rate_curves(corpus, output, by='genre', n_positions=50):
+    """Saves a plot of the edit rate along the song for each group."""
+    
+    groups, positions, mean, low, high = edit_rate_curves(
+        corpus, by=by, n_positions=n_positions)
+    
+    fig, ax = plt.subplots(1, figsize=(8, 5), facecolor='white')
+    for group_idx, group in enumerate(groups):
+        line, = ax.plot(positions * 100, mean[group_idx], '-',
+                        label=str(group))
+        ax.fill_between(positions * 100, low[group_idx], high[group_idx],
+                        color=line.get_color(), alpha=0.2)
+    ax.set_title('Rate of Scene Transitions by %s' % by.title())
+    ax.set_xlabel('Position in Song (%)')
+    ax.set_ylabel('Transitions per Second')
+    ax.legend()
+    plt.tight_layout()
+    fig.savefig(output, dpi=100)
+    plt.close(fig)
+    
+    return output
+
+
+def plot_shot_length_by_year(corpus, output, by='genre'):
+    """
+    Saves a plot of the average shot length over the years for each group,
+    with bootstrap confidence intervals.
+    """
+    
+    groups, video_group = group_index(corpus, by)
+    years, video_year = group_index(corpus, 'year')
+    shot_length = mean_shot_length(corpus)
+    
+    # Bootstrap every (group, year) cell at once
+    cell = video_group * len(years) + video_year
+    mean, low, high = bootstrap_mean_ci(shot_length, cell,
+                                        len(groups) * len(years))
+    mean = mean.reshape(len(groups), len(years))
+    low = low.reshape(len(groups), len(years))
+    high = high.reshape(len(groups), len(years))
+    
+    fig, ax = plt.subplots(1, figsize=(8, 5), facecolor='white')
+    for group_idx, group in enumerate(groups):
+        has_data = ~np.isnan(mean[group_idx])
+        ax.errorbar(years[has_data], mean[group_idx][has_data],
+                    yerr=[mean[group_idx][has_data] - low[group_idx][has_data],
+                          high[group_idx][has_data] - mean[group_idx][has_data]],
+                    fmt='o-', capsize=3, label=str(group))
+    ax.set_title('Average Shot Length by Year')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Average Shot Length (sec)')
+    ax.legend()
+    plt.tight_layout()
+    fig.savefig(output, dpi=100)
+    plt.close(fig)
+    
+    return output
+
+
+if __name__ == '__main__':
+
+    # Results database and the settings of the runs to compare
+    results_db = 'results.sqlite'
+    threshold = None
+    min_scene_len = None
+    
+    store = rs.ResultsStore(results_db)
+    corpus = load_corpus(store, threshold=threshold,
+                         min_scene_len=min_scene_len)
+    store.close()
+    
+    print('Loaded %d videos with %d shots' % (len(corpus['duration']),
+                                              len(corpus['length'])))
+    
+    plot_shot_length_histograms(corpus, 'corpus_shot_lengths.png')
+    plot_edit_rate_curves(corpus, 'corpus_edit_rates.png')
+    plot_shot_length_by_year(corpus, 'corpus_shot_length_by_year.png')
@@ -0,0 +1,172 @@
+"""Finding and cropping away letterbox and pillarbox borders.
+
+Many music videos are letterboxed to 2.39:1 or pillarboxed inside a 16:9
+frame. The black borders never change, but every detector still converts and
+compares them on every frame, which costs time and waters down the average
+change in content between frames.
+
+detect_crop looks at a few dozen frames spread over the video (each one
+grabbed with a seek, so the video isn't decoded) and finds the borders that
+stay black in all of them. Frames that are black all over, like fades, are
+left out. The active region is only ever grown to fit every sample, so
+subtitles or logos that show up in a border keep that border uncropped.
+
+The crop is then applied either in Python, by wrapping a detector in a
+CroppedDetector that hands it only the active region of each frame (and
+records the crop in the stats file), or in ffmpeg with crop_filter for frames
+read through an ffmpeg pipe.
+"""
+
+import numpy as np
+import ffmpeg_utils as fu
+
+from scenedetect.scene_detector import SceneDetector
+
+
+# Luminance at or below which a row or column counts as black (video black is
+# 16, this leaves room for compression noise)
+BLACK_LEVEL = 24
+
+# Borders thinner than this share of the frame are not worth cropping
+MIN_BORDER = 0.02
+
+
+def detect_crop(video_file, samples=32, black_level=BLACK_LEVEL,
+                min_border=MIN_BORDER):
+    """
+    Finds the black borders of a video.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the video
+    
+    samples
+      number of frames to look at, spread over the video
+    
+    black_level
+      luminance at or below which a pixel counts as black
+    
+    min_border
+      borders thinner than this share of the width or height are ignored
+    
+    Returns
+    --------
+    
+    crop
+      (x, y, width, height) of the active region in pixels, or None if the
+      video has no borders worth cropping
+    """
+    
+    # Probe once, the sample decodes are given the size
+    info = fu.probe_video(video_file)
+    W, H = info['width'], info['height']
+    
+    # Stay clear of the fades at the start and end
+    times = np.linspace(0.05, 0.95, samples) * info['duration']
+    
+    top, bottom, left, right = H, 0, W, 0
+    
+    for start_time in times:
+        frames = fu.iter_frames(video_file, size=(W, H), pix_fmt='gray',
+                                start_time=start_time)
+        frame = next(frames, None)
+        if frame is not None:
+            rows = np.flatnonzero(frame.max(axis=1) > black_level)
+            cols = np.flatnonzero(frame.max(axis=0) > black_level)
+        frames.close()
+        
+        # Black all over, tells nothing about the borders
+        if frame is None or not len(rows):
+            continue
+        
+        top, bottom = min(top, rows[0]), max(bottom, rows[-1] + 1)
+        left, right = min(left, cols[0]), max(right, cols[-1] + 1)
+    
+    if bottom <= top:
+        return None
+    
+    # Ignore thin borders, and keep the crop on even pixels for yuv420p
+    if top < min_border * H:
+        top = 0
+    if H - bottom < min_border * H:
+        bottom = H
+    if left < min_border * W:
+        left = 0
+    if W - right < min_border * W:
+        right = W
+    if (left, top, right, bottom) == (0, 0, W, H):
+        return None
+    
+    x, y = (left + 1) // 2 * 2, (top + 1) // 2 * 2
+    
+    return (x, y, (right - x) // 2 * 2, (bottom - y) // 2 * 2)
+
+
+def crop_filter(crop):
+    """ffmpeg crop filter for a crop from detect_crop."""
+    
+    return 'crop=%d:%d:%d:%d' % (crop[2], crop[3], crop[0], crop[1])
+
+
+def scale_crop(crop, factor):
+    """
+    A crop from detect_crop for frames downscaled by factor (see
+    detect_scenes.analyze_video), rounded to whole pixels.
+    """
+    
+    return tuple(int(value // factor) for value in crop)
+
+
+class CroppedDetector(SceneDetector):
+    """
+    Runs another scenedetect detector (ContentDetector, EdgeDetector,
+    FastContentDetector, ...) on the active region of every frame only.
+    
+    The crop is recorded in the stats file next to the detector's own
+    metrics, as the crop_x, crop_y, crop_w and crop_h of every frame.
+    """
+    
+    def __init__(self, detector, crop):
+        """
+        Parameters
+        -----------
+        
+        detector
+          scenedetect detector to wrap
+        
+        crop
+          (x, y, width, height) of the region to keep, in pixels of the frames
+          the detector is given
+        """
+        
+        super(CroppedDetector, self).__init__()
+        self.detector = detector
+        self.crop = crop
+        self._crop_keys = ['crop_x', 'crop_y', 'crop_w', 'crop_h']
+        self._metric_keys = self.detector.get_metrics() + self._crop_keys
+    
+    def is_processing_required(self, frame_num):
+        
+        self.detector.stats_manager = self.stats_manager
+        
+        return self.detector.is_processing_required(frame_num)
+    
+    def process_frame(self, frame_num, frame_img):
+        
+        x, y, w, h = self.crop
+        self.detector.stats_manager = self.stats_manager
+        
+        if self.stats_manager is not None:
+            self.stats_manager.set_metrics(frame_num, dict(
+                zip(self._crop_keys, self.crop)))
+        
+        if frame_img is not None:
+            frame_img = frame_img[y:y + h, x:x + w]
+        
+        return self.detector.process_frame(frame_num, frame_img)
+    
+    def post_process(self, frame_num):
+        
+        return self.detector.post_process(frame_num)
@@ -1,13 +1,17 @@
 import scenedetect
 import numpy as np
 import csv
+import annotation as an
+import content_detector as cd
+import crop_detect as cdt
 
 from moviepy.editor import *
 from scenedetect.stats_manager import StatsManager
 
 
 def analyze_video(video_file, threshold=40, min_scene_len=15, stats_file=None,
-                  downscale_factor=1):
+                  downscale_factor=1, shot_hasher=None, prefilter=None,
+                  detector='content', stride=1, crop=None):
     """
     Analyzes a given video filepath for scene transitions.
     
@@ -31,6 +35,29 @@ def analyze_video(video_file, threshold=40, min_scene_len=15, stats_file=None,
       roughly linear effect on processing speed (having a downscale_facter of 2
       roughly double the speed of video analysis).
     
+    shot_hasher
+      optional shot_index.ShotHasher to hash the frames with during the same
+      pass, for finding reused shots afterwards
+    
+    prefilter
+      'packets' or 'scene' to only detect around the likely cuts found by a
+      cheap first pass, see prefilter.py. Quicker, but may miss a few cuts.
+      Can't be combined with stats_file or shot_hasher.
+    
+    detector
+      'content' for scenedetect's ContentDetector, 'fast' for the quicker
+      content_detector.FastContentDetector, which gives the same results
+    
+    stride
+      with the 'fast' detector, only look at every stride-th pixel and row,
+      see content_detector.sampling_error_bound for a rough estimate of
+      the error it adds
+    
+    crop
+      (x, y, width, height) of the region of the frames to analyze, or 'auto'
+      to crop away letterbox or pillarbox borders found by
+      crop_detect.detect_crop. The crop used is saved in the stats_file.
+    
     Returns
     --------
     
@@ -47,15 +74,44 @@ def analyze_video(video_file, threshold=40, min_scene_len=15, stats_file=None,
       list of detected scenes from input video with given settings 
     """
     
+    if prefilter:
+        if stats_file or shot_hasher is not None:
+            raise ValueError('stats_file and shot_hasher need every frame, '
+                             'they cannot be used with a prefilter')
+        
+        import prefilter as pf
+        
+        return pf.analyze_video(video_file, threshold=threshold,
+                                min_scene_len=min_scene_len,
+                                downscale_factor=downscale_factor,
+                                method=prefilter, crop=crop)
+    
     # First, load into a video manager
     video_mgr = scenedetect.VideoManager([video_file])
     stats_mgr = StatsManager()
     scene_mgr = scenedetect.SceneManager(stats_mgr)
     
     # Add a content detector
-    scene_mgr.add_detector(
-        scenedetect.ContentDetector(threshold=threshold,
-                                    min_scene_len=min_scene_len))
+    if detector == 'fast':
+        detectors = [cd.FastContentDetector(threshold=threshold,
+                                            min_scene_len=min_scene_len,
+                                            stride=stride)]
+    else:
+        detectors = [scenedetect.ContentDetector(threshold=threshold,
+                                                 min_scene_len=min_scene_len)]
+    
+    if shot_hasher is not None:
+        detectors.append(shot_hasher)
+    
+    # Only look at the active region of letterboxed or pillarboxed videos
+    if crop == 'auto':
+        crop = cdt.detect_crop(video_file)
+    if crop:
+        crop = cdt.scale_crop(crop, downscale_factor)
+        detectors = [cdt.CroppedDetector(det, crop) for det in detectors]
+    
+    for det in detectors:
+        scene_mgr.add_detector(det)
     
     # Get the starting timecode
     base_timecode = video_mgr.get_base_timecode()
@@ -94,6 +150,60 @@ def analyze_video(video_file, threshold=40, min_scene_len=15, stats_file=None,
     return (video_fps, frames_read, frames_processed, scene_list)
 
 
+def scene_table(scene_list, video_fps, frames_read, pts_index=None):
+    """
+    Builds the table of scene breaks that gets saved alongside each analysis.
+    
+    Parameters
+    -----------
+    
+    scene_list
+      list of frames at which each scene starts, as returned by analyze_video
+    
+    video_fps
+      frames per second of the video
+    
+    frames_read
+      total number of frames in the video
+    
+    pts_index
+      optional pts_index.PTSIndex of the video, to take the times from the
+      actual frame timestamps instead of assuming a constant frame rate
+    
+    Returns
+    --------
+    
+    scene_array
+      numpy array with one row per scene break plus a final row for the end of
+      the video. Columns are:
+      | scene break (frame) | scene break (msec) | scene duration (msec) |
+    """
+    
+    # Convert the scene list to milliseconds
+    scene_list_array = np.array(scene_list)
+    if pts_index is not None:
+        scene_list_array_msec = pts_index.frame_msec(scene_list_array)
+        total_duration_msec = float(pts_index.frame_msec(frames_read))
+    else:
+        scene_list_array_msec = (1000.0 * scene_list_array) / float(video_fps)
+        total_duration_msec = frames_read / float(video_fps) * 1000
+    
+    # Stack the scene data together
+    scene_array = np.column_stack((scene_list_array, scene_list_array_msec))
+    
+    # Tack on the last row signifying the end of the video
+    end_row = np.array([frames_read, total_duration_msec])
+    end_row = end_row.reshape((1, 2))
+    scene_array = np.vstack((scene_array, end_row))
+    
+    # Calculate the duration of each scene in msec
+    scene_lens_msec = np.diff(np.insert(np.append(scene_list_array_msec,
+                                                  total_duration_msec), 0, 0))
+    
+    # Tack on a column of the length of each scene in msec
+    return np.column_stack((scene_array, scene_lens_msec))
+
+
 if __name__ == '__main__':
     
     # Specify video file and constants here
@@ -144,55 +254,11 @@ if __name__ == '__main__':
     mv_clip = VideoFileClip(video_file)
     W, H = mv_clip.size
     
-    scene = 0
-    previous_scene_msec = 0
-    textclip_list = []
+    # Calculate the total duration of the video
+    total_duration_msec = frames_read / float(video_fps) * 1000
     
-    # Loop over list of scenes, creating TextClips for each scene
-    for scene_idx in range(len(scene_list_msec) + 1):
-        
-        # Each iteration is the same except for the final scene which is
-        # handled separately in the else statement
-        if scene_idx != len(scene_list_msec):
-            
-            # Calculate duration of the scene in seconds
-            duration = (scene_list_msec[scene_idx] - previous_scene_msec) / 1000
-            
-            # Record ending time of scene for the next loop
-            previous_scene_msec = scene_list_msec[scene_idx]
-            
-            # Make the video clips of the numbers
-            txtclip = TextClip("%03d" % scene_idx, fontsize=288, color='white',
-                               font='FreeMono-Bold', stroke_color='black',
-                               stroke_width=5).set_pos('center').\
-                               set_duration(duration).set_opacity(0.6)
-            
-            # Add the clip to a list of all the TextClips
-            textclip_list.append(txtclip)
-        
-        # Last scene needs special treatment
-        else:
-            
-            # Calculate the total duration of the video
-            total_duration_msec = frames_read / float(video_fps) * 1000
-            
-            # Calculate the duration of the final scene
-            clip_duration = (total_duration_msec - previous_scene_msec) / 1000
-            
-            # Create the TextClip for the final scene
-            txtclip = TextClip("%03d" % scene_idx, fontsize=288, color='white',
-                               font='FreeMono-Bold', stroke_color='black',
-                               stroke_width=5).set_pos('center').\
-                               set_duration(clip_duration).set_opacity(0.6)
-            
-            # Add it to the list of other TextClips
-            textclip_list.append(txtclip)
-    
-    # Play the TextClips one after the other
-    final_textclip = concatenate_videoclips(textclip_list).set_pos('center')
-    
-    # Play the TextClips over the original video
-    final_video = CompositeVideoClip([mv_clip, final_textclip])
+    # Draw the scene numbers over the original video
+    final_video = an.annotate_video(mv_clip, scene_list, video_fps)
     
     # Save resulting video to file
     final_video.write_videofile('BTS_2017_DNA_Annotated_' + str(threshold) + 
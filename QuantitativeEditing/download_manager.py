@@ -0,0 +1,266 @@
+"""Downloads many videos at once.
+
+video_downloader.download_video fetches one video at a time. For filling a
+corpus of hundreds of videos, DownloadManager runs the downloads on a pool of
+threads while limiting how many go to the same host at once, retries failed
+downloads with exponential backoff and skips videos that were already
+downloaded. Each URL is only downloaded (and its metadata fetched) once, even
+if it appears several times in the list.
+
+A finished download leaves a small record next to the video, output +
+'.download.json', with the URL, the filepath and the size of the video. A
+video counts as already downloaded when that record exists and the file it
+names is still there with the same size, so a half finished download from an
+interrupted run is downloaded again. Videos downloaded without the record
+(by video_downloader.download_video, or before the records existed) are
+recognized by a finished output.<ext> file, one youtube-dl has renamed from
+its .part file and merged.
+
+The extractor is pluggable: anything that behaves like youtube_dl.YoutubeDL
+(a context manager with extract_info and prepare_filename) can be passed in
+as extractor_factory, which is how the manager can be run offline against a
+stand-in that copies local files or fetches from a local HTTP server.
+"""
+
+import os
+import glob
+import json
+import time
+import random
+import threading
+import concurrent.futures as cf
+import video_downloader as vd
+
+from urllib.parse import urlparse
+
+
+def record_path(output):
+    """Filepath of the record left by a finished download."""
+    
+    return output + '.download.json'
+
+
+# Extensions youtube-dl gives files that aren't finished videos
+PARTIAL_EXTENSIONS = ('part', 'ytdl', 'json')
+
+
+def finished_file(output):
+    """
+    Returns the filepath of a finished video at output + '.<ext>' without a
+    download record, None if there is none.
+    
+    Unfinished downloads end in .part, and the separate streams of a merged
+    format (output.f137.mp4) or the merge in progress (output.temp.mkv) have
+    an extra dot, so only a single plain extension counts.
+    """
+    
+    for video_file in sorted(glob.glob(glob.escape(output) + '.*')):
+        ext = video_file[len(output) + 1:]
+        if '.' in ext or ext in PARTIAL_EXTENSIONS:
+            continue
+        if os.path.isfile(video_file) and \
+                not os.path.exists(video_file + '.part'):
+            return video_file
+    
+    return None
+
+
+def already_downloaded(output):
+    """
+    Returns the filepath of the video if it was completely downloaded to
+    output by an earlier run, None otherwise.
+    
+    Without a download record, falls back to finished_file and leaves a
+    record for it.
+    """
+    
+    try:
+        with open(record_path(output)) as f:
+            record = json.load(f)
+    
+    except IOError:
+        video_file = finished_file(output)
+        if video_file:
+            with open(record_path(output), 'w') as f:
+                json.dump({'url': None, 'video_file': video_file,
+                           'size': os.path.getsize(video_file)}, f)
+        return video_file
+    
+    except ValueError:
+        return None
+    
+    video_file = record.get('video_file')
+    if video_file and os.path.isfile(video_file) and \
+            os.path.getsize(video_file) == record.get('size'):
+        return video_file
+    
+    return None
+
+
+class DownloadManager(object):
+    """Runs downloads in parallel, see the module docstring."""
+    
+    def __init__(self, workers=8, per_host=3, retries=3, backoff=5.0,
+                 quiet=True, extractor_factory=None):
+        """
+        Parameters
+        -----------
+        
+        workers
+          number of downloads running at once
+        
+        per_host
+          number of downloads running at once from any one host
+        
+        retries
+          number of times to retry a failed download
+        
+        backoff
+          seconds to wait before the first retry, doubled for each retry after
+          that, with some random jitter
+        
+        quiet
+          suppress youtube-dl's output
+        
+        extractor_factory
+          callable taking a youtube-dl options dict and returning an object
+          that behaves like youtube_dl.YoutubeDL, youtube_dl.YoutubeDL if None
+        """
+        
+        if extractor_factory is None:
+            extractor_factory = vd.youtube_dl.YoutubeDL
+        
+        self.workers = workers
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.quiet = quiet
+        self.extractor_factory = extractor_factory
+        
+        self._host_limits = {}
+        self._lock = threading.Lock()
+    
+    def _host_limit(self, url):
+        """Semaphore limiting the downloads from the host of a url."""
+        
+        host = urlparse(url).netloc.lower()
+        
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(
+                    self.per_host)
+            
+            return self._host_limits[host]
+    
+    def _fetch(self, url, output):
+        """Downloads a single video, returns its filepath."""
+        
+        with self._host_limit(url):
+            with self.extractor_factory(vd.ydl_options(output,
+                                                       self.quiet)) as ydl:
+                result = ydl.extract_info(url, download=True)
+                video_file = vd.output_filename(ydl, result)
+        
+        # Leave a record so later runs can skip this video
+        record = {'url': url, 'video_file': video_file,
+                  'size': os.path.getsize(video_file)}
+        with open(record_path(output), 'w') as f:
+            json.dump(record, f)
+        
+        return video_file
+    
+    def download(self, url, output):
+        """
+        Downloads a video unless it is already there, retrying on failure.
+        
+        Parameters
+        -----------
+        
+        url
+          url of the video
+        
+        output
+          filepath to save the video to, without the extension, same as in
+          video_downloader.download_video
+        
+        Returns
+        --------
+        
+        result
+          dict with the 'url', 'output', the 'video_file' (None if it
+          failed), the 'status' ('skipped', 'downloaded' or 'failed'), the
+          number of 'attempts' and the last 'error', if any
+        """
+        
+        result = {'url': url, 'output': output, 'video_file': None,
+                  'status': 'skipped', 'attempts': 0, 'error': None}
+        
+        result['video_file'] = already_downloaded(output)
+        if result['video_file']:
+            return result
+        
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1) *
+                           random.uniform(0.5, 1.5))
+            
+            result['attempts'] = attempt + 1
+            
+            try:
+                result['video_file'] = self._fetch(url, output)
+                result['status'] = 'downloaded'
+                result['error'] = None
+                return result
+            
+            except Exception as err:
+                result['error'] = '%s: %s' % (type(err).__name__, err)
+        
+        result['status'] = 'failed'
+        
+        return result
+    
+    def download_all(self, downloads):
+        """
+        Downloads a list of videos in parallel.
+        
+        Parameters
+        -----------
+        
+        downloads
+          list of (url, output) tuples. Repeated urls are only downloaded
+          once, to the first output given for them.
+        
+        Returns
+        --------
+        
+        results
+          list of result dicts as returned by download, one for each entry of
+          downloads and in the same order. Repeats of a url get the result of
+          its download with the status 'duplicate'.
+        """
+        
+        # Only download each url once
+        first_output = {}
+        for url, output in downloads:
+            first_output.setdefault(url.strip(), output)
+        
+        with cf.ThreadPoolExecutor(self.workers) as executor:
+            futures = dict((url, executor.submit(self.download, url, output))
+                           for url, output in first_output.items())
+            
+            done = 0
+            for future in cf.as_completed(futures.values()):
+                done += 1
+                result = future.result()
+                print('[%d/%d] %s %s' % (done, len(futures), result['status'],
+                                         result['url']))
+        
+        results = []
+        for url, output in downloads:
+            result = dict(futures[url.strip()].result())
+            if output != first_output[url.strip()] and \
+                    result['status'] != 'failed':
+                result['status'] = 'duplicate'
+            results.append(result)
+        
+        return results
@@ -0,0 +1,456 @@
+"""Renders the final analysis layout as a single ffmpeg filter graph.
+
+The moviepy composition in complete_process.py resizes, stacks, overlays and
+concatenates every frame in Python. This module turns the same layout into one
+ffmpeg filter_complex graph (drawtext, scale, pad, vstack, hstack, overlay and
+concat) so the whole final composition runs as a single native process.
+
+Layout of the output, matching the moviepy version:
+
+  +---------------------------+--------+
+  |                           | graph1 |
+  |  annotated video, scaled  +--------+
+  |     [audio waveform]      | graph2 |
+  +---------------------------+--------+
+  then the results screen, then the longest scene with its captions.
+"""
+
+import os
+import shutil
+import tempfile
+import detect_scenes as ds
+import subtitles as sub
+import ffmpeg_utils as fu
+import workspace as wsp
+
+
+# Font used by drawtext, the same FreeMono Bold that the TextClips use
+DEFAULT_FONTFILE = '/usr/share/fonts/truetype/freefont/FreeMonoBold.ttf'
+
+# Audio format every part is converted to before they are joined
+AUDIO_FORMAT = 'aresample=44100,aformat=sample_fmts=fltp:channel_layouts=stereo'
+
+
+def _escape(value):
+    """Escapes a filter option value for use inside a filter graph."""
+    
+    # First for the option parser, then for the filter graph parser
+    for char in "\\':":
+        value = value.replace(char, '\\' + char)
+    for char in "\\'[],;":
+        value = value.replace(char, '\\' + char)
+    
+    return value
+
+
+def _even(value):
+    """Rounds value down to an even integer, as required by yuv420p."""
+    
+    return int(value) // 2 * 2
+
+
+def analysis_layout(video_file, scene_list, video_fps, frames_read, video_size,
+                    graphs, result_text, longest_scene, audio_graph=None,
+                    include_audio=True, fontfile=DEFAULT_FONTFILE,
+                    text_scale=1.0, pts_index=None, graph_size=None):
+    """
+    Describes the final analysis video.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the source video
+    
+    scene_list
+      list of frames at which each scene starts, from analyze_video
+    
+    video_fps
+      frames per second of the video
+    
+    frames_read
+      total number of frames in the video
+    
+    video_size
+      (width, height) of the source video
+    
+    graphs
+      list of the two rendered graph animations to stack on the right
+    
+    result_text
+      list of lines to show on the results screen
+    
+    longest_scene
+      (start, end) in seconds of the scene to replay at the end
+    
+    audio_graph
+      optional rendered audio waveform animation to overlay at the bottom of
+      the annotated video
+    
+    include_audio
+      whether to keep the audio of the source video
+    
+    fontfile
+      font used for all of the text
+    
+    text_scale
+      factor to scale all text by, for renders below the source resolution
+    
+    pts_index
+      optional pts_index.PTSIndex of the video, for exact scene times with
+      variable frame rates
+    
+    graph_size
+      (width, height) of each graph animation, probed from the graphs if
+      None. Needed when the graphs are only drawn while rendering, see
+      segment_render.render_segments.
+    
+    Returns
+    --------
+    
+    layout
+      dict describing the layout, to pass to render_layout
+    """
+    
+    W, H = video_size
+    if graph_size is None:
+        graph_info = [fu.probe_video(graph) for graph in graphs]
+        graph_w = _even(max(info['width'] for info in graph_info))
+    else:
+        graph_w = _even(graph_size[0])
+    scenes = ds.scene_table(scene_list, video_fps, frames_read, pts_index)
+    
+    layout = {'video': os.path.abspath(video_file),
+              'size': (W, H),
+              'fps': float(video_fps),
+              'duration': scenes[-1, 1] / 1000.0,
+              'scenes': scenes,
+              'pts_index': pts_index,
+              'graphs': [os.path.abspath(graph) for graph in graphs],
+              'graph_size': (graph_w, _even(H / len(graphs))),
+              'audio_graph': None,
+              'include_audio': include_audio,
+              'result_text': result_text,
+              'result_duration': 7.5,
+              'longest_scene': longest_scene,
+              'label_fontsize': int(round(288 * text_scale)),
+              'result_fontsize': int(round(72 * text_scale)),
+              'caption_fontsize': int(round(144 * text_scale)),
+              'label_border': max(1, int(round(5 * text_scale))),
+              'caption_border': max(1, int(round(3 * text_scale))),
+              'opacity': 0.6,
+              'fontfile': fontfile}
+    
+    if audio_graph:
+        audio_info = fu.probe_video(audio_graph)
+        layout['audio_graph'] = os.path.abspath(audio_graph)
+        layout['audio_graph_size'] = (audio_info['width'], audio_info['height'])
+    
+    return layout
+
+
+def layout_geometry(layout):
+    """
+    Returns the (main_w, main_h, out_w, out_h) of a layout: the size of the
+    scaled down annotated video and the size of the whole output.
+    """
+    
+    W, H = layout['size']
+    graph_w = layout['graph_size'][0]
+    main_w = _even(W - graph_w)
+    main_h = _even(H * main_w / float(W))
+    
+    return main_w, main_h, main_w + graph_w, _even(H)
+
+
+def _drawtext(layout, text=None, textfile=None, fontsize=72, x='(w-tw)/2',
+              y='(h-th)/2', border=0, opacity=1.0, enable=None):
+    """Builds a single drawtext filter."""
+    
+    options = ['fontfile=' + _escape(layout['fontfile'])]
+    
+    if textfile:
+        options.append('textfile=' + _escape(textfile))
+    else:
+        options.append('text=' + _escape(text))
+    
+    options += ['expansion=none',
+                'fontsize=%d' % fontsize,
+                'fontcolor=white@%0.2f' % opacity,
+                'x=%s' % x, 'y=%s' % y]
+    
+    if border:
+        options += ['borderw=%d' % border, 'bordercolor=black@%0.2f' % opacity]
+    
+    if enable:
+        options.append('enable=' + _escape(enable))
+    
+    return 'drawtext=' + ':'.join(options)
+
+
+def scene_labels(layout, start=0.0, end=None):
+    """
+    Scene numbers shown in a stretch of the source video.
+    
+    Returns a list of (scene number, start, end) of the scenes playing
+    between start and end seconds (the end of the video if None), with the
+    times in seconds counted from start.
+    """
+    
+    labels = []
+    for scene_idx, start_msec, end_msec in sub.scene_rows(layout['scenes']):
+        scene_start = start_msec / 1000.0 - start
+        scene_end = end_msec / 1000.0 - start
+        if scene_end <= 0 or (end is not None and
+                              scene_start >= end - start):
+            continue
+        labels.append((scene_idx, scene_start, scene_end))
+    
+    return labels
+
+
+def body_filters(layout, start=0.0, duration=None):
+    """
+    Filters composing the annotated video with its graphs (and audio
+    waveform) into [body], for the inputs 0 (source video), 1 and 2 (graphs)
+    and 3 (audio waveform, if the layout has one).
+    
+    start and duration select a stretch of the body in seconds, the inputs
+    must then be seeked to start already. The whole body if duration is None.
+    """
+    
+    fps = layout['fps']
+    graph_w, graph_h = layout['graph_size']
+    main_w, main_h, out_w, out_h = layout_geometry(layout)
+    
+    if duration is None:
+        duration = layout['duration'] - start
+    
+    filters = []
+    
+    # Scene numbers drawn onto the source at full size, like the moviepy
+    # composite
+    labels = []
+    for scene_idx, scene_start, scene_end in scene_labels(
+            layout, start, start + duration):
+        enable = 'gte(t,%0.3f)*lt(t,%0.3f)' % (scene_start, scene_end)
+        labels.append(_drawtext(layout, text='%03d' % scene_idx,
+                                fontsize=layout['label_fontsize'],
+                                border=layout['label_border'],
+                                opacity=layout['opacity'], enable=enable))
+    
+    filters.append('[0:v]fps=%0.6f,scale=%d:%d,setsar=1%s,'
+                   'scale=%d:%d,pad=%d:%d:0:(oh-ih)/2[main]' %
+                   (fps, out_w, out_h, ''.join(',' + l for l in labels),
+                    main_w, main_h, main_w, out_h))
+    
+    # Graphs stacked on top of each other
+    graph_labels = []
+    for graph_idx in range(len(layout['graphs'])):
+        label = 'graph%d' % graph_idx
+        filters.append('[%d:v]fps=%0.6f,scale=%d:%d,setsar=1[%s]' %
+                       (graph_idx + 1, fps, graph_w, graph_h, label))
+        graph_labels.append('[%s]' % label)
+    filters.append('%svstack=inputs=%d,pad=%d:%d[graphs]' %
+                   (''.join(graph_labels), len(graph_labels), graph_w, out_h))
+    
+    filters.append('[main][graphs]hstack,trim=duration=%0.6f[grid]' %
+                   duration)
+    
+    # Audio waveform overlaid at the bottom of the main video
+    if layout['audio_graph']:
+        anim_w, anim_h = layout['audio_graph_size']
+        audio_idx = len(layout['graphs']) + 1
+        filters.append('[grid][%d:v]overlay=x=%d:y=%d:eof_action=pass[body]' %
+                       (audio_idx, (main_w - anim_w) // 2,
+                        out_h - 10 - anim_h))
+    else:
+        filters.append('[grid]null[body]')
+    
+    return filters
+
+
+def results_filter(layout, work_dir):
+    """
+    Filter drawing the results screen into [results]. The text is written to
+    a file in work_dir, which ffmpeg must be run from.
+    """
+    
+    _, _, out_w, out_h = layout_geometry(layout)
+    
+    result_file = os.path.join(work_dir, 'result_text.txt')
+    with open(result_file, 'w') as f:
+        f.write('\n'.join(layout['result_text']))
+    
+    return ('color=c=black:s=%dx%d:r=%0.6f:d=%0.3f,%s[results]' %
+            (out_w, out_h, layout['fps'], layout['result_duration'],
+             _drawtext(layout, textfile='result_text.txt',
+                       fontsize=layout['result_fontsize'])))
+
+
+def replay_label(layout):
+    """Number of the scene replayed at the end of the layout."""
+    
+    scene_start = layout['longest_scene'][0]
+    scene_starts_sec = layout['scenes'][:-1, 1] / 1000.0
+    
+    return int((scene_starts_sec <= scene_start + 0.5 / layout['fps']).sum())
+
+
+def replay_filter(layout, replay_idx):
+    """
+    Filter drawing the longest scene with its scene number and captions into
+    [replay], from input replay_idx seeked to the scene.
+    """
+    
+    _, _, out_w, out_h = layout_geometry(layout)
+    scene_start, scene_end = layout['longest_scene']
+    caption = '%0.3f seconds long' % (scene_end - scene_start)
+    
+    return ('[%d:v]fps=%0.6f,scale=%d:%d,setsar=1,%s,%s,%s[replay]' %
+            (replay_idx, layout['fps'], out_w, out_h,
+             _drawtext(layout, text='%03d' % replay_label(layout),
+                       fontsize=layout['label_fontsize'],
+                       border=layout['label_border'],
+                       opacity=layout['opacity']),
+             _drawtext(layout, text='Longest Scene',
+                       fontsize=layout['caption_fontsize'], y='0',
+                       border=layout['caption_border'],
+                       opacity=layout['opacity']),
+             _drawtext(layout, text=caption,
+                       fontsize=layout['caption_fontsize'], y='h-th',
+                       border=layout['caption_border'],
+                       opacity=layout['opacity'])))
+
+
+def audio_filters(layout, replay_idx):
+    """
+    Filters taking the audio of the three parts of a layout into [a_body],
+    [a_results] and [a_replay], from input 0 (source video) and input
+    replay_idx seeked to the longest scene.
+    """
+    
+    return ['[0:a]atrim=duration=%0.3f,%s[a_body]' %
+            (layout['duration'], AUDIO_FORMAT),
+            'anullsrc=r=44100:cl=stereo,atrim=duration=%0.3f,%s[a_results]' %
+            (layout['result_duration'], AUDIO_FORMAT),
+            '[%d:a]%s[a_replay]' % (replay_idx, AUDIO_FORMAT)]
+
+
+def build_filter_graph(layout, work_dir):
+    """
+    Turns a layout from analysis_layout into ffmpeg inputs and a filter graph.
+    
+    Parameters
+    -----------
+    
+    layout
+      dict returned by analysis_layout
+    
+    work_dir
+      folder to write the text files used by drawtext into. ffmpeg must be run
+      from this folder.
+    
+    Returns
+    --------
+    
+    inputs
+      list of ffmpeg input arguments
+    
+    filter_graph
+      filter_complex graph as a string, with the outputs labelled [vout] and,
+      if the layout includes audio, [aout]
+    """
+    
+    # Longest scene, read as its own seeked input so only that scene is decoded
+    # for the replay and nothing has to be buffered until the end
+    scene_start, scene_end = layout['longest_scene']
+    scene_duration = scene_end - scene_start
+    
+    inputs = ['-i', layout['video']]
+    for graph in layout['graphs']:
+        inputs += ['-i', graph]
+    if layout['audio_graph']:
+        inputs += ['-i', layout['audio_graph']]
+    replay_idx = len(inputs) // 2
+    inputs += ['-ss', '%0.3f' % scene_start, '-t', '%0.3f' % scene_duration,
+               '-i', layout['video']]
+    
+    filters = body_filters(layout)
+    filters.append(results_filter(layout, work_dir))
+    filters.append(replay_filter(layout, replay_idx))
+    
+    # Put the three parts one after the other
+    if layout['include_audio']:
+        filters += audio_filters(layout, replay_idx)
+        filters.append('[body][a_body][results][a_results][replay][a_replay]'
+                       'concat=n=3:v=1:a=1[vcat][aout]')
+    else:
+        filters.append('[body][results][replay]concat=n=3:v=1:a=0[vcat]')
+    
+    filters.append('[vcat]format=yuv420p[vout]')
+    
+    return inputs, ';\n'.join(filters)
+
+
+def render_layout(layout, output, preset='medium', threads=None, codec='libx264',
+                  audio_codec='aac', keep_graph=False):
+    """
+    Renders a layout from analysis_layout to a video file with one ffmpeg run.
+    
+    Parameters
+    -----------
+    
+    layout
+      dict returned by analysis_layout
+    
+    output
+      filepath to save the rendered video to
+    
+    preset
+      x264 encoding preset, same meaning as in moviepy's write_videofile
+    
+    threads
+      number of encoding threads, ffmpeg decides if None
+    
+    codec, audio_codec
+      video and audio encoders to use
+    
+    keep_graph
+      if True, the folder with the generated filter graph is not deleted,
+      which is handy for debugging the graph by hand
+    
+    Returns
+    --------
+    
+    output
+      Simply returns the filepath to the rendered video
+    """
+    
+    output = os.path.abspath(output)
+    work_dir = tempfile.mkdtemp(prefix='qe_ffmpeg_render_',
+                                dir=wsp.workspace_root())
+    
+    try:
+        inputs, filter_graph = build_filter_graph(layout, work_dir)
+        
+        # The graph gets long with one drawtext per scene, so pass it as a file
+        with open(os.path.join(work_dir, 'filter_graph.txt'), 'w') as f:
+            f.write(filter_graph)
+        
+        args = inputs + ['-filter_complex_script', 'filter_graph.txt',
+                         '-map', '[vout]']
+        if layout['include_audio']:
+            args += ['-map', '[aout]', '-c:a', audio_codec]
+        
+        args += ['-c:v', codec, '-preset', preset]
+        if threads:
+            args += ['-threads', threads]
+        
+        fu.run_ffmpeg(args + [output], cwd=work_dir)
+    
+    finally:
+        if not keep_graph:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    return output
@@ -0,0 +1,239 @@
+"""Small helpers for calling the ffmpeg binary directly.
+
+Uses the same ffmpeg executable that moviepy is configured with so that the
+whole project runs against a single ffmpeg install.
+"""
+
+import os
+import json
+import tempfile
+import subprocess as sp
+import numpy as np
+
+from moviepy.config import get_setting
+
+
+def ffmpeg_binary():
+    """Returns the path of the ffmpeg executable moviepy uses."""
+    
+    return get_setting('FFMPEG_BINARY')
+
+
+def ffprobe_binary():
+    """Returns the path of the ffprobe executable next to moviepy's ffmpeg."""
+    
+    ffmpeg = ffmpeg_binary()
+    folder, name = os.path.split(ffmpeg)
+    
+    return os.path.join(folder, name.replace('ffmpeg', 'ffprobe'))
+
+
+def run_ffmpeg(args, quiet=True, cwd=None):
+    """
+    Runs ffmpeg with the given list of arguments and waits for it to finish.
+    
+    Parameters
+    -----------
+    
+    args
+      list of command line arguments, not including the ffmpeg binary itself
+    
+    quiet
+      if True, only errors are logged by ffmpeg
+    
+    cwd
+      optional working directory to run ffmpeg in
+    
+    Raises
+    --------
+    
+    IOError
+      if ffmpeg exits with an error, with ffmpeg's error output as the message
+    """
+    
+    cmd = [ffmpeg_binary(), '-y']
+    if quiet:
+        cmd += ['-loglevel', 'error']
+    cmd += [str(arg) for arg in args]
+    
+    proc = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.PIPE, cwd=cwd)
+    _, err = proc.communicate()
+    
+    if proc.returncode != 0:
+        raise IOError('ffmpeg error while running:\n%s\n\n%s' %
+                      (' '.join(cmd), err.decode('utf8', 'replace')))
+
+
+def run_ffprobe(args):
+    """
+    Runs ffprobe with the given list of arguments and returns its output.
+    
+    Raises IOError if ffprobe exits with an error.
+    """
+    
+    cmd = [ffprobe_binary(), '-v', 'error'] + [str(arg) for arg in args]
+    
+    proc = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.PIPE)
+    out, err = proc.communicate()
+    
+    if proc.returncode != 0:
+        raise IOError('ffprobe error while running:\n%s\n\n%s' %
+                      (' '.join(cmd), err.decode('utf8', 'replace')))
+    
+    return out.decode('utf8', 'replace')
+
+
+def probe_video(filename):
+    """
+    Reads basic information about a video file without decoding it.
+    
+    Parameters
+    -----------
+    
+    filename
+      filepath of the video
+    
+    Returns
+    --------
+    
+    info
+      dict with the 'width', 'height', 'codec', 'pix_fmt', 'fps' and
+      'duration' (in seconds) of the first video stream, 'nb_frames' if the
+      container records it (else None) and 'has_audio'
+    """
+    
+    out = run_ffprobe(['-show_streams', '-show_format', '-of', 'json',
+                       filename])
+    probe = json.loads(out)
+    
+    video = [s for s in probe['streams'] if s['codec_type'] == 'video'][0]
+    has_audio = any(s['codec_type'] == 'audio' for s in probe['streams'])
+    
+    num, den = video.get('avg_frame_rate', '0/0').split('/')
+    if float(den) == 0 or float(num) == 0:
+        num, den = video['r_frame_rate'].split('/')
+    
+    nb_frames = video.get('nb_frames')
+    
+    return {'width': int(video['width']),
+            'height': int(video['height']),
+            'codec': video.get('codec_name'),
+            'pix_fmt': video.get('pix_fmt'),
+            'fps': float(num) / float(den),
+            'duration': float(video.get('duration',
+                                        probe['format']['duration'])),
+            'nb_frames': int(nb_frames) if nb_frames else None,
+            'has_audio': has_audio}
+
+
+def container_format(filename):
+    """Returns the lower case extension of filename without the dot."""
+    
+    return os.path.splitext(filename)[1][1:].lower()
+
+
+def iter_frames(video_file, size=None, pix_fmt='rgb24', vf=None,
+                start_time=None, duration=None):
+    """
+    Decodes a video through an ffmpeg pipe, one frame at a time.
+    
+    Every decoded frame is passed through (no frames are dropped or duplicated
+    to hit a frame rate), so the n-th frame yielded is frame number n.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the video
+    
+    size
+      (width, height) to scale the frames to, the source size if None
+    
+    pix_fmt
+      'rgb24' or 'bgr24' (OpenCV order) for color frames, 'gray' for
+      luminance only
+    
+    vf
+      optional extra ffmpeg video filters, applied before the scaling
+    
+    start_time, duration
+      optional stretch of the video to decode, in seconds
+    
+    Yields
+    --------
+    
+    frame
+      uint8 numpy array of shape (height, width, channels), or (height, width)
+      for 'gray'. The array is only valid until the next frame is read.
+    
+    Raises IOError if ffmpeg exits with an error, so a missing decoder or a
+    corrupt stream doesn't pass for the end of the video.
+    """
+    
+    filters = [vf] if vf else []
+    if size is None:
+        if vf:
+            raise ValueError('size must be given along with vf')
+        info = probe_video(video_file)
+        size = (info['width'], info['height'])
+    else:
+        filters.append('scale=%d:%d' % tuple(size))
+    
+    channels = 1 if pix_fmt == 'gray' else 3
+    frame_bytes = size[0] * size[1] * channels
+    
+    cmd = [ffmpeg_binary(), '-loglevel', 'error']
+    if start_time is not None:
+        cmd += ['-ss', '%0.6f' % start_time]
+    cmd += ['-i', video_file]
+    if duration is not None:
+        cmd += ['-t', '%0.6f' % duration]
+    if filters:
+        cmd += ['-vf', ','.join(filters)]
+    cmd += ['-an', '-vsync', 'passthrough', '-f', 'rawvideo',
+            '-pix_fmt', pix_fmt, '-']
+    
+    # Errors go to a file, a pipe that nobody reads could fill up and stall
+    # ffmpeg on a badly corrupt stream
+    err = tempfile.TemporaryFile()
+    proc = sp.Popen(cmd, stdout=sp.PIPE, stderr=err, bufsize=frame_bytes * 2)
+    
+    # One buffer gets filled with every frame in turn
+    buf = bytearray(frame_bytes)
+    view = memoryview(buf)
+    shape = (size[1], size[0]) if channels == 1 else (size[1], size[0], 3)
+    frame = np.frombuffer(buf, dtype=np.uint8).reshape(shape)
+    
+    finished = False
+    
+    try:
+        while True:
+            read = 0
+            while read < frame_bytes:
+                n = proc.stdout.readinto(view[read:])
+                if not n:
+                    break
+                read += n
+            
+            if read < frame_bytes:
+                finished = True
+                break
+            
+            yield frame
+    
+    finally:
+        proc.stdout.close()
+        
+        # Stopped early by the caller, ffmpeg is still running
+        if not finished:
+            proc.terminate()
+        proc.wait()
+        
+        err.seek(0)
+        message = err.read().decode('utf8', 'replace')
+        err.close()
+    
+    # The output ended because ffmpeg failed, not because the video did
+    if proc.returncode != 0:
+        raise IOError('ffmpeg error while running:\n%s\n\n%s' %
+                      (' '.join(cmd), message))
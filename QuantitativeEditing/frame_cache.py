@@ -0,0 +1,311 @@
+"""A disk cache of downscaled, decoded frames for repeated detection passes.
+
+Threshold sweeps, comparisons between the ContentDetector and EdgeDetector
+and other detection experiments each decode the compressed video again, even
+though they only look at small frames. The first pass here writes the
+downscaled frames to a single uncompressed file, and every later pass reads
+them back through a memory map at the speed of the disk cache instead of the
+decoder.
+
+An entry is one file: a 4096 byte JSON header with the number of frames, the
+frame shape, the pixel format, the frame rate and the hash of the source
+video, followed by the raw uint8 frames. The files are named after the source
+hash, the frame size and the downscale factor, so every video and size gets
+its own entry. The frames are downscaled the way scenedetect's VideoManager
+does it, by keeping every downscale_factor-th pixel of every
+downscale_factor-th row, so the detectors see the very same pixels with and
+without the cache. An entry with fewer frames than the video should have is
+never saved.
+
+The total size of the cache is bounded. Entries are touched whenever they are
+opened, and the least recently used ones, whichever video they belong to, are
+deleted to make room for new ones. A video too large to fit at all is simply
+detected straight from the decoder, without caching.
+"""
+
+import os
+import json
+import numpy as np
+import cache_utils as cu
+import ffmpeg_utils as fu
+
+
+# Size of the header in front of the frames, one page so the frames that
+# follow can be memory mapped
+HEADER_SIZE = 4096
+
+# Default bound on the total size of a cache folder in bytes
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+
+# Share of the expected frames (from the container, or its duration and frame
+# rate) a decode may come up short before it is taken as truncated
+SHORT_TOLERANCE = 0.02
+
+
+class FrameCache(object):
+    """
+    The frames of one cache entry, memory mapped.
+    
+    Frames are indexed and iterated like a read-only numpy array of shape
+    (frames, height, width, 3), in the OpenCV (BGR) channel order that the
+    scenedetect detectors expect.
+    """
+    
+    def __init__(self, filename):
+        
+        with open(filename, 'rb') as f:
+            self.header = json.loads(f.read(HEADER_SIZE).decode('utf8'))
+        
+        self.filename = filename
+        self.fps = self.header['fps']
+        self.source_hash = self.header['source_hash']
+        self.frames = np.memmap(filename, dtype=np.uint8, mode='r',
+                                offset=HEADER_SIZE,
+                                shape=tuple([self.header['frames']] +
+                                            self.header['shape']))
+        
+        # Mark the entry as recently used
+        os.utime(filename, None)
+    
+    def __len__(self):
+        
+        return len(self.frames)
+    
+    def __getitem__(self, idx):
+        
+        return self.frames[idx]
+    
+    def __iter__(self):
+        
+        return iter(self.frames)
+
+
+def frame_size(video_file, downscale_factor=1):
+    """
+    (width, height) of the frames of a video divided by downscale_factor, the
+    same size the VideoManager's downscaling gives.
+    """
+    
+    info = fu.probe_video(video_file)
+    
+    return (-(-info['width'] // downscale_factor),
+            -(-info['height'] // downscale_factor))
+
+
+def expected_frames(video_file):
+    """
+    Number of frames of a video according to its container, or estimated from
+    its duration and average frame rate.
+    """
+    
+    info = fu.probe_video(video_file)
+    
+    return info['nb_frames'] or int(round(info['duration'] * info['fps']))
+
+
+def entry_size(video_file, size):
+    """Estimated size in bytes of the cache entry of a video at size."""
+    
+    return HEADER_SIZE + expected_frames(video_file) * size[0] * size[1] * 3
+
+
+def iter_decimated(video_file, downscale_factor=1, **kwargs):
+    """
+    Decodes a video like ffmpeg_utils.iter_frames, keeping only every
+    downscale_factor-th pixel of every downscale_factor-th row.
+    
+    That's how scenedetect's VideoManager downscales, rather than filtering
+    like ffmpeg's scaler, so detection scores match those of
+    detect_scenes.analyze_video. Other keyword arguments are passed on to
+    iter_frames, where size is the size before the decimation.
+    """
+    
+    frames = fu.iter_frames(video_file, **kwargs)
+    
+    # Closing this generator early stops the decoder too
+    try:
+        for frame in frames:
+            if downscale_factor > 1:
+                frame = frame[::downscale_factor, ::downscale_factor]
+            yield frame
+    
+    finally:
+        frames.close()
+
+
+def cache_frames(video_file, downscale_factor=1, cache_dir='frame_cache',
+                 max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Returns the cached frames of a video, decoding and caching them first if
+    needed.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the video
+    
+    downscale_factor
+      factor to downscale the frames by, see detect_scenes.analyze_video
+    
+    cache_dir
+      folder holding the cache
+    
+    max_bytes
+      bound on the total size of the cache folder
+    
+    Returns
+    --------
+    
+    frame_cache
+      FrameCache of the video, or None if it would be larger than max_bytes
+      on its own
+    """
+    
+    size = frame_size(video_file, downscale_factor)
+    source_hash = cu.file_hash(video_file)
+    key = '%s_%dx%d_d%d' % (source_hash, size[0], size[1], downscale_factor)
+    filename = cu.cache_path(cache_dir, key, '.frames')
+    
+    if os.path.isfile(filename):
+        return FrameCache(filename)
+    
+    if entry_size(video_file, size) > max_bytes:
+        return None
+    
+    # Write the frames first and the header once the frame count is known
+    temp_file = filename + '.%d.tmp' % os.getpid()
+    frames = 0
+    
+    try:
+        with open(temp_file, 'wb') as f:
+            f.write(b'\0' * HEADER_SIZE)
+            for frame in iter_decimated(video_file, downscale_factor,
+                                        pix_fmt='bgr24'):
+                f.write(np.ascontiguousarray(frame).data)
+                frames += 1
+            
+            # A truncated decode would otherwise be served as the whole video
+            # by every later pass
+            expected = expected_frames(video_file)
+            if frames < expected * (1 - SHORT_TOLERANCE):
+                raise IOError('Decoded only %d of %d frames of %s, not caching '
+                              'it' % (frames, expected, video_file))
+            
+            header = {'frames': frames,
+                      'shape': [size[1], size[0], 3],
+                      'pix_fmt': 'bgr24',
+                      'fps': fu.probe_video(video_file)['fps'],
+                      'source_hash': source_hash,
+                      'source': os.path.basename(video_file)}
+            f.seek(0)
+            f.write(json.dumps(header).encode('utf8').ljust(HEADER_SIZE))
+        
+        os.replace(temp_file, filename)
+    
+    finally:
+        if os.path.isfile(temp_file):
+            os.remove(temp_file)
+    
+    cu.evict(cache_dir, max_bytes, '.frames', keep=filename)
+    
+    return FrameCache(filename)
+
+
+def detect_frames(frames, detectors, stats_mgr=None):
+    """
+    Runs scenedetect detectors over frames directly, all of them in a single
+    pass.
+    
+    Parameters
+    -----------
+    
+    frames
+      iterable of BGR uint8 frames, e.g. a FrameCache
+    
+    detectors
+      list of scenedetect SceneDetector objects (ContentDetector,
+      EdgeDetector, ...)
+    
+    stats_mgr
+      optional StatsManager shared by the detectors, for saving the frame
+      metrics
+    
+    Returns
+    --------
+    
+    frames_read
+      number of frames
+    
+    scene_lists
+      list of the frames at which each scene starts for every detector, in
+      the same form as detect_scenes.analyze_video
+    """
+    
+    cut_lists = [[] for _ in detectors]
+    
+    # Same as SceneManager.add_detector, the metric keys must be registered
+    # before any detector can store its frame metrics
+    for detector in detectors:
+        detector.stats_manager = stats_mgr
+        if stats_mgr is not None:
+            stats_mgr.register_metrics(detector.get_metrics())
+    
+    frames_read = 0
+    for frame_num, frame in enumerate(frames):
+        for detector, cuts in zip(detectors, cut_lists):
+            cuts += detector.process_frame(frame_num, frame)
+        frames_read += 1
+    
+    for detector, cuts in zip(detectors, cut_lists):
+        cuts += detector.post_process(frames_read)
+    
+    return frames_read, [[0] + sorted(set(cuts) - {0}) for cuts in cut_lists]
+
+
+def analyze_video(video_file, threshold=40, min_scene_len=15, stats_file=None,
+                  downscale_factor=1, shot_hasher=None, detector=None,
+                  cache_dir='frame_cache', max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Analyzes a video for scene transitions using the frame cache.
+    
+    Parameters and return values are the same as in
+    detect_scenes.analyze_video, plus:
+    
+    detector
+      scenedetect detector to use, a ContentDetector with threshold and
+      min_scene_len if None
+    
+    cache_dir, max_bytes
+      see cache_frames
+    """
+    
+    import scenedetect
+    
+    from scenedetect.frame_timecode import FrameTimecode
+    from scenedetect.stats_manager import StatsManager
+    
+    if detector is None:
+        detector = scenedetect.ContentDetector(threshold=threshold,
+                                               min_scene_len=min_scene_len)
+    
+    frames = cache_frames(video_file, downscale_factor, cache_dir, max_bytes)
+    if frames is None:
+        video_fps = fu.probe_video(video_file)['fps']
+        frames = iter_decimated(video_file, downscale_factor, pix_fmt='bgr24')
+    else:
+        video_fps = frames.fps
+    
+    detectors = [detector]
+    if shot_hasher is not None:
+        detectors.append(shot_hasher)
+    
+    stats_mgr = StatsManager() if stats_file else None
+    frames_read, scene_lists = detect_frames(frames, detectors, stats_mgr)
+    scene_list = scene_lists[0]
+    
+    if stats_file:
+        with open(stats_file, 'w') as stats_csv:
+            stats_mgr.save_to_csv(stats_csv, FrameTimecode(0, video_fps))
+    
+    return (video_fps, frames_read, frames_read, scene_list)
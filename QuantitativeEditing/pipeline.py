@@ -0,0 +1,283 @@
+"""Overlapping download, detection and rendering over a list of videos.
+
+complete_process.py takes one video through every step in turn, so the
+network sits idle while the video is analyzed and the decoder sits idle while
+it is rendered. Here each step is a Stage with its own pool of workers: a few
+threads for downloading, and processes for detection and rendering. A video
+moves on to the next stage as soon as it is done with the last one, so while
+video N renders, video N+1 is being detected and video N+2 downloaded. Over a
+long list of videos the throughput approaches that of the slowest stage.
+
+Stage functions follow the same convention as the stages of batch.run_batch:
+they take a job dict with the 'video_file', 'params', 'output_prefix', the
+'outputs' of the earlier stages and a 'workspace', and return a dict of their
+own outputs. A stage that returns a 'video_file' (like downloading) changes
+the video the later stages work on.
+"""
+
+import os
+import time
+import threading
+import traceback
+import multiprocessing
+import concurrent.futures as cf
+import workspace as wsp
+
+
+# Seconds between checks that some stage is still working on the jobs left
+LIVENESS_SEC = 10.0
+
+
+class Stage(object):
+    """One step of the pipeline and the workers it runs on."""
+    
+    def __init__(self, name, function, workers=1, processes=False):
+        """
+        Parameters
+        -----------
+        
+        name
+          name of the stage, used in the progress output
+        
+        function
+          stage function, see the module docstring. Must be defined at the top
+          level of a module if processes is True.
+        
+        workers
+          number of videos this stage works on at once
+        
+        processes
+          run in worker processes for CPU bound work, a fresh one for every
+          job, threads are used otherwise (fine for I/O bound work like
+          downloading)
+        """
+        
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.processes = processes
+    
+    def executor(self):
+        
+        # Each worker handles a single job and is then replaced, so nothing a
+        # job leaks outlives it. This also starts the workers with spawn
+        # rather than fork, which isn't safe once the download threads run.
+        if self.processes:
+            return cf.ProcessPoolExecutor(self.workers, max_tasks_per_child=1)
+        
+        return cf.ThreadPoolExecutor(self.workers)
+
+
+def _run_stage(function, job):
+    """Runs a stage function on a job in a fresh workspace, timing it."""
+    
+    start = time.time()
+    
+    with wsp.Workspace('pipeline') as workspace:
+        job = dict(job, workspace=workspace)
+        outputs = function(job)
+    
+    return outputs, time.time() - start
+
+
+def run_pipeline(jobs, stages):
+    """
+    Sends every job through the stages, overlapping the stages.
+    
+    Parameters
+    -----------
+    
+    jobs
+      list of job dicts, each with at least the 'params' and 'output_prefix',
+      and a 'video_file' unless a stage makes one
+    
+    stages
+      list of Stage objects, in order
+    
+    Returns
+    --------
+    
+    results
+      list of the jobs, each with the 'outputs' of every stage it finished,
+      the 'seconds' each stage took and the 'error' that stopped it, if any
+    """
+    
+    executors = [stage.executor() for stage in stages]
+    lock = threading.Condition()
+    remaining = [len(jobs)]
+    in_flight = [0]
+    finished = set()
+    busy = [0.0] * len(stages)
+    start = time.time()
+    
+    def finish(job):
+        with lock:
+            remaining[0] -= 1
+            finished.add(id(job))
+            print('[%d/%d] %s: %s' % (len(jobs) - remaining[0], len(jobs),
+                                      os.path.basename(job['output_prefix']),
+                                      'failed' if job['error'] else 'done'))
+            lock.notify_all()
+    
+    def submit(job, stage_idx):
+        stage = stages[stage_idx]
+        
+        # Submitting fails once a worker process was killed and broke the
+        # executor, which would otherwise lose the job in a done callback
+        try:
+            future = executors[stage_idx].submit(_run_stage, stage.function,
+                                                 dict(job))
+        
+        except Exception:
+            job['error'] = '%s stage could not start:\n%s' % (
+                stage.name, traceback.format_exc())
+            finish(job)
+            return
+        
+        with lock:
+            in_flight[0] += 1
+        future.add_done_callback(
+            lambda future: advance(job, stage_idx, future))
+    
+    def advance(job, stage_idx, future):
+        
+        # The job only stops counting as in flight once it was passed on to
+        # the next stage or finished
+        try:
+            next_stage(job, stage_idx, future)
+        
+        finally:
+            with lock:
+                in_flight[0] -= 1
+                lock.notify_all()
+    
+    def next_stage(job, stage_idx, future):
+        stage = stages[stage_idx]
+        
+        try:
+            outputs, seconds = future.result()
+        
+        except Exception:
+            job['error'] = '%s stage failed:\n%s' % (stage.name,
+                                                     traceback.format_exc())
+            finish(job)
+            return
+        
+        job['outputs'] = dict(job['outputs'], **outputs)
+        job['seconds'][stage.name] = seconds
+        job['video_file'] = outputs.get('video_file', job['video_file'])
+        
+        with lock:
+            busy[stage_idx] += seconds
+        
+        if stage_idx + 1 < len(stages):
+            submit(job, stage_idx + 1)
+        else:
+            finish(job)
+    
+    results = []
+    for job in jobs:
+        job = dict(job)
+        job.setdefault('video_file', None)
+        job['outputs'] = dict(job.get('outputs', {}))
+        job['seconds'] = {}
+        job['error'] = None
+        results.append(job)
+    
+    try:
+        for job in results:
+            submit(job, 0)
+        
+        with lock:
+            while remaining[0]:
+                lock.wait(LIVENESS_SEC)
+                
+                # With nothing running, the jobs left can never finish
+                if remaining[0] and not in_flight[0]:
+                    for job in results:
+                        if id(job) not in finished:
+                            job['error'] = 'Lost by the pipeline, no stage ' \
+                                           'was running it'
+                    break
+    
+    finally:
+        for executor in executors:
+            executor.shutdown(wait=True)
+    
+    # Show where the time went, the busiest stage limits the throughput
+    elapsed = time.time() - start
+    print('Processed %d videos in %0.1f sec' % (len(jobs), elapsed))
+    for stage, stage_busy in zip(stages, busy):
+        print('  %-10s %d workers, %0.1f%% busy' %
+              (stage.name, stage.workers,
+               100.0 * stage_busy / (stage.workers * elapsed or 1)))
+    
+    for job in results:
+        if job['error']:
+            print(job['error'])
+    
+    return results
+
+
+def download_stage(job):
+    """Pipeline stage that downloads the video of a job from its 'url'."""
+    
+    import video_downloader as vd
+    
+    video_file = vd.download_video(job['url'], output=job['output_prefix'])
+    
+    return {'video_file': video_file}
+
+
+if __name__ == '__main__':
+    
+    import pandas as pd
+    import analyze_folder as af
+    import batch
+    import resources as res
+    
+    # Read in csv file containing MV information
+    # Formatted in five columns with a header row of column titles
+    # | Artist | Song Title | Genre | Year | YouTube Link |
+    video_list = pd.read_csv('video_list.csv')
+    
+    # Specify folder to save MVs and their analyses to
+    video_folder = "/media/unraid/Datasets/QuantitativeEditing/To Analyze/"
+    
+    # Same settings as analyze_folder.py
+    params = {'include_audio': True,
+              'render_audioplot': True,
+              'output_mode': 'burn',
+              'threshold': 30,
+              'min_scene_len': 10,
+              'detector': 'content',
+              'stride': 1,
+              'prefilter': None,
+              'use_proxy': False,
+              'proxy_cache': os.path.join(video_folder, 'proxy_cache'),
+              'crop': None,
+              'pts_cache': os.path.join(video_folder, 'pts_cache'),
+              'results_db': os.path.join(video_folder, 'results.sqlite'),
+              'shot_index': os.path.join(video_folder, 'shot_index.sqlite'),
+              'resize': True,
+              'profile': 'final',
+              'audio_cache': os.path.join(video_folder, 'audio_cache')}
+    
+    # A job for every video
+    jobs = []
+    for row in video_list.itertuples(index=False):
+        outfile = '_'.join(str(i) for i in (row[0], row[3], row[1]))
+        jobs.append({'url': row[4],
+                     'params': params,
+                     'output_prefix': os.path.join(video_folder, outfile)})
+    
+    # Downloads wait on the network, detection and rendering on the CPU
+    stages = [Stage('download', download_stage, workers=4),
+              Stage('detect', af.detect_stage,
+                    workers=max(1, multiprocessing.cpu_count() // 4),
+                    processes=True),
+              Stage('render', af.render_stage,
+                    workers=res.worker_count(batch.DEFAULT_JOB_MEMORY),
+                    processes=True)]
+    
+    run_pipeline(jobs, stages)
@@ -0,0 +1,448 @@
+"""A cheap first pass that finds where the cuts probably are.
+
+Full detection decodes every frame of a video and compares each one to the
+last in Python. Most of those frames are nowhere near a cut. This module
+first ranks the frames by how likely they are to start a new scene, using
+information that is much cheaper to get at, then runs the ContentDetector
+only on short windows around the likely ones:
+
+  'packets'  reads only the sizes and keyframe flags of the compressed video
+             packets with ffprobe, without decoding anything. Encoders put a
+             keyframe at most cuts, and the first frames after a cut are much
+             larger than their neighbours because little can be predicted from
+             the frames before.
+  'scene'    lets ffmpeg's own scene change score (the select filter's scene
+             variable) rate every frame, on a small version of the video and
+             in native code.
+
+The prefilter trades a little recall for speed, so benchmark compares it
+against full detection and reports the share of cuts it still finds, the
+share of frames the detector looked at and the share of frames it had to
+decode. The last is larger: every window is seeked to, and ffmpeg decodes
+from the keyframe before it, so decoding is counted from that keyframe with
+the video's PTSIndex.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+import ffmpeg_utils as fu
+import crop_detect as cdt
+import pts_index as pi
+import workspace as wsp
+
+
+# Score given to keyframes in the 'packets' method, they are always looked at
+KEYFRAME_SCORE = 100.0
+
+# Default thresholds on the score of each method. Kept low, a missed cut costs
+# more than a few extra frames decoded.
+DEFAULT_THRESHOLDS = {'packets': 2.5, 'scene': 0.1}
+
+
+def packet_scores(video_file, window=15):
+    """
+    Scores every frame of a video from its compressed packets alone.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the video
+    
+    window
+      number of frames around each frame to compare its size with
+    
+    Returns
+    --------
+    
+    scores
+      numpy array with a score per frame in display order: keyframes get
+      KEYFRAME_SCORE, other frames their size over the median size of the
+      frames around them
+    """
+    
+    import pandas as pd
+    
+    out = fu.run_ffprobe(['-select_streams', 'v:0',
+                          '-show_entries', 'packet=pts_time,size,flags',
+                          '-of', 'csv=p=0', video_file])
+    
+    packets = []
+    for line in out.splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 3 or fields[0] == 'N/A':
+            continue
+        packets.append((float(fields[0]), int(fields[1]), 'K' in fields[2]))
+    
+    # Packets come in decoding order, frames are numbered in display order
+    packets.sort()
+    sizes = np.array([packet[1] for packet in packets], dtype=float)
+    keyframes = np.array([packet[2] for packet in packets], dtype=bool)
+    
+    # Keyframes would inflate the median of their neighbours
+    other_sizes = pd.Series(np.where(keyframes, np.nan, sizes))
+    local_median = other_sizes.rolling(window, center=True,
+                                       min_periods=1).median().values
+    local_median = np.where(np.isnan(local_median), sizes, local_median)
+    
+    scores = sizes / np.maximum(local_median, 1.0)
+    scores[keyframes] = KEYFRAME_SCORE
+    
+    return scores
+
+
+def ffmpeg_scene_scores(video_file, height=144):
+    """
+    Scores every frame of a video with ffmpeg's scene change detection.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the video
+    
+    height
+      height to scale the video to before scoring, the scene score only
+      needs a rough picture
+    
+    Returns
+    --------
+    
+    scores
+      numpy array with the scene score (0 to 1) of every frame
+    """
+    
+    work_dir = tempfile.mkdtemp(prefix='qe_prefilter_',
+                                dir=wsp.workspace_root())
+    
+    try:
+        fu.run_ffmpeg(['-i', os.path.abspath(video_file), '-an', '-sn',
+                       '-vsync', 'passthrough',
+                       '-vf', "scale=-2:%d,select='gte(scene,0)',"
+                              "metadata=print:key=lavfi.scene_score:"
+                              "file=scores.txt" % height,
+                       '-f', 'null', '-'], cwd=work_dir)
+        
+        # Each frame gets a "frame:..." line, then a line with its score
+        scores = []
+        with open(os.path.join(work_dir, 'scores.txt')) as f:
+            for line in f:
+                if line.startswith('frame:'):
+                    scores.append(0.0)
+                elif line.startswith('lavfi.scene_score=') and scores:
+                    scores[-1] = float(line.split('=', 1)[1])
+    
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    return np.array(scores)
+
+
+def candidate_windows(scores, threshold, pad=5):
+    """
+    Turns frame scores into windows of frames to run detection on.
+    
+    Parameters
+    -----------
+    
+    scores
+      numpy array with a score per frame
+    
+    threshold
+      frames scoring at least this are candidates
+    
+    pad
+      number of frames to look at on either side of each candidate
+    
+    Returns
+    --------
+    
+    windows
+      sorted list of non-overlapping (first frame, end frame) pairs, the end
+      frame not included
+    """
+    
+    windows = []
+    for frame in np.flatnonzero(scores >= threshold):
+        start = max(0, frame - pad)
+        end = min(len(scores), frame + pad + 1)
+        
+        # Merge overlapping windows
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+    
+    return windows
+
+
+def decoded_frames(windows, pts_index=None):
+    """
+    Number of frames ffmpeg decodes to get at the windows: each one from the
+    keyframe at or before its first frame. Without a pts_index only the
+    windows themselves are counted.
+    """
+    
+    if pts_index is None:
+        return sum(end - start for start, end in windows)
+    
+    return sum(end - pts_index.keyframe_before(start)
+               for start, end in windows)
+
+
+def detect_windows(video_file, windows, video_fps, threshold=40,
+                   min_scene_len=15, downscale_factor=1, crop=None):
+    """
+    Runs the ContentDetector on windows of a video only.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the video
+    
+    windows
+      list of (first frame, end frame) pairs from candidate_windows
+    
+    video_fps
+      frames per second of the video
+    
+    threshold, min_scene_len, downscale_factor
+      same as in detect_scenes.analyze_video
+    
+    crop
+      optional (x, y, width, height) region of the frames to analyze, see
+      crop_detect.detect_crop
+    
+    Returns
+    --------
+    
+    cuts
+      sorted list of the frames at which new scenes start
+    
+    frames_processed
+      number of frames run through the detector, see decoded_frames for the
+      number decoded
+    """
+    
+    import scenedetect
+    import frame_cache as fc
+    
+    size = None
+    vf = None
+    
+    # Crop in ffmpeg, so the cropped away borders are never piped. The frames
+    # are downscaled afterwards the way the VideoManager does it.
+    if crop:
+        vf = cdt.crop_filter(crop)
+        size = (crop[2], crop[3])
+    
+    found = []
+    frames_processed = 0
+    
+    for start, end in windows:
+        
+        # A fresh detector per window, the first frame of a window can only be
+        # compared with the ones after it. Half a frame early so rounding
+        # can't skip past the first frame.
+        detector = scenedetect.ContentDetector(threshold=threshold,
+                                               min_scene_len=1)
+        frames = fc.iter_decimated(video_file, downscale_factor, size=size,
+                                   pix_fmt='bgr24', vf=vf,
+                                   start_time=max(0.0,
+                                                  (start - 0.5) / video_fps),
+                                   duration=(end - start) / float(video_fps))
+        
+        for frame_num, frame in enumerate(frames, start=start):
+            if frame_num >= end:
+                break
+            found += detector.process_frame(frame_num, frame)
+            frames_processed += 1
+        
+        frames.close()
+    
+    # Keep min_scene_len between cuts like the detector does over a full pass
+    cuts = []
+    for cut in sorted(set(found)):
+        if cut > 0 and (not cuts or cut - cuts[-1] >= min_scene_len):
+            cuts.append(cut)
+    
+    return cuts, frames_processed
+
+
+def prefilter_video(video_file, threshold=40, min_scene_len=15,
+                    downscale_factor=1, method='packets',
+                    prefilter_threshold=None, pad=5, crop=None,
+                    pts_cache='pts_cache'):
+    """
+    Analyzes a video for scene transitions around the likely cuts only.
+    
+    Parameters
+    -----------
+    
+    video_file, threshold, min_scene_len, downscale_factor
+      same as in detect_scenes.analyze_video
+    
+    method
+      'packets' or 'scene', see the module docstring
+    
+    prefilter_threshold
+      score a frame needs to be looked at, DEFAULT_THRESHOLDS for the method
+      if None
+    
+    pad
+      number of frames to look at on either side of each likely cut
+    
+    crop
+      (x, y, width, height) of the region of the frames to analyze, or 'auto'
+      to find it with crop_detect.detect_crop
+    
+    pts_cache
+      folder of the PTSIndex cache, for counting the decoded frames
+    
+    Returns
+    --------
+    
+    result
+      dict with the 'video_fps', the number of frames in the video
+      ('frames_read'), the number run through the detector
+      ('frames_processed') and decoded ('frames_decoded'), the 'windows'
+      looked at and the 'scene_list'
+    """
+    
+    if prefilter_threshold is None:
+        prefilter_threshold = DEFAULT_THRESHOLDS[method]
+    
+    if method == 'packets':
+        scores = packet_scores(video_file)
+    elif method == 'scene':
+        scores = ffmpeg_scene_scores(video_file)
+    else:
+        raise ValueError("Unknown prefilter method %r, choose 'packets' or "
+                         "'scene'" % method)
+    
+    if crop == 'auto':
+        crop = cdt.detect_crop(video_file)
+    
+    video_fps = fu.probe_video(video_file)['fps']
+    windows = candidate_windows(scores, prefilter_threshold, pad)
+    cuts, frames_processed = detect_windows(video_file, windows, video_fps,
+                                            threshold, min_scene_len,
+                                            downscale_factor, crop)
+    
+    # Without frame timestamps the seeks can't be placed, count the windows
+    try:
+        pts_index = pi.load_index(video_file, cache_dir=pts_cache)
+    except IOError:
+        pts_index = None
+    
+    return {'video_fps': video_fps,
+            'frames_read': len(scores),
+            'frames_processed': frames_processed,
+            'frames_decoded': decoded_frames(windows, pts_index),
+            'windows': windows,
+            'scene_list': [0] + cuts}
+
+
+def analyze_video(video_file, **kwargs):
+    """
+    Same as prefilter_video, returning the same as
+    detect_scenes.analyze_video. frames_processed is the number of frames run
+    through the detector.
+    """
+    
+    result = prefilter_video(video_file, **kwargs)
+    
+    return (result['video_fps'], result['frames_read'],
+            result['frames_processed'], result['scene_list'])
+
+
+def recall(scene_list, reference, tolerance=1):
+    """
+    Share of the cuts in a reference scene list (from full detection) that
+    are also in scene_list, give or take tolerance frames.
+    """
+    
+    cuts = np.array(scene_list[1:])
+    reference = np.array(reference[1:])
+    if not len(reference):
+        return 1.0
+    if not len(cuts):
+        return 0.0
+    
+    # Distance from each reference cut to the nearest found cut on either side
+    idx = np.searchsorted(cuts, reference)
+    before = cuts[np.maximum(idx - 1, 0)]
+    after = cuts[np.minimum(idx, len(cuts) - 1)]
+    nearest = np.minimum(np.abs(before - reference), np.abs(after - reference))
+    
+    return float(np.mean(nearest <= tolerance))
+
+
+def benchmark(video_files, threshold=40, min_scene_len=15,
+              methods=('packets', 'scene'), **kwargs):
+    """
+    Compares the prefilter methods with full detection on a set of videos.
+    
+    Returns a list of dicts, one per video and method, with the 'video',
+    'method', 'recall', 'precision', the share of frames run through the
+    detector ('processed') and 'decoded', and the 'seconds' taken by the
+    prefilter and by 'full' detection. Extra kwargs are passed on to
+    prefilter_video.
+    """
+    
+    import detect_scenes as ds
+    
+    results = []
+    
+    for video_file in video_files:
+        start = time.time()
+        _, _, _, reference = ds.analyze_video(video_file, threshold=threshold,
+                                              min_scene_len=min_scene_len)
+        full_seconds = time.time() - start
+        
+        for method in methods:
+            start = time.time()
+            result = prefilter_video(video_file, threshold=threshold,
+                                     min_scene_len=min_scene_len,
+                                     method=method, **kwargs)
+            frames_read = float(result['frames_read'])
+            
+            results.append({'video': os.path.basename(video_file),
+                            'method': method,
+                            'recall': recall(result['scene_list'], reference),
+                            'precision': recall(reference,
+                                                result['scene_list']),
+                            'processed': result['frames_processed'] /
+                                         frames_read,
+                            'decoded': result['frames_decoded'] / frames_read,
+                            'seconds': time.time() - start,
+                            'full': full_seconds})
+    
+    return results
+
+
+if __name__ == '__main__':
+    
+    import glob
+    
+    # Benchmark videos, with the same settings as analyze_folder.py
+    video_files = sorted(glob.glob('benchmark/*.mkv') +
+                         glob.glob('benchmark/*.mp4'))
+    threshold = 40
+    min_scene_len = 10
+    
+    results = benchmark(video_files, threshold=threshold,
+                        min_scene_len=min_scene_len)
+    
+    print('%-40s %-8s %7s %9s %9s %8s %8s %8s' %
+          ('video', 'method', 'recall', 'precision', 'processed', 'decoded',
+           'seconds', 'full'))
+    for result in results:
+        print('%-40.40s %-8s %6.1f%% %8.1f%% %8.1f%% %7.1f%% %8.1f %8.1f' %
+              (result['video'], result['method'], 100 * result['recall'],
+               100 * result['precision'], 100 * result['processed'],
+               100 * result['decoded'], result['seconds'], result['full']))
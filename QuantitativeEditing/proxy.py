@@ -0,0 +1,142 @@
+"""Small analysis proxies of videos for scene detection.
+
+Scene detection only looks at the average change in color between frames,
+which comes out nearly the same at 360p as at 1080p or 4K. Decoding the full
+resolution file for it is most of the cost of detection. A proxy is a 360p,
+video only H.264 copy of the source with exactly the same frames, made once
+and cached by the source's content hash. Every detection run reads the proxy,
+and only the final render touches the full resolution file.
+
+A proxy can also be downloaded separately from the same url as the video
+(download_proxy). Its frame rate may then differ from the full resolution
+stream, so frame numbers are always mapped between the two streams by time
+(map_frames).
+"""
+
+import os
+import cache_utils as cu
+import detect_scenes as ds
+import video_downloader as vd
+import ffmpeg_utils as fu
+
+
+# youtube-dl format of a separately downloaded proxy, the smallest stream of
+# at least 360p or the largest one below that
+PROXY_FORMAT = 'worstvideo[height>=360][ext=mp4]/bestvideo[height<=360]'
+
+
+def make_proxy(video_file, height=360, cache_dir='proxy_cache', crf=28,
+               preset='veryfast'):
+    """
+    Makes the analysis proxy of a video, or returns the cached one.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the full resolution video
+    
+    height
+      height of the proxy in pixels, the width keeps the aspect ratio
+    
+    cache_dir
+      folder to cache the proxies in
+    
+    crf, preset
+      x264 quality and speed settings, the proxy only needs to be good enough
+      to detect cuts
+    
+    Returns
+    --------
+    
+    proxy_file
+      filepath of the proxy
+    """
+    
+    key = '%s_%dp' % (cu.file_hash(video_file), height)
+    proxy_file = cu.cache_path(cache_dir, key, '.mp4')
+    
+    if not os.path.isfile(proxy_file):
+        
+        # Every frame is kept as is (passthrough), so frame numbers in the
+        # proxy are the same as in the source
+        temp_file = proxy_file + '.%d.tmp' % os.getpid()
+        fu.run_ffmpeg(['-i', video_file, '-map', '0:v:0', '-an', '-sn',
+                       '-vsync', 'passthrough',
+                       '-vf', 'scale=-2:%d' % height,
+                       '-c:v', 'libx264', '-preset', preset, '-crf', crf,
+                       '-pix_fmt', 'yuv420p', '-f', 'mp4', temp_file])
+        os.replace(temp_file, proxy_file)
+    
+    return proxy_file
+
+
+def download_proxy(url, output, quiet=True):
+    """
+    Downloads a low resolution copy of a video to use as its proxy.
+    
+    Parameters are the same as in video_downloader.download_video, returns the
+    filepath of the proxy.
+    """
+    
+    return vd.download_video(url, output=output, quiet=quiet,
+                             video_format=PROXY_FORMAT)
+
+
+def map_frames(frames, from_fps, to_fps):
+    """
+    Maps frame numbers from a stream at from_fps to the frames shown at the
+    same time in a stream at to_fps.
+    """
+    
+    if from_fps == to_fps:
+        return [int(frame) for frame in frames]
+    
+    return [int(round(frame * float(to_fps) / from_fps)) for frame in frames]
+
+
+def analyze_video(video_file, proxy_file=None, cache_dir='proxy_cache',
+                  **kwargs):
+    """
+    Analyzes a video for scene transitions using its proxy.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the full resolution video
+    
+    proxy_file
+      filepath of the proxy, made with make_proxy if None
+    
+    cache_dir
+      folder to cache the proxies in
+    
+    kwargs
+      passed on to detect_scenes.analyze_video (threshold, min_scene_len,
+      stats_file, ...)
+    
+    Returns
+    --------
+    
+    Same as detect_scenes.analyze_video, with the frame rate and frame
+    numbers of the full resolution video.
+    """
+    
+    if proxy_file is None:
+        proxy_file = make_proxy(video_file, cache_dir=cache_dir)
+    
+    proxy_fps, frames_read, frames_processed, scene_list = ds.analyze_video(
+        proxy_file, **kwargs)
+    
+    # A proxy made by make_proxy has the very same frames, only map frames
+    # when the frame rates really differ
+    video_fps = fu.probe_video(video_file)['fps'] or proxy_fps
+    if abs(video_fps - proxy_fps) < 1e-3 * proxy_fps:
+        video_fps = proxy_fps
+    
+    # Put the frame numbers back in terms of the full resolution video
+    scene_list = map_frames(scene_list, proxy_fps, video_fps)
+    frames_read = map_frames([frames_read], proxy_fps, video_fps)[0]
+    
+    return (video_fps, frames_read, frames_processed, scene_list)
@@ -0,0 +1,232 @@
+"""Exact frame timestamps and keyframe positions of a video.
+
+Everything used to turn frame numbers into times as frame_num / video_fps,
+which only holds for a constant frame rate. Phone footage is usually recorded
+with a variable frame rate, where the frames drift away from that grid by
+whole seconds over a few minutes, so scene times, the rolling edit rate and
+every seek came out wrong.
+
+A PTSIndex holds the presentation timestamp of every frame of a video and
+which frames are keyframes. It is built in a single demux pass with ffprobe
+(only packet headers are read, nothing is decoded) and cached on disk by the
+hash of the video, so building it costs about as much as reading the file
+once. Lookups are array indexing: the time of a frame, the frame playing at a
+time (a binary search) and the keyframe at or before a frame, which is
+precomputed for every frame.
+
+Times are in seconds from the first frame, the same origin ffmpeg's -ss and
+moviepy's clip times use. Videos without usable timestamps (raw streams, some
+broken files) get no index from try_load_index, and frame_msec then falls
+back to a constant frame rate like before.
+"""
+
+import os
+import numpy as np
+import cache_utils as cu
+import ffmpeg_utils as fu
+
+
+# Frame durations spreading more than this share of the typical duration mark
+# a video as variable frame rate
+VFR_TOLERANCE = 0.01
+
+
+class PTSIndex(object):
+    """Frame timestamps and keyframes of a video, see the module docstring."""
+    
+    def __init__(self, times, keyframes, duration):
+        """
+        Parameters
+        -----------
+        
+        times
+          sorted numpy array with the timestamp of every frame in seconds,
+          starting at 0
+        
+        keyframes
+          boolean numpy array, True for the keyframes
+        
+        duration
+          time in seconds at which the last frame ends
+        """
+        
+        self.times = np.asarray(times, dtype=float)
+        self.keyframes = np.asarray(keyframes, dtype=bool)
+        self.duration = float(duration)
+        self.frames = len(self.times)
+        self.avg_fps = self.frames / self.duration
+        
+        # Frame starts with the end of the video appended, for frame_time
+        self._bounds = np.append(self.times, self.duration)
+        
+        # Keyframe at or before every frame
+        positions = np.where(self.keyframes, np.arange(self.frames), 0)
+        self._prev_key = np.maximum.accumulate(positions)
+        
+        frame_durs = np.diff(self._bounds)
+        typical = np.median(frame_durs)
+        self.is_vfr = bool(np.ptp(frame_durs) > VFR_TOLERANCE * typical)
+    
+    def frame_time(self, frames):
+        """
+        Start time in seconds of a frame number, or of an array of them.
+        Frames past the end continue at the average frame rate.
+        """
+        
+        frames = np.asarray(frames).astype(int)
+        inside = np.clip(frames, 0, self.frames)
+        
+        return self._bounds[inside] + (frames - inside) / self.avg_fps
+    
+    def frame_msec(self, frames):
+        """Same as frame_time, in milliseconds."""
+        
+        return 1000.0 * self.frame_time(frames)
+    
+    def boundary_time(self, frames):
+        """
+        Time halfway between a frame and the one before it. Seeking there, or
+        comparing clip times with it, can't land on the wrong frame through
+        rounding.
+        """
+        
+        frames = np.asarray(frames).astype(int)
+        
+        return (self.frame_time(frames - 1) + self.frame_time(frames)) / 2.0
+    
+    def frame_at(self, t):
+        """Number of the frame playing at time t (in seconds)."""
+        
+        frame = np.searchsorted(self.times, t, side='right') - 1
+        
+        return np.clip(frame, 0, self.frames - 1)
+    
+    def keyframe_before(self, frame):
+        """Number of the keyframe at or before a frame."""
+        
+        return self._prev_key[np.clip(int(frame), 0, self.frames - 1)]
+    
+    def keyframe_times(self):
+        """Sorted numpy array of the keyframe timestamps in seconds."""
+        
+        return self.times[self.keyframes]
+
+
+def build_index(video_file):
+    """
+    Reads the timestamps and keyframe flags of the first video stream of a
+    file with ffprobe, without decoding it.
+    
+    Raises IOError if the stream has no timestamps.
+    """
+    
+    out = fu.run_ffprobe(['-select_streams', 'v:0',
+                          '-show_entries', 'packet=pts_time,duration_time,'
+                                           'flags',
+                          '-of', 'csv=p=0', video_file])
+    
+    packets = []
+    for line in out.splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 3 or fields[0] in ('', 'N/A'):
+            continue
+        frame_dur = float(fields[1]) if fields[1] not in ('', 'N/A') else 0.0
+        packets.append((float(fields[0]), frame_dur, 'K' in fields[2]))
+    
+    if not packets:
+        raise IOError('No video timestamps found in %s' % video_file)
+    
+    # Packets come in decoding order, frames are numbered in display order
+    packets.sort()
+    times = np.array([packet[0] for packet in packets])
+    keyframes = np.array([packet[2] for packet in packets], dtype=bool)
+    times -= times[0]
+    
+    # The last frame lasts its packet duration, or a typical frame otherwise
+    last_dur = packets[-1][1]
+    if last_dur <= 0:
+        last_dur = np.median(np.diff(times)) if len(times) > 1 else 0.04
+    
+    return PTSIndex(times, keyframes, times[-1] + last_dur)
+
+
+def load_index(video_file, cache_dir='pts_cache'):
+    """
+    Returns the PTSIndex of a video, building and caching it if needed.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the video
+    
+    cache_dir
+      folder to cache the indexes in, None to always build the index
+    
+    Returns
+    --------
+    
+    pts_index
+      PTSIndex of the video
+    """
+    
+    if cache_dir is None:
+        return build_index(video_file)
+    
+    cache_file = cu.cache_path(cache_dir, cu.file_hash(video_file), '.npz')
+    
+    if not os.path.isfile(cache_file):
+        
+        # Save under a temporary name first so a crash can't leave a partial
+        # file that looks like a finished cache entry
+        pts_index = build_index(video_file)
+        temp_file = cache_file + '.%d.tmp' % os.getpid()
+        with open(temp_file, 'wb') as f:
+            np.savez(f, times=pts_index.times, keyframes=pts_index.keyframes,
+                     duration=pts_index.duration)
+        os.replace(temp_file, cache_file)
+        
+        return pts_index
+    
+    with np.load(cache_file) as data:
+        return PTSIndex(data['times'], data['keyframes'],
+                        float(data['duration']))
+
+
+def try_load_index(video_file, cache_dir='pts_cache'):
+    """
+    Same as load_index, but returns None if the video has no timestamps to
+    index, or ffprobe can't read them.
+    """
+    
+    try:
+        return load_index(video_file, cache_dir=cache_dir)
+    
+    except IOError as err:
+        print('No frame timestamps, assuming a constant frame rate (%s)' % err)
+        return None
+
+
+def frame_msec(frames, video_fps, pts_index=None):
+    """
+    Start time in milliseconds of frame numbers, from pts_index if given and
+    at a constant video_fps otherwise.
+    """
+    
+    if pts_index is not None:
+        return pts_index.frame_msec(frames)
+    
+    return np.asarray(frames) * 1000.0 / video_fps
+
+
+if __name__ == '__main__':
+    
+    # Specify video file here
+    video_file = 'BTS_2017_DNA.mkv'
+    
+    pts_index = load_index(video_file)
+    
+    print('%d frames, %d keyframes, %0.3f sec, %0.3f fps on average%s' %
+          (pts_index.frames, pts_index.keyframes.sum(), pts_index.duration,
+           pts_index.avg_fps, ', variable frame rate' if pts_index.is_vfr
+           else ''))
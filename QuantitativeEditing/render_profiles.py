@@ -0,0 +1,71 @@
+"""Named render profiles for the analysis videos.
+
+A profile sets everything that trades render time for output quality at once,
+so a quick check of the detection results doesn't need a full quality render:
+
+  scale
+    output resolution relative to the source, text sizes scale with it
+
+  graph_fps_divisor
+    the graph and audio waveform layers are rendered at the video's frame rate
+    divided by this, and simply held between updates in the final video
+
+  preset
+    x264 encoding preset
+
+  threads
+    number of encoding threads, None lets ffmpeg decide
+
+The same scene data and layout code is used for every profile. A preview is
+about a tenth of the cost of a final render.
+"""
+
+import multiprocessing
+
+
+RENDER_PROFILES = {
+    'preview': {'scale': 0.25,
+                'graph_fps_divisor': 6,
+                'preset': 'ultrafast',
+                'threads': multiprocessing.cpu_count()},
+    'review': {'scale': 0.5,
+               'graph_fps_divisor': 2,
+               'preset': 'veryfast',
+               'threads': multiprocessing.cpu_count()},
+    'final': {'scale': 1.0,
+              'graph_fps_divisor': 1,
+              'preset': 'medium',
+              'threads': None},
+}
+
+
+def get_profile(name):
+    """
+    Returns the settings of a render profile.
+    
+    Raises ValueError if there is no profile with that name.
+    """
+    
+    if name not in RENDER_PROFILES:
+        raise ValueError('Unknown render profile %r, choose from: %s' %
+                         (name, ', '.join(sorted(RENDER_PROFILES))))
+    
+    return dict(RENDER_PROFILES[name])
+
+
+def scaled(size, profile):
+    """Scales a size in pixels (like a font size) by the profile's scale."""
+    
+    return max(1, int(round(size * profile['scale'])))
+
+
+def graph_fps(video_fps, profile):
+    """Frame rate to render the graph and waveform layers at."""
+    
+    return float(video_fps) / profile['graph_fps_divisor']
+
+
+def write_kwargs(profile):
+    """Keyword arguments for moviepy's write_videofile."""
+    
+    return {'preset': profile['preset'], 'threads': profile['threads']}
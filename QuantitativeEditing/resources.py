@@ -0,0 +1,175 @@
+"""Helpers for keeping track of memory and ffmpeg subprocesses.
+
+moviepy starts an ffmpeg process for the video reader of every VideoFileClip
+and another for its audio. These stay alive until the clip is garbage
+collected, so long loops that open clip after clip pile up processes and
+memory. close_clip shuts them down as soon as a clip is no longer needed.
+"""
+
+import os
+import resource
+import threading
+import multiprocessing
+
+
+def close_clip(clip):
+    """
+    Stops the ffmpeg readers of a clip loaded with VideoFileClip.
+    
+    Clips derived from it (resized, annotated, ...) share the same readers and
+    should not be used afterwards. Safe to call on clips without readers.
+    """
+    
+    reader = getattr(clip, 'reader', None)
+    if reader is not None:
+        reader.close()
+    
+    audio = getattr(clip, 'audio', None)
+    audio_reader = getattr(audio, 'reader', None)
+    if audio_reader is not None:
+        audio_reader.close_proc()
+
+
+def available_memory():
+    """
+    Memory in bytes that can be used without swapping.
+    
+    Reads MemAvailable from /proc/meminfo, falls back to the total physical
+    memory if that isn't there.
+    """
+    
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+def peak_memory():
+    """
+    Peak resident memory in bytes of this process and of its finished
+    subprocesses (the largest one, not the sum), as reported by getrusage.
+    """
+    
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    
+    # ru_maxrss is in kilobytes on Linux
+    return own * 1024, children * 1024
+
+
+def tree_memory(pid=None):
+    """
+    Current resident memory in bytes of a process and all of its
+    subprocesses, read from /proc. Defaults to this process.
+    """
+    
+    if pid is None:
+        pid = os.getpid()
+    
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    
+    # Parent and resident pages of every process
+    parents = {}
+    rss = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % entry) as f:
+                stat = f.read()
+        except IOError:
+            continue
+        
+        # The command name in brackets may contain spaces
+        fields = stat[stat.rindex(')') + 2:].split()
+        parents[int(entry)] = int(fields[1])
+        rss[int(entry)] = int(fields[21]) * page_size
+    
+    total = 0
+    todo = [pid]
+    while todo:
+        current = todo.pop()
+        total += rss.get(current, 0)
+        todo += [child for child, parent in parents.items()
+                 if parent == current]
+    
+    return total
+
+
+class MemorySampler(object):
+    """
+    Keeps track of the peak memory of this process and its subprocesses (see
+    tree_memory) by sampling it in a background thread.
+    
+    Used as a context manager around a stretch of work, after which peak holds
+    the largest total seen. Unlike peak_memory, this covers subprocesses that
+    are still running and is reset for every stretch.
+    """
+    
+    def __init__(self, interval=0.25):
+        
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def _sample(self):
+        
+        while True:
+            self.peak = max(self.peak, tree_memory())
+            if self._stop.wait(self.interval):
+                break
+    
+    def __enter__(self):
+        
+        self._thread = threading.Thread(target=self._sample)
+        self._thread.daemon = True
+        self._thread.start()
+        
+        return self
+    
+    def __exit__(self, *exc_info):
+        
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, tree_memory())
+        
+        return False
+
+
+def worker_count(job_memory, memory_budget=None, max_workers=None):
+    """
+    Number of worker processes that fit in a memory budget.
+    
+    Parameters
+    -----------
+    
+    job_memory
+      estimated peak memory of a single job in bytes
+    
+    memory_budget
+      total memory in bytes the workers may use, the currently available
+      memory if None
+    
+    max_workers
+      upper limit on the number of workers, the number of CPUs if None
+    
+    Returns
+    --------
+    
+    workers
+      number of workers to run, at least 1
+    """
+    
+    if memory_budget is None:
+        memory_budget = available_memory()
+    
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+    
+    return max(1, min(max_workers, int(memory_budget // job_memory)))
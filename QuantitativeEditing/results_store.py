@@ -0,0 +1,290 @@
+"""A SQLite database of detection results across the whole corpus.
+
+Every detection run of every video is kept, instead of a scene list .csv that
+the next run overwrites. There are three tables:
+
+  videos  one row per music video: artist, year, title and genre (from
+          video_list.csv), plus the url and content hash when known
+  runs    one row per detection run of a video: the detector and its
+          parameters, how long detection took and the summary numbers shown
+          on the results screen (number of scenes, duration, average rate of
+          transitions, average seconds per scene)
+  cuts    one row per scene of a run: its number, first frame, start and
+          duration
+
+Indexes on the genre and year of videos, the video and parameters of runs and
+the run of cuts keep corpus questions like "average shot length by genre and
+year" (see shot_length_by) quick without reading any video or .csv file.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import numpy as np
+
+
+RESULTS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS videos (
+    video_id INTEGER PRIMARY KEY,
+    artist TEXT,
+    year INTEGER,
+    title TEXT,
+    genre TEXT,
+    url TEXT,
+    content_hash TEXT,
+    UNIQUE (artist, year, title)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    video_id INTEGER REFERENCES videos (video_id),
+    detector TEXT,
+    threshold REAL,
+    min_scene_len INTEGER,
+    params TEXT,
+    video_fps REAL,
+    frames INTEGER,
+    duration REAL,
+    n_scenes INTEGER,
+    avg_rate REAL,
+    sec_per_scene REAL,
+    detect_seconds REAL,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS cuts (
+    run_id INTEGER REFERENCES runs (run_id),
+    scene_idx INTEGER,
+    frame INTEGER,
+    start_msec REAL,
+    duration_msec REAL
+);
+CREATE INDEX IF NOT EXISTS videos_genre_year ON videos (genre, year);
+CREATE INDEX IF NOT EXISTS runs_video ON runs (video_id, detector, threshold,
+                                               min_scene_len);
+CREATE INDEX IF NOT EXISTS cuts_run ON cuts (run_id, scene_idx);
+'''
+
+
+def parse_video_name(video_file):
+    """
+    Splits a filename made as Artist_Year_Title (see complete_process.py)
+    into (artist, year, title). Names that don't follow it come back as
+    (name, None, None).
+    """
+    
+    name = os.path.splitext(os.path.basename(video_file))[0]
+    parts = name.split('_', 2)
+    
+    if len(parts) == 3 and parts[1].isdigit():
+        return parts[0], int(parts[1]), parts[2]
+    
+    return name, None, None
+
+
+def scene_stats(scene_array):
+    """
+    Summary numbers of a scene table from detect_scenes.scene_table.
+    
+    Returns a dict with the duration in seconds, the number of scenes, the
+    average rate of transitions per second and the average seconds per scene.
+    """
+    
+    duration = scene_array[-1, 1] / 1000.0
+    n_scenes = len(scene_array) - 1
+    
+    return {'duration': duration,
+            'n_scenes': n_scenes,
+            'avg_rate': n_scenes / duration if duration else 0.0,
+            'sec_per_scene': duration / n_scenes if n_scenes else 0.0}
+
+
+class ResultsStore(object):
+    """The results database, see the module docstring."""
+    
+    def __init__(self, filename='results.sqlite'):
+        
+        # Several batch workers may write at the same time, wait for the lock
+        self.conn = sqlite3.connect(filename, timeout=60)
+        self.conn.executescript(RESULTS_SCHEMA)
+    
+    def close(self):
+        
+        self.conn.close()
+    
+    def add_video(self, artist, year, title, genre=None, url=None,
+                  content_hash=None):
+        """
+        Adds a video, or fills in what's missing of an existing one.
+        
+        Returns the video_id.
+        """
+        
+        with self.conn:
+            
+            # Take the write lock before the lookup, so two workers adding the
+            # same video can't both find it missing and insert it twice
+            self.conn.execute('BEGIN IMMEDIATE')
+            
+            # Looked up by hand rather than relying on the UNIQUE constraint,
+            # which doesn't catch duplicates with a NULL year
+            row = self.conn.execute('SELECT video_id FROM videos WHERE '
+                                    'artist = ? AND year IS ? AND title = ?',
+                                    (artist, year, title)).fetchone()
+            
+            if row is None:
+                cur = self.conn.execute('INSERT INTO videos (artist, year, '
+                                        'title) VALUES (?, ?, ?)',
+                                        (artist, year, title))
+                row = (cur.lastrowid,)
+            
+            self.conn.execute('UPDATE videos SET '
+                              'genre = COALESCE(?, genre), '
+                              'url = COALESCE(?, url), '
+                              'content_hash = COALESCE(?, content_hash) '
+                              'WHERE video_id = ?',
+                              (genre, url, content_hash, row[0]))
+        
+        return row[0]
+    
+    def import_video_list(self, csv_file='video_list.csv'):
+        """
+        Adds every video of a video_list.csv, see video_downloader.py for the
+        format. Returns the number of videos.
+        """
+        
+        import pandas as pd
+        
+        video_list = pd.read_csv(csv_file)
+        for row in video_list.itertuples(index=False):
+            self.add_video(str(row[0]), int(row[3]), str(row[1]),
+                           genre=str(row[2]), url=str(row[4]))
+        
+        return len(video_list)
+    
+    def add_run(self, video_id, scene_array, video_fps, threshold=None,
+                min_scene_len=None, detector='content', params=None,
+                detect_seconds=None):
+        """
+        Stores a detection run and its cuts.
+        
+        Parameters
+        -----------
+        
+        video_id
+          video the run belongs to, from add_video
+        
+        scene_array
+          scene table from detect_scenes.scene_table
+        
+        video_fps
+          frames per second of the video
+        
+        threshold, min_scene_len, detector
+          detection settings
+        
+        params
+          dict of any other settings, stored as JSON
+        
+        detect_seconds
+          how long detection took
+        
+        Returns
+        --------
+        
+        run_id
+          id of the new run
+        """
+        
+        stats = scene_stats(scene_array)
+        
+        with self.conn:
+            cur = self.conn.execute(
+                'INSERT INTO runs (video_id, detector, threshold, '
+                'min_scene_len, params, video_fps, frames, duration, '
+                'n_scenes, avg_rate, sec_per_scene, detect_seconds, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (video_id, detector, threshold, min_scene_len,
+                 json.dumps(params or {}, sort_keys=True), video_fps,
+                 int(scene_array[-1, 0]), stats['duration'],
+                 stats['n_scenes'], stats['avg_rate'],
+                 stats['sec_per_scene'], detect_seconds, time.time()))
+            run_id = cur.lastrowid
+            
+            # Scene k starts at row k - 1 and its duration is in row k
+            self.conn.executemany(
+                'INSERT INTO cuts VALUES (?, ?, ?, ?, ?)',
+                ((run_id, scene_idx, int(scene_array[scene_idx - 1, 0]),
+                  float(scene_array[scene_idx - 1, 1]),
+                  float(scene_array[scene_idx, 2]))
+                 for scene_idx in range(1, len(scene_array))))
+        
+        return run_id
+    
+    def scene_table(self, run_id):
+        """
+        Rebuilds the scene table of a run, the same array as
+        detect_scenes.scene_table.
+        """
+        
+        run = self.conn.execute('SELECT frames, duration FROM runs '
+                                'WHERE run_id = ?', (run_id,)).fetchone()
+        cuts = self.conn.execute('SELECT frame, start_msec, duration_msec '
+                                 'FROM cuts WHERE run_id = ? '
+                                 'ORDER BY scene_idx', (run_id,)).fetchall()
+        
+        frames = np.array([cut[0] for cut in cuts] + [run[0]])
+        starts = np.array([cut[1] for cut in cuts] + [run[1] * 1000.0])
+        durations = np.diff(np.insert(starts, 0, 0))
+        
+        return np.column_stack((frames, starts, durations))
+    
+    def latest_runs(self, detector='content', threshold=None,
+                    min_scene_len=None):
+        """
+        The newest run of every video with the given settings, as a list of
+        (video_id, run_id). None matches any value of a setting.
+        """
+        
+        return self.conn.execute(
+            'SELECT video_id, MAX(run_id) FROM runs '
+            'WHERE detector = ? AND (? IS NULL OR threshold = ?) '
+            'AND (? IS NULL OR min_scene_len = ?) GROUP BY video_id',
+            (detector, threshold, threshold, min_scene_len,
+             min_scene_len)).fetchall()
+    
+    def shot_length_by(self, group_by=('genre', 'year'), detector='content',
+                       threshold=None, min_scene_len=None):
+        """
+        Average shot length in seconds over the latest run of every video,
+        grouped by columns of the videos table.
+        
+        Returns a list of tuples of the group values followed by the number of
+        videos, the number of shots and the average shot length.
+        """
+        
+        columns = ', '.join('v.' + column for column in group_by)
+        
+        return self.conn.execute(
+            'WITH latest AS (SELECT video_id, MAX(run_id) AS run_id FROM runs '
+            '    WHERE detector = ? AND (? IS NULL OR threshold = ?) '
+            '    AND (? IS NULL OR min_scene_len = ?) GROUP BY video_id) '
+            'SELECT %s, COUNT(DISTINCT v.video_id), COUNT(*), '
+            '    AVG(c.duration_msec) / 1000.0 '
+            'FROM latest l JOIN videos v ON v.video_id = l.video_id '
+            'JOIN cuts c ON c.run_id = l.run_id '
+            'GROUP BY %s ORDER BY %s' % (columns, columns, columns),
+            (detector, threshold, threshold, min_scene_len,
+             min_scene_len)).fetchall()
+
+
+if __name__ == '__main__':
+
+    # Load the video metadata, then print the average shot lengths of every
+    # video analyzed so far
+    store = ResultsStore('results.sqlite')
+    store.import_video_list('video_list.csv')
+    
+    for row in store.shot_length_by(('genre', 'year')):
+        print('%-12s %s  %4d videos  %6d shots  %0.2f sec per shot' % row)
+    
+    store.close()
@@ -1,5 +1,6 @@
 import numpy as np
 import matplotlib.pyplot as plt
+import pts_index as pi
 
 from moviepy.editor import *
 from moviepy.video.io.bindings import mplfig_to_npimage
@@ -9,6 +10,9 @@ if __name__ == '__main__':
     #Boolean to set whether to include audio or not in final product
     include_audio = False
     
+    # The video the scene list was made from
+    video_file = '/home/walter/Videos/Music Videos/BTS_2017_DNA.mkv'
+    
     # Read in data generated from previous video analysis
     scenes = np.loadtxt('MV_scenelist.csv', delimiter=',')
     
@@ -17,8 +21,12 @@ if __name__ == '__main__':
     scene_times = scenes[:, 1]
     scene_durs = scenes[:, 2]
     
-    # Calculate the time that passes each frame
-    msec_per_frame = scene_times[-1] / scene_frames[-1]
+    # Time of every frame, from the video's frame timestamps, or at the
+    # average frame rate of the scene list if it has none
+    pts_index = pi.try_load_index(video_file)
+    video_fps = 1000.0 * scene_frames[-1] / scene_times[-1]
+    frame_msec = pi.frame_msec(np.arange(int(np.max(scene_frames)) + 1),
+                               video_fps, pts_index)
     
     # Initialize a list to keep track of edits/sec
     rolling_average = []
@@ -38,7 +46,7 @@ if __name__ == '__main__':
             continue
         
         # Find current time in msec
-        current_time = i * msec_per_frame
+        current_time = frame_msec[i]
         
         # Find all scenes that have happened prior to current frame
         in_window_scenes = scene_times[np.where(current_time >= scene_times)]
@@ -195,7 +203,7 @@ if __name__ == '__main__':
     
     # Figure out the timing of the longest scene
     scene_start = scene_times[scene_idx - 1] / 1000.0
-    scene_end = (scene_times[scene_idx] - msec_per_frame) / 1000.0
+    scene_end = frame_msec[int(scene_frames[scene_idx]) - 1] / 1000.0
     scene_duration = scene_end - scene_start
     
     # Make the text for the top of the screen
@@ -212,7 +220,6 @@ if __name__ == '__main__':
     dur_text = dur_text.set_pos('center').set_pos('bottom')
     
     # Load the longest scene from the previously annotated video
-    video_file = '/home/walter/Videos/Music Videos/BTS_2017_DNA.mkv'
     longest_scene = (VideoFileClip(video_file).
                      subclip(scene_start, scene_end))
     
@@ -0,0 +1,326 @@
+"""Extracts single scenes from a video mostly by stream copy.
+
+Cutting a scene out with moviepy's subclip decodes, composites and re-encodes
+every frame of it. For H.264 sources, only the partial GOPs at either end of a
+scene actually need re-encoding: everything from the first keyframe inside the
+scene up to the last one is copied as is. The pieces are joined as MPEG-TS,
+which carries the codec parameters in-band so the copied and re-encoded parts
+can be played back to back.
+"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import ffmpeg_utils as fu
+import pts_index as pi
+import workspace as wsp
+
+
+# Frame rates closer than this share of each other count as the same, moviepy
+# writes its frame rate rounded to two decimals
+FPS_TOLERANCE = 1e-3
+
+
+def keyframe_times(video_file, cache_dir='pts_cache'):
+    """
+    Lists the keyframes of the first video stream of a file.
+    
+    Only packet headers are read, nothing is decoded, and the result is
+    cached with the rest of the video's pts_index.PTSIndex.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the video
+    
+    cache_dir
+      folder of the PTS index cache, None to not cache
+    
+    Returns
+    --------
+    
+    keyframes
+      sorted numpy array of keyframe timestamps in seconds from the first
+      frame
+    """
+    
+    return pi.load_index(video_file, cache_dir=cache_dir).keyframe_times()
+
+
+def concat_copy(parts, output, work_dir=None):
+    """
+    Joins video files end to end without re-encoding them.
+    
+    All parts need the same codecs, resolution and frame rate, see
+    can_splice. They are remuxed to MPEG-TS and joined with ffmpeg's concat protocol.
+    
+    Parameters
+    -----------
+    
+    parts
+      list of filepaths to join, in order. Files ending in .ts are used as is.
+    
+    output
+      filepath to save the joined video to
+    
+    work_dir
+      folder for the intermediate .ts files, a temporary folder if None, see
+      workspace.workspace_root
+    
+    Returns
+    --------
+    
+    output
+      Simply returns the filepath to the joined video
+    """
+    
+    temp_dir = tempfile.mkdtemp(prefix='qe_concat_',
+                                dir=work_dir or wsp.workspace_root())
+    
+    try:
+        ts_parts = []
+        for part_idx, part in enumerate(parts):
+            if fu.container_format(part) == 'ts':
+                ts_parts.append(part)
+                continue
+            
+            ts_part = os.path.join(temp_dir, 'part%04d.ts' % part_idx)
+            fu.run_ffmpeg(['-i', part, '-c', 'copy',
+                           '-bsf:v', 'h264_mp4toannexb', '-f', 'mpegts',
+                           ts_part])
+            ts_parts.append(ts_part)
+        
+        args = ['-i', 'concat:' + '|'.join(ts_parts), '-c', 'copy']
+        if fu.container_format(output) in ('mp4', 'm4v', 'mov'):
+            args += ['-bsf:a', 'aac_adtstoasc']
+        
+        fu.run_ffmpeg(args + [output])
+    
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    return output
+
+
+def can_splice(info, other):
+    """
+    Whether two videos can be joined with concat_copy.
+    
+    Parameters
+    -----------
+    
+    info, other
+      stream info of the two videos, as returned by ffmpeg_utils.probe_video
+    
+    Returns
+    --------
+    
+    can_splice
+      True if both have the same video codec, resolution, pixel format and
+      frame rate
+    """
+    
+    if any(info[key] != other[key] for key in ('codec', 'width', 'height',
+                                               'pix_fmt')):
+        return False
+    
+    return abs(info['fps'] - other['fps']) <= FPS_TOLERANCE * other['fps']
+
+
+def _encode_part(video_file, start, duration, output, info, preset):
+    """Re-encodes a stretch of video only, matching the source's format."""
+    
+    fu.run_ffmpeg(['-ss', '%0.6f' % start, '-i', video_file,
+                   '-t', '%0.6f' % duration, '-an',
+                   '-c:v', 'libx264', '-preset', preset,
+                   '-pix_fmt', info['pix_fmt'] or 'yuv420p',
+                   '-r', '%0.6f' % info['fps'],
+                   '-f', 'mpegts', output])
+
+
+def extract_scene(video_file, start, end, output, keyframes=None,
+                  include_audio=True, preset='medium'):
+    """
+    Cuts a scene out of a video, re-encoding only the partial GOPs at its ends.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the source video
+    
+    start, end
+      start and end of the scene in seconds
+    
+    output
+      filepath to save the scene to. Use a .ts output if the scene will be
+      spliced onto other videos with concat_copy.
+    
+    keyframes
+      keyframe timestamps from keyframe_times, looked up if None
+    
+    include_audio
+      whether to keep the audio. Audio is re-encoded to 44.1kHz stereo AAC,
+      which costs next to nothing and lines up with moviepy's output.
+    
+    preset
+      x264 preset for the re-encoded parts
+    
+    Returns
+    --------
+    
+    output
+      Simply returns the filepath to the saved scene
+    """
+    
+    info = fu.probe_video(video_file)
+    half_frame = 0.5 / info['fps']
+    
+    if keyframes is None:
+        keyframes = keyframe_times(video_file)
+    
+    # Keyframes that fall inside of the scene
+    inside = keyframes[(keyframes >= start) & (keyframes <= end)]
+    
+    temp_dir = tempfile.mkdtemp(prefix='qe_scene_', dir=wsp.workspace_root())
+    
+    try:
+        parts = []
+        
+        # Stream copy only works for H.264 and needs a keyframe in the scene
+        if info['codec'] != 'h264' or len(inside) == 0:
+            part = os.path.join(temp_dir, 'whole.ts')
+            _encode_part(video_file, start, end - start, part, info, preset)
+            parts.append(part)
+        
+        else:
+            first_key, last_key = inside[0], inside[-1]
+            
+            # Partial GOP before the first keyframe
+            if first_key - start > half_frame:
+                part = os.path.join(temp_dir, 'head.ts')
+                _encode_part(video_file, start, first_key - start, part, info,
+                             preset)
+                parts.append(part)
+            
+            # Whole GOPs in between, copied as they are. Seeking a little past
+            # the keyframe still lands on it, and stopping a little short
+            # keeps the next keyframe out.
+            if last_key - first_key > half_frame:
+                part = os.path.join(temp_dir, 'middle.ts')
+                fu.run_ffmpeg(['-ss', '%0.6f' % (first_key + 0.001),
+                               '-i', video_file,
+                               '-t', '%0.6f' % (last_key - first_key -
+                                                half_frame),
+                               '-an', '-c:v', 'copy',
+                               '-bsf:v', 'h264_mp4toannexb',
+                               '-avoid_negative_ts', 'make_zero',
+                               '-f', 'mpegts', part])
+                parts.append(part)
+            
+            # Partial GOP from the last keyframe to the end of the scene
+            if end - last_key > half_frame:
+                part = os.path.join(temp_dir, 'tail.ts')
+                _encode_part(video_file, last_key, end - last_key, part, info,
+                             preset)
+                parts.append(part)
+        
+        # Join the video pieces
+        video_only = os.path.join(temp_dir, 'video.ts')
+        concat_copy(parts, video_only, work_dir=temp_dir)
+        
+        # Add the audio of the scene back in
+        args = ['-i', video_only]
+        if include_audio and info['has_audio']:
+            args += ['-ss', '%0.6f' % start, '-t', '%0.6f' % (end - start),
+                     '-i', video_file, '-map', '0:v', '-map', '1:a',
+                     '-c:a', 'aac', '-ar', '44100', '-ac', '2']
+        args += ['-c:v', 'copy']
+        if fu.container_format(output) == 'ts':
+            args += ['-f', 'mpegts']
+        
+        fu.run_ffmpeg(args + [output])
+    
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    return output
+
+
+def extract_top_scenes(video_file, scene_array, output_prefix, n=1,
+                       include_audio=True, preset='medium', ext='.mp4'):
+    """
+    Extracts the n longest scenes of a video.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the source video
+    
+    scene_array
+      scene table as returned by detect_scenes.scene_table
+    
+    output_prefix
+      filepath prefix for the outputs, which are saved as
+      prefix + '_scene%03d' + ext with the scene number
+    
+    n
+      number of scenes to extract
+    
+    include_audio, preset
+      same as in extract_scene
+    
+    ext
+      extension of the saved scenes
+    
+    Returns
+    --------
+    
+    outputs
+      list of (scene number, start, end, filepath) tuples, longest first
+    """
+    
+    keyframes = keyframe_times(video_file)
+    scene_times = scene_array[:, 1] / 1000.0
+    scene_durs = scene_array[:, 2]
+    
+    outputs = []
+    for scene_idx in np.argsort(scene_durs)[::-1][:n]:
+        if scene_idx == 0:
+            continue
+        
+        start, end = scene_times[scene_idx - 1], scene_times[scene_idx]
+        output = output_prefix + '_scene%03d' % scene_idx + ext
+        
+        extract_scene(video_file, start, end, output, keyframes=keyframes,
+                      include_audio=include_audio, preset=preset)
+        outputs.append((scene_idx, start, end, output))
+    
+    return outputs
+
+
+if __name__ == '__main__':
+
+    import detect_scenes as ds
+    
+    # Specify video file and constants here
+    video_file = 'BTS_2017_DNA.mkv'
+    threshold = 21
+    min_scene_len = 15
+    top_n = 5
+    
+    # Detect the scenes
+    video_fps, frames_read, _, scene_list = ds.analyze_video(
+        video_file, threshold=threshold, min_scene_len=min_scene_len)
+    scene_array = ds.scene_table(scene_list, video_fps, frames_read,
+                                 pi.try_load_index(video_file))
+    
+    # Save the longest few scenes
+    for scene_idx, start, end, output in extract_top_scenes(
+            video_file, scene_array, os.path.splitext(video_file)[0],
+            n=top_n):
+        print('Scene %03d: %0.3f to %0.3f seconds -> %s' %
+              (scene_idx, start, end, output))
@@ -0,0 +1,193 @@
+"""Graph animations of the scene transitions, drawn for any stretch of a video.
+
+The graphs next to the annotated video show the rate of scene transitions over
+a rolling window and the number of scenes so far. complete_process.py draws
+them for the whole video at once, with axes fit to the totals (the highest
+rate, the number of scenes and the average rate), so every frame depends on
+every cut of the video.
+
+SceneGraphs draws every frame from the scene starts up to that frame alone:
+
+  rate    rolling rate of transitions, the y axis reaching up to the highest
+          rate so far (rounded up to a whole number), and the average rate so
+          far as the reference line
+  count   number of scenes so far, the y axis reaching up to that count
+          (rounded up to a multiple of COUNT_STEP), and the average pace so
+          far carried on to the end of the video as the reference line
+
+So any stretch of the graphs can be drawn on its own, and comes out the same
+in every run with the same cuts up to its end. segment_render uses that to
+draw the graphs only for the segments it has to encode again. The other render
+backends still draw the graphs of complete_process.py, so their axes and
+reference lines come out different from these.
+"""
+
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+
+from moviepy.editor import *
+from moviepy.video.io.bindings import mplfig_to_npimage
+
+
+# Size of the figures in inches, the dpi is chosen to give the asked height
+FIGSIZE = (4, 4)
+
+# The count axis grows in steps of this many scenes
+COUNT_STEP = 10
+
+
+class SceneGraphs(object):
+    """The two graph animations of a scene table, see the module docstring."""
+    
+    def __init__(self, scene_times, duration, height, fps, window_sec=5.0,
+                 preset='ultrafast'):
+        """
+        Parameters
+        -----------
+        
+        scene_times
+          scene break times in msec, the second column of
+          detect_scenes.scene_table
+        
+        duration
+          duration of the video in seconds
+        
+        height
+          height in pixels of each graph
+        
+        fps
+          frame rate of the graph animations
+        
+        window_sec
+          length of the rolling window of the rate graph in seconds
+        
+        preset
+          x264 preset the stretches are encoded with, they are only
+          intermediate files
+        """
+        
+        self.scene_times = np.sort(np.asarray(scene_times, dtype=float))
+        self.duration = float(duration)
+        self.height = int(height) // 2 * 2
+        self.fps = float(fps)
+        self.window_sec = float(window_sec)
+        self.preset = preset
+        self.dpi = self.height / float(FIGSIZE[1])
+        
+        # Draw one frame to find the size matplotlib really gives
+        fig, draw = self._rate_figure()
+        self.size = draw(0.0).shape[1::-1]
+        plt.close(fig)
+    
+    def state(self):
+        """
+        Everything the graphs are drawn with besides the scene times, for
+        segment_render.render_segments.
+        """
+        
+        return {'window_sec': self.window_sec,
+                'duration': round(self.duration, 3),
+                'fps': round(self.fps, 6),
+                'size': list(self.size),
+                'preset': self.preset}
+    
+    def _samples(self, t):
+        """
+        Times in seconds of the graph frames up to t, with the number of
+        scene breaks at or before each of them and before its window.
+        """
+        
+        times = np.arange(int(np.floor(t * self.fps + 1e-6)) + 1) / self.fps
+        
+        # Scene breaks at or before every sample, and before its window
+        passed = np.searchsorted(self.scene_times, times * 1000.0,
+                                 side='right')
+        before = np.searchsorted(self.scene_times,
+                                 (times - self.window_sec) * 1000.0,
+                                 side='left')
+        
+        return times, passed, before
+    
+    def _rate_figure(self):
+        """Figure of the rate graph and a function drawing it at a time."""
+        
+        fig, ax = plt.subplots(1, figsize=FIGSIZE, dpi=self.dpi,
+                               facecolor='white')
+        ax.set_title("Rate of Scene Transitions \n (%0d sec Rolling Average)" %
+                     self.window_sec)
+        ax.set_xlim(0, self.duration)
+        ax.set_xlabel('Time (sec)')
+        ax.set_ylabel('Detected Rate of Transitions (changes/sec)')
+        line, = ax.plot(0, 0, 'k-')
+        line2, = ax.plot([0, self.duration], [0, 0], 'b-')
+        plt.tight_layout()
+        
+        def draw(t):
+            times, passed, before = self._samples(t)
+            rates = (passed - before) / self.window_sec
+            
+            # Cuts so far over the time so far, the first scene starts at 0
+            avg_rate = (passed[-1] - 1) / t if t > 0 else 0.0
+            
+            ax.set_ylim(0, max(1.0, np.ceil(rates.max())))
+            line.set_data(times, rates)
+            line2.set_ydata([avg_rate, avg_rate])
+            
+            return mplfig_to_npimage(fig)
+        
+        return fig, draw
+    
+    def _count_figure(self):
+        """Figure of the count graph and a function drawing it at a time."""
+        
+        fig, ax = plt.subplots(1, figsize=FIGSIZE, dpi=self.dpi,
+                               facecolor='white')
+        ax.set_title("Number of Scene Transitions")
+        ax.set_xlim(0, self.duration)
+        ax.set_xlabel('Time (sec)')
+        ax.set_ylabel('Total Number of Detected Scenes')
+        line, = ax.plot(0, 1, 'k-')
+        line2, = ax.plot([0, self.duration], [1, 1], 'b-')
+        plt.tight_layout()
+        
+        def draw(t):
+            # The scene times include the start of the first scene, so the
+            # scene breaks passed are the scenes so far
+            times, scenes, _ = self._samples(t)
+            
+            # Cuts so far over the time so far, carried on to the end of the
+            # video
+            pace = (scenes[-1] - 1) / t if t > 0 else 0.0
+            
+            ax.set_ylim(0, COUNT_STEP * max(1, int(np.ceil(
+                scenes[-1] / float(COUNT_STEP)))))
+            line.set_data(times, scenes)
+            line2.set_ydata([1, 1 + pace * self.duration])
+            
+            return mplfig_to_npimage(fig)
+        
+        return fig, draw
+    
+    def render(self, start, duration, work_dir):
+        """
+        Renders both graphs from start for duration seconds.
+        
+        Returns the filepaths of the rate and the count animation, saved in
+        work_dir and starting at start.
+        """
+        
+        outputs = []
+        for name, figure in (('rate', self._rate_figure),
+                             ('count', self._count_figure)):
+            fig, draw = figure()
+            output = os.path.join(work_dir, 'graph_%s.mp4' % name)
+            
+            animation = VideoClip(lambda t: draw(start + t), duration=duration)
+            animation.write_videofile(output, fps=self.fps,
+                                      preset=self.preset, verbose=False,
+                                      progress_bar=False)
+            plt.close(fig)
+            outputs.append(output)
+        
+        return outputs
@@ -0,0 +1,188 @@
+"""Renders the videos of a parameter screen in parallel.
+
+Every combination of settings is rendered as its own job in a pool of worker
+processes. Each worker handles a single job and is then replaced
+(max_tasks_per_child=1), so nothing a render leaks outlives it, and the clip's
+ffmpeg readers are closed as soon as the render is done. The number of workers
+is chosen to fit a memory budget. A worker killed by the system (usually for
+running out of memory) stops the screen with BrokenProcessPool rather than
+leaving it waiting forever.
+
+Videos are written under a temporary name and renamed when complete, so an
+interrupted screen can simply be run again: finished videos are skipped and
+partial ones are redone.
+"""
+
+import os
+import time
+import concurrent.futures as cf
+import annotation as an
+import resources as res
+import ffmpeg_utils as fu
+
+from moviepy.editor import *
+
+
+# Rough peak memory of a render job: the interpreter with moviepy loaded, plus
+# a number of copies of a decoded frame for the reader, the annotated frame and
+# the frames queued up in the encoder
+BASE_JOB_MEMORY = 300 * 1024 ** 2
+FRAMES_IN_FLIGHT = 40
+
+
+def screen_output(outfile_dir, outfile_prefix, threshold, min_scene_len):
+    """Filepath of the rendered video for one combination of settings."""
+    
+    return os.path.join(outfile_dir, outfile_prefix + str(threshold) + '_' +
+                        str(min_scene_len) + '.mp4')
+
+
+def estimate_job_memory(video_file):
+    """
+    Estimates the peak memory in bytes of rendering one screen video.
+    
+    Based on the resolution of the video, see BASE_JOB_MEMORY and
+    FRAMES_IN_FLIGHT.
+    """
+    
+    info = fu.probe_video(video_file)
+    frame_bytes = info['width'] * info['height'] * 3
+    
+    return BASE_JOB_MEMORY + FRAMES_IN_FLIGHT * frame_bytes
+
+
+def _render_job(job):
+    """Renders a single screen video, runs in a worker process."""
+    
+    start = time.time()
+    outfile = job['outfile']
+    
+    # moviepy picks the codec from the extension, so keep it at the end
+    base, ext = os.path.splitext(outfile)
+    partial = base + '.partial' + ext
+    
+    video_clip = VideoFileClip(job['video_file'])
+    
+    try:
+        # Draw the scene numbers over the original video
+        final_video = an.annotate_video(video_clip, job['scene_list'],
+                                        job['video_fps'])
+        
+        final_video.write_videofile(partial, fps=job['video_fps'],
+                                    preset=job['preset'],
+                                    threads=job['threads'],
+                                    verbose=False, progress_bar=False)
+    
+    finally:
+        res.close_clip(video_clip)
+    
+    os.replace(partial, outfile)
+    peak, peak_ffmpeg = res.peak_memory()
+    
+    return {'outfile': outfile,
+            'threshold': job['threshold'],
+            'min_scene_len': job['min_scene_len'],
+            'seconds': time.time() - start,
+            'peak_memory': peak,
+            'peak_ffmpeg_memory': peak_ffmpeg}
+
+
+def render_screen(video_file, rows, video_fps, outfile_dir, outfile_prefix,
+                  workers=None, memory_budget=None, preset='ultrafast',
+                  threads=1, resume=True):
+    """
+    Renders an annotated video for every row of a parameter screen.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the screened video
+    
+    rows
+      list of rows as returned by contact_sheet.screen_scenes
+    
+    video_fps
+      frames per second of the video
+    
+    outfile_dir
+      folder to save the videos to
+    
+    outfile_prefix
+      prefix of the saved videos, named prefix + threshold_min_scene_len.mp4
+    
+    workers
+      number of videos to render at once. If None, as many as fit in the
+      memory budget, up to the number of CPUs.
+    
+    memory_budget
+      memory in bytes the workers may use together, the currently available
+      memory if None
+    
+    preset
+      x264 encoding preset
+    
+    threads
+      encoding threads for each video
+    
+    resume
+      skip videos that were already rendered by a previous run
+    
+    Returns
+    --------
+    
+    results
+      list of dicts with the outfile, settings, render time in seconds and peak
+      memory of the worker and its ffmpeg processes in bytes, for every video
+      rendered by this run
+    """
+    
+    jobs = []
+    for row in rows:
+        outfile = screen_output(outfile_dir, outfile_prefix, row['threshold'],
+                                row['min_scene_len'])
+        
+        if resume and os.path.exists(outfile):
+            continue
+        
+        jobs.append({'video_file': video_file,
+                     'video_fps': video_fps,
+                     'scene_list': row['scene_list'],
+                     'threshold': row['threshold'],
+                     'min_scene_len': row['min_scene_len'],
+                     'outfile': outfile,
+                     'preset': preset,
+                     'threads': threads})
+    
+    print('%d of %d screen videos left to render' % (len(jobs), len(rows)))
+    if not jobs:
+        return []
+    
+    if workers is None:
+        workers = res.worker_count(estimate_job_memory(video_file),
+                                   memory_budget=memory_budget)
+    workers = min(workers, len(jobs))
+    
+    results = []
+    executor = cf.ProcessPoolExecutor(workers, max_tasks_per_child=1)
+    
+    try:
+        futures = [executor.submit(_render_job, job) for job in jobs]
+        for future in cf.as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print('[%d/%d] %s in %0.1f sec, peak memory %d MB (ffmpeg %d MB)' %
+                  (len(results), len(jobs),
+                   os.path.basename(result['outfile']), result['seconds'],
+                   result['peak_memory'] // 1024 ** 2,
+                   result['peak_ffmpeg_memory'] // 1024 ** 2))
+    
+    except BaseException:
+        # Also reached with BrokenProcessPool when a worker was killed, the
+        # finished videos are kept and a rerun picks up the rest
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    
+    executor.shutdown(wait=True)
+    
+    return results
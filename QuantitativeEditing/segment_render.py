@@ -0,0 +1,369 @@
+"""Renders the final analysis layout in cached segments.
+
+Re-running complete_process.py with a slightly different threshold renders the
+whole analysis video again, though most of it usually comes out the same.
+Here the layout of ffmpeg_render is cut into segments that are encoded on
+their own and cached: the body in stretches of a few seconds, the results
+screen and the longest scene replay. Each segment is stored under a hash of
+everything it is drawn from:
+
+  body     the source video and the stretch of it, the scene numbers shown
+           in it, and the state of the graphs up to its end
+  results  the results text
+  replay   the source video, the times and number of the longest scene
+
+plus the geometry, fonts and encoder settings shared by all of them. On a
+re-run only the segments whose hash changed are encoded. The segments are
+joined with ffmpeg's concat demuxer without re-encoding them, and the audio,
+which is cheap, is encoded in one piece and muxed in at the same time.
+
+The graphs draw the rate and count of scenes from the start of the video up
+to each frame, so a segment depends on every scene before its end: moving a
+cut re-renders the segment it is in and every segment after it. With
+draw_graphs (e.g. scene_graphs.SceneGraphs.render) the graphs are drawn only
+for the segments that are encoded, with axes that depend on the scenes so
+far rather than on the totals, so a run where every segment is cached draws
+no graphs at all. graph_state must then describe everything else the graphs
+are drawn with. Without either, the graph files of the layout are hashed as
+a whole and any change to them re-renders the whole body.
+
+Other animations whose pixels only depend on the source and a few settings,
+like the audio waveform, can be cached as a whole with cached_file.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import cache_utils as cu
+import ffmpeg_render as fr
+import ffmpeg_utils as fu
+import workspace as wsp
+
+
+# Length of the body segments in seconds. Shorter segments re-render less
+# around a change, but each one is its own ffmpeg run.
+DEFAULT_SEGMENT_SEC = 10.0
+
+# Default bound on the total size of the segment cache in bytes
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+
+
+def segment_key(inputs):
+    """Hash of the JSON-serializable inputs of a segment."""
+    
+    text = json.dumps(inputs, sort_keys=True)
+    
+    return hashlib.sha1(text.encode('utf8')).hexdigest()
+
+
+def body_segments(layout, segment_sec=DEFAULT_SEGMENT_SEC):
+    """
+    Splits the body of a layout into segments.
+    
+    Returns a list of (first frame, end frame) pairs in output frames, the end
+    frame not included. The segments lie on a fixed grid, so the same stretch
+    of a video gets the same segments in every run.
+    """
+    
+    fps = layout['fps']
+    n_frames = int(round(layout['duration'] * fps))
+    step = max(1, int(round(segment_sec * fps)))
+    
+    return [(first, min(first + step, n_frames))
+            for first in range(0, n_frames, step)]
+
+
+def _common_inputs(layout, encode_args):
+    """Inputs that every segment of a layout depends on."""
+    
+    return {'size': layout['size'],
+            'graph_size': layout['graph_size'],
+            'geometry': fr.layout_geometry(layout),
+            'fps': round(layout['fps'], 6),
+            'fontfile': layout['fontfile'],
+            'label_fontsize': layout['label_fontsize'],
+            'label_border': layout['label_border'],
+            'opacity': layout['opacity'],
+            'encoder': encode_args}
+
+
+def _graph_inputs(layout, end, graph_state, graph_hashes):
+    """Inputs the graphs shown in a body segment ending at end depend on."""
+    
+    if graph_state is None:
+        return {'files': graph_hashes}
+    
+    # Start times of the scenes up to the end of the segment
+    history = [round(float(msec), 1) for msec in layout['scenes'][:-1, 1]
+               if msec < end * 1000.0]
+    
+    return {'state': graph_state,
+            'history': history,
+            'audio_graph_size': layout.get('audio_graph_size')}
+
+
+def _encode(args, output, work_dir, encode_args):
+    """
+    Runs ffmpeg from work_dir to encode a video only segment as MPEG-TS, and
+    moves it into place once it is complete.
+    """
+    
+    args = args + ['-an', '-c:v', encode_args['codec'],
+                   '-preset', encode_args['preset'], '-pix_fmt', 'yuv420p']
+    if encode_args['threads']:
+        args += ['-threads', encode_args['threads']]
+    
+    temp_file = output + '.%d.tmp' % os.getpid()
+    fu.run_ffmpeg(args + ['-f', 'mpegts', temp_file], cwd=work_dir)
+    os.replace(temp_file, output)
+
+
+def cached_file(cache_dir, inputs, render, suffix='.mp4'):
+    """
+    Returns the filepath of a file cached under the hash of inputs, calling
+    render(filepath) to make it first if it isn't cached yet.
+    
+    render is given a temporary filepath ending in suffix, which is moved
+    into place once render returns.
+    """
+    
+    filename = cu.cache_path(cache_dir, segment_key(inputs), suffix)
+    
+    if os.path.isfile(filename):
+        os.utime(filename, None)
+        return filename
+    
+    temp_file = filename[:-len(suffix)] + '.%d.tmp%s' % (os.getpid(), suffix)
+    render(temp_file)
+    os.replace(temp_file, filename)
+    
+    return filename
+
+
+def _render_body(layout, first, end, output, work_dir, encode_args,
+                 draw_graphs=None):
+    """
+    Encodes the body of a layout from frame first up to frame end, drawing
+    the graphs for it with draw_graphs if given.
+    """
+    
+    fps = layout['fps']
+    start = first / fps
+    duration = (end - first) / fps
+    
+    # Every input seeked to the segment, with some slack for the fps filter
+    seek = ['-ss', '%0.6f' % start, '-t', '%0.6f' % (duration + 1.0)]
+    inputs = seek + ['-i', layout['video']]
+    
+    # Freshly drawn graphs already start at the segment
+    if draw_graphs is None:
+        for graph in layout['graphs']:
+            inputs += seek + ['-i', graph]
+    else:
+        for graph in draw_graphs(start, duration, work_dir):
+            inputs += ['-i', graph]
+    
+    if layout['audio_graph']:
+        inputs += seek + ['-i', layout['audio_graph']]
+    
+    filters = fr.body_filters(layout, start, duration)
+    filters.append('[body]format=yuv420p[vout]')
+    with open(os.path.join(work_dir, 'filter_graph.txt'), 'w') as f:
+        f.write(';\n'.join(filters))
+    
+    _encode(inputs + ['-filter_complex_script', 'filter_graph.txt',
+                      '-map', '[vout]', '-frames:v', end - first],
+            output, work_dir, encode_args)
+
+
+def _render_results(layout, output, work_dir, encode_args):
+    """Encodes the results screen of a layout."""
+    
+    filters = [fr.results_filter(layout, work_dir),
+               '[results]format=yuv420p[vout]']
+    
+    _encode(['-filter_complex', ';'.join(filters), '-map', '[vout]'],
+            output, work_dir, encode_args)
+
+
+def _render_replay(layout, output, work_dir, encode_args):
+    """Encodes the longest scene replay of a layout."""
+    
+    scene_start, scene_end = layout['longest_scene']
+    filters = [fr.replay_filter(layout, 0), '[replay]format=yuv420p[vout]']
+    with open(os.path.join(work_dir, 'filter_graph.txt'), 'w') as f:
+        f.write(';\n'.join(filters))
+    
+    _encode(['-ss', '%0.3f' % scene_start,
+             '-t', '%0.3f' % (scene_end - scene_start), '-i', layout['video'],
+             '-filter_complex_script', 'filter_graph.txt', '-map', '[vout]'],
+            output, work_dir, encode_args)
+
+
+def _render_audio(layout, output, audio_codec):
+    """Encodes the audio of all three parts of a layout in one piece."""
+    
+    scene_start, scene_end = layout['longest_scene']
+    filters = fr.audio_filters(layout, 1)
+    filters.append('[a_body][a_results][a_replay]concat=n=3:v=0:a=1[aout]')
+    
+    fu.run_ffmpeg(['-i', layout['video'],
+                   '-ss', '%0.3f' % scene_start,
+                   '-t', '%0.3f' % (scene_end - scene_start),
+                   '-i', layout['video'],
+                   '-filter_complex', ';'.join(filters), '-map', '[aout]',
+                   '-c:a', audio_codec, output])
+
+
+def render_segments(layout, output, cache_dir='segment_cache',
+                    graph_state=None, draw_graphs=None,
+                    segment_sec=DEFAULT_SEGMENT_SEC, preset='medium',
+                    threads=None, codec='libx264', audio_codec='aac',
+                    max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Renders a layout from ffmpeg_render.analysis_layout, encoding only the
+    segments that aren't cached yet.
+    
+    Parameters
+    -----------
+    
+    layout
+      dict returned by ffmpeg_render.analysis_layout
+    
+    output
+      filepath to save the rendered video to
+    
+    cache_dir
+      folder to cache the encoded segments in
+    
+    graph_state
+      JSON-serializable description of everything the graph animations are
+      drawn with besides the scene times, see the module docstring. If None,
+      the graph files are hashed and segments are only reused when the
+      graphs came out exactly the same.
+    
+    draw_graphs
+      optional callable draw_graphs(start, duration, work_dir) returning the
+      filepaths of the graph animations of that stretch of the body, each
+      starting at start, in the order of layout['graphs']. The graphs of
+      every frame must only depend on the scenes up to it and graph_state,
+      which is then required. If None, the graph files of the layout are
+      used.
+    
+    segment_sec
+      length of the body segments in seconds
+    
+    preset, threads, codec, audio_codec
+      same as in ffmpeg_render.render_layout
+    
+    max_bytes
+      bound on the total size of the segments and of the files cached with
+      cached_file in the cache folder, each, the least recently used are
+      deleted past it
+    
+    Returns
+    --------
+    
+    counts
+      dict with the number of 'segments' in the video and the number of them
+      that had to be 'rendered'
+    """
+    
+    if draw_graphs is not None and graph_state is None:
+        raise ValueError('graph_state must describe the graphs drawn by '
+                         'draw_graphs')
+    
+    output = os.path.abspath(output)
+    cache_dir = os.path.abspath(cache_dir)
+    encode_args = {'codec': codec, 'preset': preset, 'threads': threads}
+    
+    # Threads don't change what is encoded, only how fast
+    common = _common_inputs(layout, {'codec': codec, 'preset': preset})
+    source_hash = cu.file_hash(layout['video'])
+    graph_hashes = None
+    if graph_state is None:
+        graph_hashes = [cu.file_hash(graph) for graph in layout['graphs']]
+        if layout['audio_graph']:
+            graph_hashes.append(cu.file_hash(layout['audio_graph']))
+    
+    # Inputs of every segment, in order
+    segments = []
+    for first, end in body_segments(layout, segment_sec):
+        start, stop = first / layout['fps'], end / layout['fps']
+        
+        # Only the part of each scene inside the segment counts
+        labels = [[scene_idx, round(max(0.0, float(scene_start)), 3),
+                   round(min(stop - start, float(scene_end)), 3)]
+                  for scene_idx, scene_start, scene_end in
+                  fr.scene_labels(layout, start, stop)]
+        segments.append({'part': 'body', 'common': common,
+                         'video': source_hash, 'frames': [first, end],
+                         'labels': labels,
+                         'graphs': _graph_inputs(layout, stop, graph_state,
+                                                 graph_hashes)})
+    
+    segments.append({'part': 'results', 'common': common,
+                     'text': layout['result_text'],
+                     'duration': layout['result_duration'],
+                     'fontsize': layout['result_fontsize']})
+    
+    scene_start, scene_end = layout['longest_scene']
+    segments.append({'part': 'replay', 'common': common, 'video': source_hash,
+                     'scene': [round(float(scene_start), 3),
+                               round(float(scene_end), 3)],
+                     'label': fr.replay_label(layout),
+                     'fontsize': layout['caption_fontsize'],
+                     'border': layout['caption_border']})
+    
+    work_dir = tempfile.mkdtemp(prefix='qe_segment_render_',
+                                dir=wsp.workspace_root())
+    rendered = 0
+    
+    try:
+        
+        # Encode the missing segments, and mark the others as used
+        lines = []
+        for inputs in segments:
+            segment_file = cu.cache_path(cache_dir, segment_key(inputs), '.ts')
+            
+            if os.path.isfile(segment_file):
+                os.utime(segment_file, None)
+            elif inputs['part'] == 'body':
+                first, end = inputs['frames']
+                _render_body(layout, first, end, segment_file, work_dir,
+                             encode_args, draw_graphs)
+                rendered += 1
+            elif inputs['part'] == 'results':
+                _render_results(layout, segment_file, work_dir, encode_args)
+                rendered += 1
+            else:
+                _render_replay(layout, segment_file, work_dir, encode_args)
+                rendered += 1
+            
+            lines.append("file '%s'" % segment_file.replace("'", "'\\''"))
+            if inputs['part'] == 'body':
+                first, end = inputs['frames']
+                lines.append('duration %0.6f' % ((end - first) /
+                                                 layout['fps']))
+        
+        with open(os.path.join(work_dir, 'segments.txt'), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        
+        # Join the segments and mux in the audio, nothing is re-encoded
+        args = ['-f', 'concat', '-safe', '0', '-i', 'segments.txt']
+        if layout['include_audio']:
+            audio_file = os.path.join(work_dir, 'audio.m4a')
+            _render_audio(layout, audio_file, audio_codec)
+            args += ['-i', audio_file, '-map', '0:v', '-map', '1:a']
+        
+        fu.run_ffmpeg(args + ['-c', 'copy', output], cwd=work_dir)
+    
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    cu.evict(cache_dir, max_bytes, '.ts')
+    cu.evict(cache_dir, max_bytes, '.mp4')
+    
+    return {'segments': len(segments), 'rendered': rendered}
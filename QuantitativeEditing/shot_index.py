@@ -0,0 +1,342 @@
+"""Finding reused shots within a video and across the corpus.
+
+Music videos often come back to the same shot (the same setup, filmed in one
+take and cut up), and compilations reuse footage from other videos. Counting
+every scene as a new shot overstates how much was actually filmed.
+
+Each scene gets a few perceptual hashes during the detection pass: ShotHasher
+is a passive scenedetect detector that takes a 64 bit difference hash (dHash)
+of every frame it sees, and after detection the frames a quarter, half and
+three quarters into every scene are kept as its representatives. Similar
+looking frames get hashes that differ in only a few bits.
+
+ShotIndex stores the hashes in SQLite, together with the four 16 bit bands
+of every hash in an indexed table. Two hashes within 3 bits of each other must
+agree exactly on at least one band, so looking up the near duplicates of a
+hash only needs four index lookups plus a check of the few candidates they
+return, however many shots are in the index (locality-sensitive hashing).
+"""
+
+import os
+import sqlite3
+import cv2
+import numpy as np
+
+from scenedetect.scene_detector import SceneDetector
+
+
+# Hashes this many bits apart or closer count as the same shot. Must stay below
+# the number of bands for the band lookup to find every match.
+MAX_DISTANCE = 3
+
+# Number of 16 bit bands each 64 bit hash is split into
+BANDS = 4
+
+# Frames whose thumbnail has less contrast than this (standard deviation of
+# the gray levels) are not hashed, fades to black would all match each other
+MIN_CONTRAST = 4.0
+
+SHOT_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS shot_hashes (
+    hash_id INTEGER PRIMARY KEY,
+    video TEXT,
+    scene_idx INTEGER,
+    frame INTEGER,
+    hash INTEGER
+);
+CREATE TABLE IF NOT EXISTS hash_bands (
+    band INTEGER,
+    value INTEGER,
+    hash_id INTEGER REFERENCES shot_hashes (hash_id)
+);
+CREATE INDEX IF NOT EXISTS shot_hashes_video ON shot_hashes (video, scene_idx);
+CREATE INDEX IF NOT EXISTS hash_bands_value ON hash_bands (band, value);
+CREATE INDEX IF NOT EXISTS hash_bands_hash ON hash_bands (hash_id);
+'''
+
+
+def dhash(frame, hash_size=8):
+    """
+    64 bit difference hash of a BGR frame, or None if the frame is too flat to
+    tell apart from other flat frames.
+    
+    The frame is shrunk to a (hash_size + 1) x hash_size gray thumbnail and
+    every bit records whether a pixel is brighter than its left neighbour.
+    """
+    
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (hash_size + 1, hash_size),
+                       interpolation=cv2.INTER_AREA)
+    
+    if small.std() < MIN_CONTRAST:
+        return None
+    
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    
+    return int.from_bytes(bits.tobytes(), 'big')
+
+
+def hamming(hash1, hash2):
+    """Number of bits two hashes differ in."""
+    
+    return bin(hash1 ^ hash2).count('1')
+
+
+def _bands(value):
+    """Splits a 64 bit hash into its bands, lowest bits first."""
+    
+    return [(value >> (16 * band)) & 0xffff for band in range(BANDS)]
+
+
+def _to_sql(value):
+    """SQLite integers are signed 64 bit, store the hash as one."""
+    
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _from_sql(value):
+    """Turns a hash stored by _to_sql back into an unsigned one."""
+    
+    return value + (1 << 64) if value < 0 else value
+
+
+class ShotHasher(SceneDetector):
+    """
+    Detector that finds no cuts, but hashes every frame it is given.
+    
+    Add it to a SceneManager next to the real detector (or pass it as
+    shot_hasher to detect_scenes.analyze_video), then call scene_hashes with
+    the detected scene list.
+    """
+    
+    def __init__(self, every=1):
+        """
+        Parameters
+        -----------
+        
+        every
+          only hash every n-th frame, scenes then use the nearest hashed frame
+        """
+        
+        super(ShotHasher, self).__init__()
+        self.every = every
+        self.hashes = {}
+    
+    def is_processing_required(self, frame_num):
+        
+        # Frames are needed even when the other detectors' metrics are cached
+        return True
+    
+    def process_frame(self, frame_num, frame_img):
+        
+        if frame_img is not None and frame_num % self.every == 0:
+            self.hashes[frame_num] = dhash(frame_img)
+        
+        return []
+    
+    def post_process(self, frame_num):
+        
+        return []
+    
+    def scene_hashes(self, scene_list, frames_read,
+                     positions=(0.25, 0.5, 0.75)):
+        """
+        Representative hashes of every scene.
+        
+        Parameters
+        -----------
+        
+        scene_list
+          list of frames at which each scene starts, in the frame numbers of
+          the video this hasher saw
+        
+        frames_read
+          total number of frames
+        
+        positions
+          where in each scene to take the representative frames, as fractions
+          of its length
+        
+        Returns
+        --------
+        
+        scenes
+          list with a list of (frame, hash) for every scene, leaving out flat
+          frames
+        """
+        
+        ends = list(scene_list[1:]) + [frames_read]
+        scenes = []
+        
+        for start, end in zip(scene_list, ends):
+            frames = sorted(set(int(start + position * (end - start))
+                                for position in positions))
+            
+            hashes = []
+            for frame in frames:
+                frame -= frame % self.every
+                value = self.hashes.get(frame)
+                if value is not None:
+                    hashes.append((frame, value))
+            scenes.append(hashes)
+        
+        return scenes
+
+
+class ShotIndex(object):
+    """The index of shot hashes, see the module docstring."""
+    
+    def __init__(self, filename='shot_index.sqlite'):
+        
+        # Several batch workers may write at the same time, wait for the lock
+        self.conn = sqlite3.connect(filename, timeout=60)
+        self.conn.executescript(SHOT_SCHEMA)
+    
+    def close(self):
+        
+        self.conn.close()
+    
+    def add_video(self, video, scenes):
+        """
+        Stores the scene hashes of a video, replacing any stored before.
+        
+        Parameters
+        -----------
+        
+        video
+          name of the video, usually the filename without the folder
+        
+        scenes
+          list of (frame, hash) lists from ShotHasher.scene_hashes
+        """
+        
+        with self.conn:
+            self.conn.execute('DELETE FROM hash_bands WHERE hash_id IN '
+                              '(SELECT hash_id FROM shot_hashes '
+                              'WHERE video = ?)', (video,))
+            self.conn.execute('DELETE FROM shot_hashes WHERE video = ?',
+                              (video,))
+            
+            for scene_idx, hashes in enumerate(scenes, start=1):
+                for frame, value in hashes:
+                    cur = self.conn.execute(
+                        'INSERT INTO shot_hashes (video, scene_idx, frame, '
+                        'hash) VALUES (?, ?, ?, ?)',
+                        (video, scene_idx, frame, _to_sql(value)))
+                    self.conn.executemany(
+                        'INSERT INTO hash_bands VALUES (?, ?, ?)',
+                        ((band, band_value, cur.lastrowid)
+                         for band, band_value in enumerate(_bands(value))))
+    
+    def query(self, value, max_distance=MAX_DISTANCE):
+        """
+        Finds the stored shots that look like a hash.
+        
+        Returns a list of (video, scene_idx, frame, distance), closest first.
+        """
+        
+        candidates = {}
+        for band, band_value in enumerate(_bands(value)):
+            for row in self.conn.execute(
+                    'SELECT s.hash_id, s.video, s.scene_idx, s.frame, s.hash '
+                    'FROM hash_bands b JOIN shot_hashes s '
+                    'ON s.hash_id = b.hash_id '
+                    'WHERE b.band = ? AND b.value = ?', (band, band_value)):
+                candidates[row[0]] = row[1:]
+        
+        matches = []
+        for video, scene_idx, frame, other in candidates.values():
+            distance = hamming(value, _from_sql(other))
+            if distance <= max_distance:
+                matches.append((video, scene_idx, frame, distance))
+        
+        return sorted(matches, key=lambda match: match[3])
+    
+    def matches(self, video, max_distance=MAX_DISTANCE):
+        """
+        Near duplicates of the scenes of a stored video.
+        
+        Returns a dict mapping each scene_idx of the video that has any to a
+        set of (video, scene_idx) pairs of the other scenes that look like it,
+        in the same video or in others.
+        """
+        
+        matches = {}
+        for scene_idx, value in self.conn.execute(
+                'SELECT scene_idx, hash FROM shot_hashes WHERE video = ?',
+                (video,)):
+            for other_video, other_idx, _, _ in self.query(_from_sql(value),
+                                                           max_distance):
+                if (other_video, other_idx) != (video, scene_idx):
+                    matches.setdefault(scene_idx, set()).add(
+                        (other_video, other_idx))
+        
+        return matches
+    
+    def unique_shots(self, video, n_scenes, max_distance=MAX_DISTANCE):
+        """
+        Number of distinct shots among the n_scenes scenes of a stored video,
+        counting scenes that look like an earlier scene of the same video as
+        the same shot.
+        """
+        
+        # Group the matching scenes together (union find)
+        parent = list(range(n_scenes + 1))
+        
+        def root(scene_idx):
+            while parent[scene_idx] != scene_idx:
+                parent[scene_idx] = parent[parent[scene_idx]]
+                scene_idx = parent[scene_idx]
+            return scene_idx
+        
+        for scene_idx, others in self.matches(video, max_distance).items():
+            for other_video, other_idx in others:
+                if other_video == video and other_idx <= n_scenes:
+                    parent[root(scene_idx)] = root(other_idx)
+        
+        return len(set(root(scene_idx)
+                       for scene_idx in range(1, n_scenes + 1)))
+    
+    def reused_footage(self, video, max_distance=MAX_DISTANCE):
+        """
+        Scenes of a stored video that look like scenes of other videos, as a
+        dict mapping scene_idx to a sorted list of (video, scene_idx).
+        """
+        
+        reused = {}
+        for scene_idx, others in self.matches(video, max_distance).items():
+            others = sorted(other for other in others if other[0] != video)
+            if others:
+                reused[scene_idx] = others
+        
+        return reused
+
+
+if __name__ == '__main__':
+    
+    import detect_scenes as ds
+    
+    # Specify video file and constants here
+    video_file = 'BTS_2017_DNA.mkv'
+    threshold = 30
+    min_scene_len = 10
+    
+    # Hash the frames while detecting the scenes
+    hasher = ShotHasher()
+    video_fps, frames_read, _, scene_list = ds.analyze_video(
+        video_file, threshold=threshold, min_scene_len=min_scene_len,
+        shot_hasher=hasher)
+    
+    index = ShotIndex('shot_index.sqlite')
+    video = os.path.basename(video_file)
+    index.add_video(video, hasher.scene_hashes(scene_list, frames_read))
+    
+    print('%d scenes, %d unique shots' %
+          (len(scene_list), index.unique_shots(video, len(scene_list))))
+    
+    for scene_idx, others in sorted(index.reused_footage(video).items()):
+        print('Scene %03d also appears in: %s' %
+              (scene_idx, ', '.join('%s (scene %03d)' % other
+                                    for other in others)))
+    
+    index.close()
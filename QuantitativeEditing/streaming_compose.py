@@ -0,0 +1,446 @@
+"""Composes the final analysis video a frame at a time within a memory budget.
+
+The moviepy composition in complete_process.py keeps a VideoFileClip reader
+open for the source, both graph animations and the audio waveform, and builds
+the output through resize, clips_array and CompositeVideoClip, each of which
+allocates full frames in floating point. On 4K or hour long videos its peak
+memory is more than a render worker can spare.
+
+This module renders the same layout as ffmpeg_render.analysis_layout
+describes, streamed:
+
+  * every input is decoded by its own ffmpeg pipe (ffmpeg_utils.iter_frames),
+    already scaled to its place in the layout by ffmpeg, so only one decoded
+    uint8 frame per input is held in Python at any time
+  * the inputs are copied into a single preallocated output frame, and the
+    scene numbers and captions are blended into it in place with integer
+    weights, the same way annotation.SceneAnnotator does
+  * each finished frame is written straight to an ffmpeg encoder's stdin,
+    which also cuts and concatenates the audio
+
+plan_memory works out the encoder threads and lookahead that fit the budget
+(or refuses to start if nothing does), and stream_layout reports the peak
+memory of each stage (the analysis body, the results screen and the longest
+scene replay), including the ffmpeg subprocesses.
+"""
+
+import tempfile
+import multiprocessing
+import subprocess as sp
+import numpy as np
+import annotation as an
+import ffmpeg_render as fr
+import ffmpeg_utils as fu
+import resources as res
+import workspace as wsp
+
+from moviepy.editor import TextClip
+
+
+# Memory of the Python process itself with numpy, moviepy and matplotlib loaded
+BASE_MEMORY = 250 * 1024 ** 2
+
+# Decoded frames an ffmpeg decoder keeps (references and its output queue)
+DECODER_FRAMES = 8
+
+# Frames x264 keeps besides its lookahead and one per thread (references and
+# B-frames), and the bytes per output pixel of each of them (the yuv420p
+# picture plus the half resolution copy and motion data used by the lookahead)
+ENCODER_EXTRA_FRAMES = 8
+ENCODER_BYTES_PER_PIXEL = 3
+
+# x264's lookahead with the medium preset
+DEFAULT_LOOKAHEAD = 40
+
+
+def _text_patch(text, fontsize, stroke_width=0, opacity=1.0):
+    """
+    Renders text once as a premultiplied uint16 patch and its inverse alpha,
+    for blending with _blend.
+    """
+    
+    kwargs = {}
+    if stroke_width:
+        kwargs = {'stroke_color': 'black', 'stroke_width': stroke_width}
+    
+    text_clip = TextClip(text, fontsize=fontsize, font='FreeMono-Bold',
+                         color='white', **kwargs)
+    rgb = text_clip.get_frame(0).astype(np.uint16)
+    alpha = np.round(text_clip.mask.get_frame(0) * opacity * 256)
+    alpha = alpha.astype(np.uint16)[:, :, np.newaxis]
+    
+    return rgb * alpha, 256 - alpha
+
+
+def _blend(frame, patch, x, y):
+    """
+    Blends a patch from _text_patch into frame with its top left at (x, y),
+    in place. Parts outside of the frame are left out.
+    """
+    
+    premultiplied, inverse_alpha = patch
+    frame_h, frame_w = frame.shape[:2]
+    patch_h, patch_w = premultiplied.shape[:2]
+    
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + patch_w, frame_w), min(y + patch_h, frame_h)
+    if x0 >= x1 or y0 >= y1:
+        return
+    
+    region = frame[y0:y1, x0:x1]
+    buf = region * inverse_alpha[y0 - y:y1 - y, x0 - x:x1 - x]
+    buf += premultiplied[y0 - y:y1 - y, x0 - x:x1 - x]
+    np.right_shift(buf, 8, out=buf)
+    region[...] = buf
+
+
+def plan_memory(layout, memory_budget=None, threads=None):
+    """
+    Works out how to stream a layout within a memory budget.
+    
+    Parameters
+    -----------
+    
+    layout
+      dict returned by ffmpeg_render.analysis_layout
+    
+    memory_budget
+      bytes the render may use in total, Python and ffmpeg processes
+      together. The currently available memory if None.
+    
+    threads
+      number of encoding threads wanted, the number of CPUs if None. Fewer are
+      used if they don't fit in the budget.
+    
+    Returns
+    --------
+    
+    plan
+      dict with the encoder 'threads' and 'lookahead' (in frames), the
+      'estimate' of the peak memory in bytes and the 'budget'
+    
+    Raises
+    --------
+    
+    ValueError
+      if even a single threaded encoder without lookahead doesn't fit
+    """
+    
+    if memory_budget is None:
+        memory_budget = res.available_memory()
+    
+    if threads is None:
+        threads = multiprocessing.cpu_count()
+    
+    main_w, main_h, out_w, out_h = fr.layout_geometry(layout)
+    graph_w, graph_h = layout['graph_size']
+    source = fu.probe_video(layout['video'])
+    
+    # Frames held in Python: the output frame, plus one frame per input and
+    # the two frames of pipe buffer behind each of them
+    input_pixels = main_w * main_h + len(layout['graphs']) * graph_w * graph_h
+    if layout['audio_graph']:
+        input_pixels += (layout['audio_graph_size'][0] *
+                         layout['audio_graph_size'][1])
+    body_bytes = out_w * out_h * 3 + input_pixels * 3 * 3
+    replay_bytes = out_w * out_h * 3 * 3
+    
+    # Decoders see the inputs at their own size, before scaling
+    decoder_pixels = source['width'] * source['height']
+    decoder_pixels += len(layout['graphs']) * graph_w * graph_h
+    decoder_bytes = decoder_pixels * 1.5 * DECODER_FRAMES
+    
+    fixed = BASE_MEMORY + max(body_bytes, replay_bytes) + decoder_bytes
+    encoder_frame = out_w * out_h * ENCODER_BYTES_PER_PIXEL
+    encoder_frames = int((memory_budget - fixed) // encoder_frame)
+    
+    if encoder_frames < 1 + ENCODER_EXTRA_FRAMES:
+        raise ValueError('A %dx%d stream render needs at least %0.0f MB, the '
+                         'memory budget is %0.0f MB' %
+                         (out_w, out_h,
+                          (fixed + (1 + ENCODER_EXTRA_FRAMES) *
+                           encoder_frame) / 1024.0 ** 2,
+                          memory_budget / 1024.0 ** 2))
+    
+    # Threads first, whatever is left over goes to the lookahead
+    spare = encoder_frames - ENCODER_EXTRA_FRAMES
+    threads = max(1, min(threads, spare))
+    lookahead = max(0, min(DEFAULT_LOOKAHEAD, spare - threads))
+    
+    estimate = fixed + (threads + lookahead + ENCODER_EXTRA_FRAMES) * \
+        encoder_frame
+    
+    return {'threads': threads, 'lookahead': lookahead,
+            'estimate': int(estimate), 'budget': int(memory_budget)}
+
+
+def _encoder_args(layout, output, plan, preset, codec, audio_codec):
+    """ffmpeg arguments of the encoder, reading raw frames from stdin."""
+    
+    _, _, out_w, out_h = fr.layout_geometry(layout)
+    scene_start, scene_end = layout['longest_scene']
+    
+    args = ['-f', 'rawvideo', '-pix_fmt', 'rgb24',
+            '-s', '%dx%d' % (out_w, out_h),
+            '-framerate', '%0.6f' % layout['fps'], '-i', '-']
+    
+    # The audio of the body and of the replay, with silence for the results
+    # screen in between, same as ffmpeg_render
+    if layout['include_audio']:
+        audio_format = 'aresample=44100,aformat=sample_fmts=fltp:' \
+                       'channel_layouts=stereo'
+        args += ['-t', '%0.3f' % layout['duration'], '-i', layout['video'],
+                 '-ss', '%0.3f' % scene_start,
+                 '-t', '%0.3f' % (scene_end - scene_start),
+                 '-i', layout['video']]
+        args += ['-filter_complex',
+                 '[1:a]%s[a_body];'
+                 'anullsrc=r=44100:cl=stereo,atrim=duration=%0.3f,%s'
+                 '[a_results];'
+                 '[2:a]%s[a_replay];'
+                 '[a_body][a_results][a_replay]concat=n=3:v=0:a=1[aout]' %
+                 (audio_format, layout['result_duration'], audio_format,
+                  audio_format),
+                 '-map', '0:v', '-map', '[aout]', '-c:a', audio_codec]
+    
+    args += ['-c:v', codec, '-preset', preset, '-pix_fmt', 'yuv420p',
+             '-threads', plan['threads']]
+    if codec == 'libx264':
+        args += ['-x264-params', 'rc-lookahead=%d' % plan['lookahead']]
+    
+    return args + [output]
+
+
+def _write(encoder, log, frame):
+    """Sends a frame to the encoder, raising IOError if it has died."""
+    
+    try:
+        encoder.stdin.write(frame.data)
+    
+    except (BrokenPipeError, IOError):
+        encoder.wait()
+        log.seek(0)
+        raise IOError('ffmpeg encoder stopped:\n\n%s' %
+                      log.read().decode('utf8', 'replace'))
+
+
+def _stream_body(layout, encoder, log, out):
+    """
+    Writes the annotated video with its graphs (and audio waveform) to the
+    encoder.
+    """
+    
+    fps = layout['fps']
+    main_w, main_h, out_w, out_h = fr.layout_geometry(layout)
+    graph_w, graph_h = layout['graph_size']
+    main_y = (out_h - main_h) // 2
+    
+    # The labels are drawn on the scaled down video, so scale them with it
+    text_scale = main_w / float(layout['size'][0])
+    annotator = an.SceneAnnotator(
+        layout['scenes'][:-1, 0], fps,
+        fontsize=max(1, int(round(layout['label_fontsize'] * text_scale))),
+        stroke_width=max(1, int(round(layout['label_border'] * text_scale))),
+        opacity=layout['opacity'], pts_index=layout.get('pts_index'))
+    
+    # One decoder per input, each frame resampled to the output frame rate
+    vf = 'fps=%0.6f' % fps
+    source = fu.iter_frames(layout['video'], size=(main_w, main_h), vf=vf,
+                            duration=layout['duration'])
+    graphs = [fu.iter_frames(graph, size=(graph_w, graph_h), vf=vf)
+              for graph in layout['graphs']]
+    
+    audio_graph = None
+    if layout['audio_graph']:
+        anim_w, anim_h = layout['audio_graph_size']
+        audio_graph = fu.iter_frames(layout['audio_graph'], vf=vf,
+                                     size=(anim_w, anim_h))
+        anim_x = max(0, (main_w - anim_w) // 2)
+        anim_y = max(0, out_h - 10 - anim_h)
+        anim_w = min(anim_w, main_w - anim_x)
+        anim_h = min(anim_h, out_h - anim_y)
+    
+    out[...] = 0
+    n_frames = int(round(layout['duration'] * fps))
+    
+    try:
+        for frame_idx, frame in enumerate(source):
+            if frame_idx >= n_frames:
+                break
+            
+            # A fresh view every frame, the annotator skips arrays it has
+            # already drawn on
+            main = out[main_y:main_y + main_h, :main_w]
+            main[...] = frame
+            annotator.annotate_frame(main, frame_idx / fps)
+            
+            # Graphs hold their last frame if they end early
+            for graph_idx, graph in enumerate(graphs):
+                graph_frame = next(graph, None)
+                if graph_frame is not None:
+                    out[graph_idx * graph_h:(graph_idx + 1) * graph_h,
+                        main_w:] = graph_frame
+            
+            # The waveform disappears once it ends, like in ffmpeg_render
+            if audio_graph is not None:
+                anim_frame = next(audio_graph, None)
+                if anim_frame is None:
+                    audio_graph = None
+                else:
+                    out[anim_y:anim_y + anim_h, anim_x:anim_x + anim_w] = \
+                        anim_frame[:anim_h, :anim_w]
+            
+            _write(encoder, log, out)
+    
+    finally:
+        for reader in [source, audio_graph] + graphs:
+            if reader is not None:
+                reader.close()
+
+
+def _stream_results(layout, encoder, log, out):
+    """Writes the results screen to the encoder."""
+    
+    _, _, out_w, out_h = fr.layout_geometry(layout)
+    
+    # The screen doesn't change, so it is drawn once and sent repeatedly
+    patch = _text_patch('\n'.join(layout['result_text']),
+                        layout['result_fontsize'])
+    patch_h, patch_w = patch[0].shape[:2]
+    
+    out[...] = 0
+    _blend(out, patch, (out_w - patch_w) // 2, (out_h - patch_h) // 2)
+    
+    for _ in range(int(round(layout['result_duration'] * layout['fps']))):
+        _write(encoder, log, out)
+
+
+def _stream_replay(layout, encoder, log):
+    """Writes the longest scene with its scene number and captions."""
+    
+    fps = layout['fps']
+    _, _, out_w, out_h = fr.layout_geometry(layout)
+    scene_start, scene_end = layout['longest_scene']
+    
+    annotator = an.SceneAnnotator(layout['scenes'][:-1, 0], fps,
+                                  fontsize=layout['label_fontsize'],
+                                  stroke_width=layout['label_border'],
+                                  opacity=layout['opacity'],
+                                  pts_index=layout.get('pts_index'))
+    captions = [_text_patch(text, layout['caption_fontsize'],
+                            stroke_width=layout['caption_border'],
+                            opacity=layout['opacity'])
+                for text in ('Longest Scene',
+                             '%0.3f seconds long' % (scene_end - scene_start))]
+    
+    # Top and bottom, centered
+    positions = [((out_w - patch[0].shape[1]) // 2, y)
+                 for patch, y in zip(captions,
+                                     (0, out_h - captions[1][0].shape[0]))]
+    
+    # The replay is decoded at the output size, so its frames are drawn on
+    # and sent as they are
+    replay = fu.iter_frames(layout['video'], size=(out_w, out_h),
+                            vf='fps=%0.6f' % fps, start_time=scene_start,
+                            duration=scene_end - scene_start)
+    
+    try:
+        for frame_idx, frame in enumerate(replay):
+            
+            # The decoder reuses the same array, pass a fresh view so the
+            # annotator doesn't take it for a frame it has already drawn on
+            annotator.annotate_frame(frame[:], scene_start + frame_idx / fps)
+            for patch, (x, y) in zip(captions, positions):
+                _blend(frame, patch, x, y)
+            
+            _write(encoder, log, frame)
+    
+    finally:
+        replay.close()
+
+
+def stream_layout(layout, output, memory_budget=None, preset='medium',
+                  threads=None, codec='libx264', audio_codec='aac'):
+    """
+    Renders a layout from ffmpeg_render.analysis_layout frame by frame within
+    a memory budget.
+    
+    Parameters
+    -----------
+    
+    layout
+      dict returned by ffmpeg_render.analysis_layout
+    
+    output
+      filepath to save the rendered video to
+    
+    memory_budget
+      bytes the render may use in total, the available memory if None. See
+      plan_memory.
+    
+    preset
+      x264 encoding preset
+    
+    threads
+      number of encoding threads wanted, fewer may be used to fit the budget
+    
+    codec, audio_codec
+      video and audio encoders to use
+    
+    Returns
+    --------
+    
+    peaks
+      dict of the peak memory in bytes of each stage ('body', 'results' and
+      'replay'), Python and ffmpeg processes together
+    """
+    
+    plan = plan_memory(layout, memory_budget, threads)
+    print('Streaming render with %d encoder threads and a lookahead of %d '
+          'frames, estimated peak %0.0f MB of %0.0f MB' %
+          (plan['threads'], plan['lookahead'], plan['estimate'] / 1024.0 ** 2,
+           plan['budget'] / 1024.0 ** 2))
+    
+    _, _, out_w, out_h = fr.layout_geometry(layout)
+    
+    # The one output frame every stage draws into
+    out = np.zeros((out_h, out_w, 3), dtype=np.uint8)
+    
+    peaks = {}
+    
+    with tempfile.TemporaryFile(dir=wsp.workspace_root()) as log:
+        cmd = [fu.ffmpeg_binary(), '-y', '-loglevel', 'error']
+        cmd += [str(arg) for arg in _encoder_args(layout, output, plan, preset,
+                                                  codec, audio_codec)]
+        encoder = sp.Popen(cmd, stdin=sp.PIPE, stderr=log)
+        
+        try:
+            with res.MemorySampler() as sampler:
+                _stream_body(layout, encoder, log, out)
+            peaks['body'] = sampler.peak
+            
+            with res.MemorySampler() as sampler:
+                _stream_results(layout, encoder, log, out)
+            peaks['results'] = sampler.peak
+            
+            with res.MemorySampler() as sampler:
+                _stream_replay(layout, encoder, log)
+                encoder.stdin.close()
+                encoder.wait()
+            peaks['replay'] = sampler.peak
+        
+        finally:
+            if encoder.poll() is None:
+                encoder.kill()
+                encoder.wait()
+        
+        if encoder.returncode != 0:
+            log.seek(0)
+            raise IOError('ffmpeg error while encoding %s:\n\n%s' %
+                          (output, log.read().decode('utf8', 'replace')))
+    
+    for stage in ('body', 'results', 'replay'):
+        print('  %-8s peak memory %0.0f MB' % (stage,
+                                              peaks[stage] / 1024.0 ** 2))
+    
+    return peaks
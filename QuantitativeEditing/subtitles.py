@@ -0,0 +1,341 @@
+"""Sidecar output of detected scenes as subtitles and a JSON scene table.
+
+Instead of burning the scene counter into a re-encoded copy of the video, the
+scenes can be written out as a WebVTT or ASS subtitle track and muxed into the
+original file with stream copy. No frames are decoded or encoded, so this takes
+seconds regardless of the length of the video. Burned in annotation is still
+done with annotation.annotate_video.
+"""
+
+import os
+import json
+import detect_scenes as ds
+import ffmpeg_utils as fu
+
+
+def scene_rows(scene_array):
+    """
+    Yields (scene number, start msec, end msec) for every scene in a scene
+    table from detect_scenes.scene_table. Scenes of zero length are skipped.
+    """
+    
+    for scene_idx in range(1, len(scene_array)):
+        start_msec = scene_array[scene_idx - 1, 1]
+        end_msec = scene_array[scene_idx, 1]
+        
+        if end_msec > start_msec:
+            yield scene_idx, start_msec, end_msec
+
+
+def _timestamp(msec, sep='.', digits=3):
+    """Formats msec as h:mm:ss.fff (or with fewer fractional digits)."""
+    
+    msec = int(round(msec))
+    hours, msec = divmod(msec, 3600000)
+    minutes, msec = divmod(msec, 60000)
+    seconds, msec = divmod(msec, 1000)
+    fraction = ('%03d' % msec)[:digits]
+    
+    return '%d:%02d:%02d%s%s' % (hours, minutes, seconds, sep, fraction)
+
+
+def write_webvtt(scene_array, output):
+    """
+    Writes the scene numbers and durations as a WebVTT subtitle file.
+    
+    Parameters
+    -----------
+    
+    scene_array
+      scene table as returned by detect_scenes.scene_table
+    
+    output
+      filepath to save the .vtt file to
+    
+    Returns
+    --------
+    
+    output
+      Simply returns the filepath to the saved subtitles
+    """
+    
+    with open(output, 'w') as f:
+        f.write('WEBVTT\n\n')
+        
+        for scene_idx, start_msec, end_msec in scene_rows(scene_array):
+            f.write('%d\n' % scene_idx)
+            f.write('0%s --> 0%s line:50%% position:50%% align:center\n' %
+                    (_timestamp(start_msec), _timestamp(end_msec)))
+            f.write('%03d\n%0.3f seconds\n\n' %
+                    (scene_idx, (end_msec - start_msec) / 1000.0))
+    
+    return output
+
+
+def write_ass(scene_array, output, video_size=(1920, 1080), fontsize=288,
+              opacity=0.6):
+    """
+    Writes the scene numbers and durations as an ASS subtitle file, styled like
+    the burned in scene counter.
+    
+    Parameters
+    -----------
+    
+    scene_array
+      scene table as returned by detect_scenes.scene_table
+    
+    output
+      filepath to save the .ass file to
+    
+    video_size
+      (width, height) of the video, used as the subtitle canvas so that
+      fontsize means the same thing as it does for the burned in labels
+    
+    fontsize
+      size of the scene number text
+    
+    opacity
+      opacity of the scene number text, from 0 to 1
+    
+    Returns
+    --------
+    
+    output
+      Simply returns the filepath to the saved subtitles
+    """
+    
+    W, H = video_size
+    
+    # ASS colours are &HAABBGGRR with alpha counting up towards transparent
+    alpha = int(round((1 - opacity) * 255))
+    primary = '&H%02XFFFFFF' % alpha
+    outline = '&H%02X000000' % alpha
+    
+    header = ['[Script Info]',
+              'ScriptType: v4.00+',
+              'PlayResX: %d' % W,
+              'PlayResY: %d' % H,
+              'ScaledBorderAndShadow: yes',
+              '',
+              '[V4+ Styles]',
+              'Format: Name, Fontname, Fontsize, PrimaryColour, '
+              'SecondaryColour, OutlineColour, BackColour, Bold, Italic, '
+              'Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, '
+              'BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, '
+              'MarginV, Encoding',
+              'Style: Scene,FreeMono,%d,%s,%s,%s,&H00000000,-1,0,0,0,100,100,'
+              '0,0,1,5,0,5,0,0,0,1' % (fontsize, primary, primary, outline),
+              'Style: Duration,FreeMono,%d,%s,%s,%s,&H00000000,-1,0,0,0,100,'
+              '100,0,0,1,2,0,2,0,0,20,1' % (fontsize // 6, primary, primary,
+                                           outline),
+              '',
+              '[Events]',
+              'Format: Layer, Start, End, Style, Name, MarginL, MarginR, '
+              'MarginV, Effect, Text']
+    
+    with open(output, 'w') as f:
+        f.write('\n'.join(header) + '\n')
+        
+        for scene_idx, start_msec, end_msec in scene_rows(scene_array):
+            start = _timestamp(start_msec, digits=2)
+            end = _timestamp(end_msec, digits=2)
+            
+            f.write('Dialogue: 0,%s,%s,Scene,,0,0,0,,%03d\n' %
+                    (start, end, scene_idx))
+            f.write('Dialogue: 0,%s,%s,Duration,,0,0,0,,%0.3f seconds\n' %
+                    (start, end, (end_msec - start_msec) / 1000.0))
+    
+    return output
+
+
+def write_scene_json(scene_array, video_fps, output, video_file=None):
+    """
+    Writes the scene table to a .json file.
+    
+    Parameters
+    -----------
+    
+    scene_array
+      scene table as returned by detect_scenes.scene_table
+    
+    video_fps
+      frames per second of the video
+    
+    output
+      filepath to save the .json file to
+    
+    video_file
+      optional filepath of the analyzed video to record in the file
+    
+    Returns
+    --------
+    
+    output
+      Simply returns the filepath to the saved table
+    """
+    
+    scenes = []
+    for scene_idx, start_msec, end_msec in scene_rows(scene_array):
+        scenes.append({'scene': scene_idx,
+                       'start_frame': int(scene_array[scene_idx - 1, 0]),
+                       'end_frame': int(scene_array[scene_idx, 0]),
+                       'start_sec': start_msec / 1000.0,
+                       'duration_sec': (end_msec - start_msec) / 1000.0})
+    
+    table = {'video': video_file,
+             'fps': float(video_fps),
+             'frames': int(scene_array[-1, 0]),
+             'duration_sec': scene_array[-1, 1] / 1000.0,
+             'scenes': scenes}
+    
+    with open(output, 'w') as f:
+        json.dump(table, f, indent=2)
+    
+    return output
+
+
+def mux_subtitles(video_file, subtitle_file, output, scene_json=None,
+                  language='eng', title='Scenes'):
+    """
+    Adds a subtitle track to a video using stream copy for all existing
+    streams, so nothing is re-encoded.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the original video
+    
+    subtitle_file
+      .vtt or .ass file to add as a new subtitle track
+    
+    output
+      filepath to save the muxed video to. Matroska (.mkv) keeps the subtitle
+      track as is, .mp4 converts it to mov_text which drops the ASS styling.
+    
+    scene_json
+      optional .json scene table to attach to the file, only supported for
+      .mkv outputs
+    
+    language
+      language tag of the subtitle track
+    
+    title
+      title of the subtitle track
+    
+    Returns
+    --------
+    
+    output
+      Simply returns the filepath to the muxed video
+    """
+    
+    out_format = fu.container_format(output)
+    
+    # Source subtitle tracks are left out so the new track is always s:0
+    args = ['-i', video_file, '-i', subtitle_file,
+            '-map', '0:v', '-map', '0:a?', '-map', '1', '-c', 'copy']
+    
+    # mp4 only supports mov_text subtitles
+    if out_format in ('mp4', 'm4v', 'mov'):
+        args += ['-c:s', 'mov_text']
+    
+    # Tag the new subtitle track
+    args += ['-metadata:s:s:0', 'language=' + language,
+             '-metadata:s:s:0', 'title=' + title]
+    
+    if scene_json and out_format == 'mkv':
+        args += ['-attach', scene_json,
+                 '-metadata:s:t', 'mimetype=application/json']
+    
+    fu.run_ffmpeg(args + [output])
+    
+    return output
+
+
+def write_sidecar(video_file, video_fps, scene_array, output_prefix,
+                  video_size=(1920, 1080), subtitle_format='ass', mux=True):
+    """
+    Writes all sidecar outputs for an analyzed video.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the analyzed video
+    
+    video_fps
+      frames per second of the video
+    
+    scene_array
+      scene table as returned by detect_scenes.scene_table
+    
+    output_prefix
+      filepath prefix for the outputs. Files saved are prefix + '_scenes.json',
+      prefix + '_scenes.ass' (or .vtt) and, if mux is set, prefix +
+      '_annotated' with the extension of video_file.
+    
+    video_size
+      (width, height) of the video, used for the ASS canvas
+    
+    subtitle_format
+      'ass' or 'vtt'
+    
+    mux
+      whether to also mux the subtitles into a copy of the video
+    
+    Returns
+    --------
+    
+    outputs
+      dict of the saved filepaths under 'json', 'subtitles' and 'video'
+    """
+    
+    outputs = {}
+    outputs['json'] = write_scene_json(scene_array, video_fps,
+                                       output_prefix + '_scenes.json',
+                                       video_file=video_file)
+    
+    if subtitle_format == 'vtt':
+        outputs['subtitles'] = write_webvtt(scene_array,
+                                            output_prefix + '_scenes.vtt')
+    else:
+        outputs['subtitles'] = write_ass(scene_array,
+                                         output_prefix + '_scenes.ass',
+                                         video_size=video_size)
+    
+    if mux:
+        video_ext = os.path.splitext(video_file)[1]
+        outputs['video'] = mux_subtitles(video_file, outputs['subtitles'],
+                                         output_prefix + '_annotated' +
+                                         video_ext,
+                                         scene_json=outputs['json'])
+    
+    return outputs
+
+
+if __name__ == '__main__':
+
+    from moviepy.editor import VideoFileClip
+    
+    # Specify video file and constants here
+    video_file = 'BTS_2017_DNA.mkv'
+    threshold = 21
+    min_scene_len = 15
+    
+    # Detect the scenes
+    video_fps, frames_read, _, scene_list = ds.analyze_video(
+        video_file, threshold=threshold, min_scene_len=min_scene_len)
+    scene_array = ds.scene_table(scene_list, video_fps, frames_read)
+    
+    # Only need the video size, not any frames
+    video_clip = VideoFileClip(video_file, audio=False)
+    video_size = video_clip.size
+    video_clip.reader.close()
+    
+    # Write the subtitles and scene table, and mux them into a copy
+    outputs = write_sidecar(video_file, video_fps, scene_array,
+                            os.path.splitext(video_file)[0],
+                            video_size=video_size)
+    
+    print(outputs)
@@ -0,0 +1,267 @@
+"""Representative thumbnails of every scene, grabbed with seeks.
+
+Getting at a frame through moviepy, or through a single pass like
+contact_sheet.collect_thumbnails, decodes every frame up to it. Here each
+thumbnail is its own short ffmpeg run that seeks to the frame first: ffmpeg
+jumps to the keyframe before it and only decodes from there to the frame, so
+a video is touched only around each scene's thumbnails. The runs are spread
+over a few threads, since most of their time is spent starting ffmpeg and
+waiting on the decoder.
+
+Each scene gets its midpoint frame, or the sharpest of a few candidates spread
+over its middle (sharpness is the variance of the Laplacian of the gray
+levels, which is low for blurry or motion blurred frames). The thumbnails are
+saved as a single sprite image, a grid with one tile per scene, plus a JSON
+index with the frame, time and position in the sprite of every scene.
+"""
+
+import json
+import numpy as np
+import matplotlib.pyplot as plt
+import concurrent.futures as cf
+import ffmpeg_utils as fu
+
+
+def grab_frame(video_file, frame_num, video_fps, size, pts_index=None):
+    """
+    Decodes a single frame by seeking to it.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the video
+    
+    frame_num
+      number of the frame
+    
+    video_fps
+      frames per second of the video
+    
+    size
+      (width, height) to scale the frame to
+    
+    pts_index
+      optional pts_index.PTSIndex of the video, to seek to the frame's actual
+      timestamp with variable frame rates
+    
+    Returns
+    --------
+    
+    frame
+      uint8 RGB numpy array, or None if the video ends before that frame
+    """
+    
+    # Half a frame early, so rounding can't skip past the frame
+    if pts_index is not None:
+        start_time = max(0.0, float(pts_index.boundary_time(frame_num)))
+    else:
+        start_time = max(0.0, (frame_num - 0.5) / float(video_fps))
+    
+    frames = fu.iter_frames(video_file, size=size, start_time=start_time)
+    try:
+        frame = next(frames, None)
+        return None if frame is None else frame.copy()
+    finally:
+        frames.close()
+
+
+def sharpness(frame):
+    """Variance of the Laplacian of a frame's gray levels."""
+    
+    gray = frame.mean(axis=2)
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] +
+                 gray[1:-1, 2:] - 4 * gray[1:-1, 1:-1])
+    
+    return float(laplacian.var())
+
+
+def candidate_frames(start, end, candidates=1):
+    """
+    Frames to consider as the thumbnail of a scene from start up to end: the
+    midpoint, or candidates frames spread over the middle of the scene
+    (staying clear of the transitions at either end).
+    """
+    
+    if candidates <= 1 or end - start <= 1:
+        return [(start + end) // 2]
+    
+    positions = np.linspace(0.2, 0.8, candidates)
+    
+    return sorted(set(int(start + position * (end - 1 - start))
+                      for position in positions))
+
+
+def scene_thumbnails(video_file, scene_list, video_fps, frames_read,
+                     height=90, candidates=1, workers=8, pts_index=None):
+    """
+    Grabs a representative thumbnail of every scene.
+    
+    Parameters
+    -----------
+    
+    video_file
+      filepath of the video
+    
+    scene_list
+      list of frames at which each scene starts, from analyze_video
+    
+    video_fps
+      frames per second of the video
+    
+    frames_read
+      total number of frames
+    
+    height
+      height of the thumbnails in pixels, the width keeps the aspect ratio
+    
+    candidates
+      number of frames to consider per scene, the sharpest one is kept. With
+      1 the midpoint of each scene is used.
+    
+    workers
+      number of ffmpeg runs at once
+    
+    pts_index
+      optional pts_index.PTSIndex of the video, for exact seeks and times
+      with variable frame rates
+    
+    Returns
+    --------
+    
+    scenes
+      list with a dict per scene of its 'scene' number, the 'frame' used,
+      its 'time' in seconds, its 'sharpness' and the 'thumbnail' itself
+      (None if the frame couldn't be decoded)
+    """
+    
+    info = fu.probe_video(video_file)
+    width = int(round(info['width'] * height / float(info['height']))) // 2 * 2
+    size = (width, height)
+    
+    def frame_time(frame):
+        if pts_index is not None:
+            return float(pts_index.frame_time(frame))
+        return frame / float(video_fps)
+    
+    ends = list(scene_list[1:]) + [frames_read]
+    scene_candidates = [candidate_frames(start, end, candidates)
+                        for start, end in zip(scene_list, ends)]
+    
+    # Every candidate frame is its own seek
+    wanted = sorted(set(frame for frames in scene_candidates
+                        for frame in frames))
+    with cf.ThreadPoolExecutor(workers) as executor:
+        grabbed = dict(zip(wanted, executor.map(
+            lambda frame: grab_frame(video_file, frame, video_fps, size,
+                                     pts_index),
+            wanted)))
+    
+    scenes = []
+    for scene_idx, frames in enumerate(scene_candidates, start=1):
+        best = {'scene': scene_idx, 'frame': frames[0],
+                'time': frame_time(frames[0]),
+                'sharpness': None, 'thumbnail': None}
+        
+        for frame in frames:
+            thumbnail = grabbed[frame]
+            if thumbnail is None:
+                continue
+            
+            # Only worth measuring when there is a choice
+            score = sharpness(thumbnail) if len(frames) > 1 else 0.0
+            if best['thumbnail'] is None or score > best['sharpness']:
+                best.update(frame=frame, time=frame_time(frame),
+                            sharpness=score, thumbnail=thumbnail)
+        
+        scenes.append(best)
+    
+    return scenes
+
+
+def save_sprite(scenes, output, columns=10, index_file=None, video_file=None):
+    """
+    Saves thumbnails from scene_thumbnails as one sprite image and its index.
+    
+    Parameters
+    -----------
+    
+    scenes
+      list returned by scene_thumbnails
+    
+    output
+      filepath of the sprite image, the format follows the extension (.jpg
+      keeps it compact)
+    
+    columns
+      number of thumbnails per row of the sprite
+    
+    index_file
+      filepath of the JSON index, output with a .json extension if None
+    
+    video_file
+      optional filepath of the video, recorded in the index
+    
+    Returns
+    --------
+    
+    index_file
+      filepath of the saved index
+    """
+    
+    if index_file is None:
+        index_file = output.rsplit('.', 1)[0] + '.json'
+    
+    thumb_h, thumb_w = next(scene['thumbnail'] for scene in scenes
+                            if scene['thumbnail'] is not None).shape[:2]
+    rows = -(-len(scenes) // columns)
+    
+    sprite = np.zeros((rows * thumb_h, columns * thumb_w, 3), dtype=np.uint8)
+    index = {'video': video_file,
+             'tile_width': thumb_w,
+             'tile_height': thumb_h,
+             'columns': columns,
+             'scenes': []}
+    
+    for tile_idx, scene in enumerate(scenes):
+        x = (tile_idx % columns) * thumb_w
+        y = (tile_idx // columns) * thumb_h
+        if scene['thumbnail'] is not None:
+            sprite[y:y + thumb_h, x:x + thumb_w] = scene['thumbnail']
+        
+        index['scenes'].append({'scene': scene['scene'],
+                                'frame': scene['frame'],
+                                'time': round(scene['time'], 3),
+                                'x': x, 'y': y})
+    
+    plt.imsave(output, sprite)
+    with open(index_file, 'w') as f:
+        json.dump(index, f, indent=1)
+    
+    return index_file
+
+
+if __name__ == '__main__':
+    
+    import time
+    import detect_scenes as ds
+    import pts_index as pi
+    
+    # Specify video file and constants here
+    video_file = 'BTS_2017_DNA.mkv'
+    threshold = 30
+    min_scene_len = 10
+    
+    # Detect the scenes
+    video_fps, frames_read, _, scene_list = ds.analyze_video(
+        video_file, threshold=threshold, min_scene_len=min_scene_len)
+    
+    # The sharpest of three frames from each scene
+    start = time.time()
+    scenes = scene_thumbnails(video_file, scene_list, video_fps, frames_read,
+                              candidates=3,
+                              pts_index=pi.try_load_index(video_file))
+    save_sprite(scenes, video_file + '_scenes.jpg', video_file=video_file)
+    
+    print('%d scene thumbnails in %0.1f sec' % (len(scenes),
+                                                time.time() - start))
@@ -3,31 +3,50 @@ import os
 import youtube_dl
 
 
-def download_video(url, output='video', quiet=True):
+def download_video(url, output='video', quiet=True, video_format=None):
     """
     Download a video from youtube with a given url and destination filepath.
     
     url and output must be utf-8 encoded.
     
     If quiet is true, stdout will be suppressed.
+    
+    video_format is a youtube-dl format selection, the best mp4 video plus the
+    best audio if None.
     """
     
+    with youtube_dl.YoutubeDL(ydl_options(output, quiet,
+                                          video_format)) as ydl:
+        
+        # Downloading returns the metadata too, no need to fetch it twice
+        result = ydl.extract_info(url, download=True)
+        outfile = output_filename(ydl, result)
+    
+    return outfile
+
+
+def ydl_options(output, quiet=True, video_format=None):
+    """Options for youtube-dl to download a video to output."""
+    
     ydl_opts = {}
     ydl_opts['outtmpl'] = output
     ydl_opts['quiet'] = quiet
     ydl_opts['merge_output_format'] = 'mkv'
-    ydl_opts['format'] = 'bestvideo[ext=mp4]+bestaudio'
+    ydl_opts['format'] = video_format or 'bestvideo[ext=mp4]+bestaudio'
     
-    with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-        ydl.download([url])
-        result = ydl.extract_info(url, download=False)
-        outfile = ydl.prepare_filename(result) + '.' + result['ext']
+    return ydl_opts
+
+
+def output_filename(ydl, result):
+    """Filepath youtube-dl saved a video to, given its metadata."""
     
-    return outfile
+    return ydl.prepare_filename(result) + '.' + result['ext']
 
 
 if __name__ == '__main__':
     
+    import download_manager as dm
+    
     # Read in csv file containing MV information
     # Formatted in five columns with a header row of column titles
     # | Artist | Song Title | Genre | Year | YouTube Link |
@@ -36,14 +55,13 @@ if __name__ == '__main__':
     # Specify folder to save MVs to
     video_folder = "/media/unraid/Datasets/QuantitativeEditing/To Analyze/"
     
-    for idx, row in video_list.iterrows():
-        
-        # Build output filename from MV data
-        cols = [0, 3, 1]
-        outfile = '_'.join(str(i) for i in row[cols].tolist())
-        
-        video_file = download_video(row[4],
-                                    output=os.path.join(video_folder, outfile),
-                                    quiet=False)
-        
-        print(video_file)
+    # Build output filenames from MV data
+    downloads = []
+    for row in video_list.itertuples(index=False):
+        outfile = '_'.join(str(i) for i in (row[0], row[3], row[1]))
+        downloads.append((row[4], os.path.join(video_folder, outfile)))
+    
+    # Download several videos at once, skipping ones we already have
+    manager = dm.DownloadManager(quiet=False)
+    for result in manager.download_all(downloads):
+        print(result['status'], result['video_file'] or result['url'])
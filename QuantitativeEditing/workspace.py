@@ -0,0 +1,107 @@
+"""Private scratch folders for the intermediate files of a run.
+
+Rendering an analysis writes a handful of intermediate files (the graph
+animations, the audio waveform, the scene table, ...). Each run keeps them in
+its own freshly created folder instead of the current directory, so any
+number of runs can go at the same time without overwriting each other's
+files.
+
+The folders are made in the system's temporary folder, or under the folder
+named by the QE_WORKSPACE_ROOT environment variable. Pointing that at a tmpfs
+mount such as /dev/shm keeps the intermediates in memory. Setting
+QE_KEEP_WORKSPACE=1 keeps every workspace around after its run for debugging.
+"""
+
+import os
+import shutil
+import tempfile
+
+
+WORKSPACE_ROOT_ENV = 'QE_WORKSPACE_ROOT'
+KEEP_WORKSPACE_ENV = 'QE_KEEP_WORKSPACE'
+
+
+def workspace_root():
+    """
+    Folder to make workspaces and other temporary folders in, None for the
+    system default.
+    """
+    
+    root = os.environ.get(WORKSPACE_ROOT_ENV)
+    if root and os.path.isdir(root):
+        return root
+    
+    return None
+
+
+class Workspace(object):
+    """
+    A scratch folder that is deleted when the run is done.
+    
+    Use it as a context manager:
+      
+      with Workspace('render') as workspace:
+          clip.write_videofile(workspace.path('animation1.mp4'))
+    
+    or call create and cleanup yourself.
+    """
+    
+    def __init__(self, name='run', root=None, keep=None):
+        """
+        Parameters
+        -----------
+        
+        name
+          added to the folder name, to tell workspaces apart when kept
+        
+        root
+          folder to make the workspace in, see workspace_root if None
+        
+        keep
+          if True, the workspace is not deleted by cleanup. Defaults to the
+          QE_KEEP_WORKSPACE environment variable.
+        """
+        
+        self.name = name
+        self.root = root if root is not None else workspace_root()
+        
+        if keep is None:
+            keep = os.environ.get(KEEP_WORKSPACE_ENV, '') not in ('', '0')
+        self.keep = keep
+        
+        self.dir = None
+    
+    def create(self):
+        """Makes the folder, returns the workspace for convenience."""
+        
+        if self.dir is None:
+            self.dir = tempfile.mkdtemp(prefix='qe_%s_' % self.name,
+                                        dir=self.root)
+        
+        return self
+    
+    def path(self, filename):
+        """Filepath of an intermediate file in the workspace."""
+        
+        return os.path.join(self.create().dir, filename)
+    
+    def cleanup(self):
+        """Deletes the folder and everything in it, unless keeping it."""
+        
+        if self.dir is None:
+            return
+        
+        if self.keep:
+            print('Keeping intermediate files in %s' % self.dir)
+        else:
+            shutil.rmtree(self.dir, ignore_errors=True)
+        
+        self.dir = None
+    
+    def __enter__(self):
+        
+        return self.create()
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        
+        self.cleanup()